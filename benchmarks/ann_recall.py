@@ -0,0 +1,98 @@
+"""
+Recall vs latency of the approximate IVF index against the exact search
+on synthetic 128-d face embeddings.
+
+Usage:
+    python -m benchmarks.ann_recall --size 100000 --queries 200 --nprobe 1 2 4 8 16 32 --output ann.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from search import EmbeddingIndex, EmbeddingMatrix, IVFIndex
+
+def synthetic_embeddings(n, dim=128, n_identities=None, noise=0.15, seed=0):
+    """
+    Clustered embeddings shaped like dlib descriptors: each identity is a random
+    direction with norm ~1 and each face is that identity plus per-image noise.
+    """
+    rng = np.random.default_rng(seed)
+    n_identities = n_identities or max(1, n // 5)
+    identities = rng.normal(size=(n_identities, dim)).astype(np.float32)
+    identities /= np.linalg.norm(identities, axis=1, keepdims=True)
+    labels = rng.integers(0, n_identities, size=n)
+    noise = rng.normal(scale=noise / np.sqrt(dim), size=(n, dim)).astype(np.float32)
+    return identities[labels] + noise, identities, labels
+
+def build(index):
+    start = time.perf_counter()
+    index.sync()
+    return time.perf_counter() - start
+
+def run(size, n_queries, nprobes, k=10, n_lists=None, seed=0):
+    data, identities, _ = synthetic_embeddings(size, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    queries = data[rng.choice(size, n_queries, replace=False)] + rng.normal(scale=0.05 / np.sqrt(data.shape[1]), size=(n_queries, data.shape[1])).astype(np.float32)
+
+    store = EmbeddingMatrix(data)
+    exact = EmbeddingIndex(store)
+    ivf = IVFIndex(store, n_lists=n_lists, train_size=size + 1)
+    results = {"size": size, "queries": n_queries, "k": k}
+    results["exact_build_seconds"] = build(exact)
+    results["ivf_build_seconds"] = build(ivf)
+    start = time.perf_counter()
+    ivf.rebuild()
+    results["ivf_train_seconds"] = time.perf_counter() - start
+    results["n_lists"] = len(ivf.centroids)
+
+    truth = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = exact.search(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        truth.append(set(rows.tolist()))
+    results["exact"] = summarize(latencies)
+
+    results["ivf"] = []
+    for nprobe in nprobes:
+        latencies = []
+        hits = 0
+        top1 = 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            rows, _ = ivf.search(query, k=k, nprobe=nprobe)
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected.intersection(rows.tolist()))
+            top1 += int(len(rows) > 0 and rows[0] in expected)
+        entry = {"nprobe": nprobe, f"recall@{k}": hits / (k * n_queries), "top1_in_truth": top1 / n_queries}
+        entry.update(summarize(latencies))
+        results["ivf"].append(entry)
+    return results
+
+def summarize(latencies):
+    latencies = np.array(latencies) * 1000
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99)), "mean_ms": float(latencies.mean())}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.size, args.queries, args.nprobe, k=args.k, n_lists=args.lists, seed=args.seed)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
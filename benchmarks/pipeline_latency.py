@@ -0,0 +1,330 @@
+"""
+Latency of the profile pipeline stages, of the gallery searches and of the API endpoints,
+on synthetic faces and galleries, written as JSON so runs can be compared across commits.
+Runs offline on CPU; the dlib model files must be at the configured paths.
+
+Synthetic faces are drawn from 68-point landmark sets, so the detectors and the distance code have ground
+truth landmarks. dlib rarely finds a face in them, so the analysis stages (detect_faces, analyze_face, analyze_faces
+and compute_embeddings) mostly time the detection passes unless real photos are given with --images. Endpoint uploads in which no face is detected
+are answered from result cache entries seeded with synthetic profiles, which times the search paths;
+use --images with FACE_API_CACHE_MAX_BYTES=0 to time the full pipeline behind every request.
+
+Usage:
+    python -m benchmarks.pipeline_latency --gallery 1000 100000 1000000 --concurrency 1 8 --output pipeline.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from models import Artifacts, Profile
+from storage import ProfileStore, ARTIFACT_FIELDS
+from search import create_index, DTWIndex, FEATURE_SLICES, closest_by_feature
+from utils import FaceAnalysis, detect_faces, analyze_face, analyze_faces, compute_embeddings, decode_image
+from detectors import (measure_lighting_inconsistency, measure_blur, measure_asymmetry, measure_skin_texture,
+                       measure_high_frequency_artifacts, measure_gaze_inconsistency, measure_face_artifacts)
+from pipeline import calculate_distance, profile_from_bytes
+from metrics import traced
+from config import settings
+from .ann_recall import synthetic_embeddings, summarize
+
+def synthetic_landmarks(n, size=512, jitter=0.015, seed=0):
+    """
+    n (68 x 2) landmark sets in the dlib layout for faces centered in a size x size image,
+    each a template face randomly scaled, shifted and with per-point jitter.
+    """
+    rng = np.random.default_rng(seed)
+    cx, cy, a, b = 0.5, 0.5, 0.3, 0.38
+    points = []
+    # jaw, from the image left temple under the chin to the right temple
+    t = np.linspace(np.pi, 0, 17)
+    points += list(zip(cx + a * np.cos(t), cy + b * np.sin(t)))
+    # eyebrows
+    for side in (-1, 1):
+        xs = np.linspace(0.7, 0.15, 5) if side < 0 else np.linspace(0.15, 0.7, 5)
+        points += [(cx + side * x * a, cy - 0.55 * b - 0.06 * np.sin(np.pi * (x - 0.15) / 0.55)) for x in xs]
+    # nose bridge and base
+    points += [(cx, cy - 0.45 * b + i * 0.13 * b) for i in range(4)]
+    points += [(cx + x * a, cy + 0.05 * b + 0.03 * (1 - abs(x) / 0.18)) for x in np.linspace(-0.18, 0.18, 5)]
+    # eyes: outer/inner corner, two upper points, the other corner, two lower points
+    t = np.array([np.pi, 2 * np.pi / 3, np.pi / 3, 0, -np.pi / 3, -2 * np.pi / 3])
+    for side in (-1, 1):
+        points += list(zip(cx + side * 0.38 * a + 0.16 * a * np.cos(t), cy - 0.35 * b - 0.06 * b * np.sin(t)))
+    # outer and inner lips
+    t = np.pi - np.arange(12) * 2 * np.pi / 12
+    points += list(zip(cx + 0.4 * a * np.cos(t), cy + 0.5 * b - 0.12 * b * np.sin(t)))
+    t = np.pi - np.arange(8) * 2 * np.pi / 8
+    points += list(zip(cx + 0.3 * a * np.cos(t), cy + 0.5 * b - 0.05 * b * np.sin(t)))
+    template = np.array(points)
+
+    scale = rng.uniform(0.85, 1.1, size=(n, 1, 1))
+    shift = rng.normal(scale=0.03, size=(n, 1, 2))
+    faces = (template - 0.5) * scale + 0.5 + shift + rng.normal(scale=jitter, size=(n, 68, 2))
+    return np.round(faces * size).astype(np.int16)
+
+def synthetic_face(landmarks, size=512, seed=0):
+    # BGR image of a face drawn along its landmarks, with some texture so the detectors have work to do
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(60, 160, size, dtype=np.float32)
+    image = np.dstack([gradient[None, :].repeat(size, 0) * f for f in rng.uniform(0.6, 1.0, 3)])
+    pts = landmarks.astype(np.int32)
+    skin = tuple(float(v) for v in rng.uniform([120, 150, 190], [160, 190, 235]))
+    jaw = pts[0:17]
+    center = jaw.mean(axis=0)
+    forehead = np.array([center[0], pts[19:25, 1].min() - 0.4 * (jaw[8, 1] - pts[19:25, 1].min())])
+    axes = (int((jaw[16, 0] - jaw[0, 0]) / 2), int((jaw[8, 1] - forehead[1]) / 2))
+    cv2.ellipse(image, (int(center[0]), int((jaw[8, 1] + forehead[1]) / 2)), axes, 0, 0, 360, skin, -1)
+    for brow in (pts[17:22], pts[22:27]):
+        cv2.polylines(image, [brow], False, (40, 50, 70), 4)
+    for eye in (pts[36:42], pts[42:48]):
+        cv2.fillPoly(image, [eye], (235, 235, 235))
+        iris = eye.mean(axis=0).astype(int)
+        cv2.circle(image, tuple(int(v) for v in iris), max(2, int(np.ptp(eye[:, 1]) / 2)), tuple(float(v) for v in rng.uniform(20, 140, 3)), -1)
+    cv2.polylines(image, [pts[27:31]], False, (90, 110, 150), 2)
+    cv2.polylines(image, [pts[31:36]], False, (90, 110, 150), 2)
+    cv2.fillPoly(image, [pts[48:60]], (90, 90, 180))
+    cv2.polylines(image, [pts[60:68]], True, (60, 60, 120), 2)
+    image = cv2.GaussianBlur(image, (5, 5), 1.5) + rng.normal(scale=6, size=image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def synthetic_profiles(n, seed=0):
+    # unvalidated profiles with clustered embeddings, template landmarks and random artifacts, for filling galleries
+    embeddings, _, _ = synthetic_embeddings(n, seed=seed)
+    landmarks = synthetic_landmarks(n, seed=seed + 1)
+    artifacts = np.random.default_rng(seed + 2).random((n, len(ARTIFACT_FIELDS)))
+    for embedding, face, values in zip(embeddings, landmarks, artifacts):
+        yield Profile.construct(description="Synthetic face.", embedding=embedding, landmarks=face,
+                                artifacts=Artifacts.construct(**dict(zip(ARTIFACT_FIELDS, values.tolist()))))
+
+def load_images(directory, size, n, seed):
+    """
+    Images to run the pipeline on, with the landmarks to give the detectors: photos from directory with the
+    landmarks dlib finds (photos without a face are skipped), or n synthetic faces with their own landmarks.
+    """
+    if directory:
+        images = []
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), "rb") as f:
+                data = f.read()
+            try:
+                image = decode_image(data)
+            except ValueError:
+                continue
+            analysis = analyze_face(image)
+            if analysis is not None:
+                images.append((data, image, analysis.landmarks))
+        return images[:n] if n else images
+    images = []
+    for i, landmarks in enumerate(synthetic_landmarks(n, size=size, seed=seed)):
+        image = synthetic_face(landmarks, size=size, seed=seed + i)
+        _, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        images.append((encoded.tobytes(), image, landmarks.astype(np.int64)))
+    return images
+
+def time_calls(fn, inputs, repeats):
+    # latency of fn(*args) for every args in inputs, repeats times over
+    latencies = []
+    for _ in range(repeats):
+        for args in inputs:
+            start = time.perf_counter()
+            fn(*args)
+            latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+def run_stages(images, repeats):
+    # the analysis the endpoints run: one detection pass, then landmarks for the first face (analyze_face, behind /create-profile)
+    # or every face (analyze_faces, behind the multi-face endpoints), then their descriptors in one batched call
+    with_image = [(image,) for _, image, _ in images]
+    results = {
+        "detect_faces": time_calls(detect_faces, [(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY),) for _, image, _ in images], repeats),
+        "analyze_face": time_calls(analyze_face, with_image, repeats),
+        "analyze_faces": time_calls(analyze_faces, with_image, repeats),
+    }
+    analyses = [analyze_faces(image) for _, image, _ in images]
+    results["analyze_faces"]["faces_found"] = sum(len(faces) for faces in analyses) / len(images)
+    # fresh analyses of the same faces every call, since an analysis keeps the descriptors it computed
+    results["compute_embeddings"] = time_calls(lambda faces: compute_embeddings([FaceAnalysis(face.image, face.gray, face.rect, face.shape, face.detection) for face in faces]),
+                                               [(faces,) for faces in analyses if faces], repeats) if any(analyses) else None
+
+    with_landmarks = [(image, landmarks) for _, image, landmarks in images]
+    detectors = {
+        "measure_lighting_inconsistency": (measure_lighting_inconsistency, with_image),
+        "measure_blur": (measure_blur, with_image),
+        "measure_asymmetry": (measure_asymmetry, with_landmarks),
+        "measure_skin_texture": (measure_skin_texture, with_image),
+        "measure_high_frequency_artifacts": (measure_high_frequency_artifacts, with_image),
+        "measure_gaze_inconsistency": (measure_gaze_inconsistency, [(landmarks,) for _, _, landmarks in images]),
+        # what the pipeline runs: all six scores in one pass over the face region
+        "measure_face_artifacts": (lambda image, landmarks: measure_face_artifacts(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), landmarks,
+                                   margin=settings.artifact_margin, size=settings.artifact_size), with_landmarks),
+    }
+    results["detectors"] = {name: time_calls(fn, inputs, repeats) for name, (fn, inputs) in detectors.items()}
+
+    # stage breakdown of the worker function behind /create-profile, as reported by the metrics
+    stages = defaultdict(list)
+    for _ in range(repeats):
+        for data, _, _ in images:
+            start = time.perf_counter()
+            _, trace = traced(profile_from_bytes, data)
+            stages["total"].append(time.perf_counter() - start)
+            for name, seconds in trace:
+                stages[name].append(seconds)
+    results["profile_from_bytes"] = {name: summarize(latencies) for name, latencies in stages.items()}
+
+    profiles = list(synthetic_profiles(max(2, len(images)), seed=1))
+    pairs = [(profiles[i], profiles[(i + 1) % len(profiles)]) for i in range(len(profiles))]
+    results["calculate_distance"] = time_calls(calculate_distance, pairs, repeats)
+    return results
+
+def build_gallery(size, seed=0):
+    store = ProfileStore(capacity=size)
+    for profile in synthetic_profiles(size, seed=seed):
+        store.add(profile)
+    return store
+
+def run_gallery(size, n_queries, seed=0):
+    start = time.perf_counter()
+    store = build_gallery(size, seed=seed)
+    results = {"size": size, "build_seconds": time.perf_counter() - start}
+    index = create_index(settings.index, store, n_lists=settings.ivf_lists or None, nprobe=settings.ivf_nprobe, train_size=settings.ivf_train_size,
+                         recall_target=settings.quantize_recall, subvectors=settings.pq_subvectors)
+    dtw_index = DTWIndex(store, band=settings.dtw_band if settings.dtw_band >= 0 else None)
+    start = time.perf_counter()
+    index.sync()
+    dtw_index.sync()
+    results["index_seconds"] = time.perf_counter() - start
+
+    queries = list(synthetic_profiles(n_queries, seed=seed + 100))
+    results["find_profile"] = time_calls(lambda profile: index.search(np.asarray(profile.embedding), k=1), [(q,) for q in queries], 1)
+    results["find_profiles_k10"] = time_calls(lambda profile: index.search(np.asarray(profile.embedding), k=10), [(q,) for q in queries], 1)
+    # the search behind /find-closest-profile, live rows included as the endpoint looks them up per request
+    results["find_closest_profile"] = {
+        feature: time_calls(lambda profile: closest_by_feature(store, dtw_index, profile.landmarks, feature, store.live_rows()), [(q,) for q in queries], 1)
+        for feature in FEATURE_SLICES
+    }
+    return results
+
+def endpoint_requests(uploads):
+    # (name, path, query params, files) of every benchmarked request, cycling through the uploads
+    def file(i):
+        return {"file": ("face.jpg", uploads[i % len(uploads)], "image/jpeg")}
+    return {
+        "/find-profile": lambda i: ("/find-profile", None, file(i)),
+        "/find-profiles?k=10": lambda i: ("/find-profiles", {"k": 10}, file(i)),
+        "/find-closest-profile?feature=jaw": lambda i: ("/find-closest-profile", {"feature": "jaw"}, file(i)),
+        "/find-closest-profile?feature=mouth": lambda i: ("/find-closest-profile", {"feature": "mouth"}, file(i)),
+        "/find-profiles-weighted": lambda i: ("/find-profiles-weighted", {"embedding": 1, "jaw": 0.5, "k": 10}, file(i)),
+        "/compare-profiles": lambda i: ("/compare-profiles", None, {"file1": file(i)["file"], "file2": file(i + 1)["file"]}),
+        "/measure-artifacts": lambda i: ("/measure-artifacts", None, file(i)),
+    }
+
+def run_endpoints(images, gallery_size, n_requests, concurrencies, seed=0):
+    """
+    p50/p99 latency and throughput of the endpoints through the in-process test client, with the gallery of
+    the app filled with gallery_size synthetic profiles. Requests are issued by concurrency client threads.
+    """
+    from fastapi.testclient import TestClient
+    from cache import content_key
+    import main
+
+    for profile in synthetic_profiles(gallery_size, seed=seed):
+        main.profile_store.add(profile)
+    uploads = [data for data, _, _ in images]
+    seeded = 0
+    if main.result_cache.enabled:
+        for data, profile in zip(uploads, synthetic_profiles(len(uploads), seed=seed + 200)):
+            if profile_from_bytes(data) is None:
+                profile = Profile(description=profile.description, embedding=profile.embedding.tolist(), landmarks=profile.landmarks.tolist(), artifacts=profile.artifacts)
+                main.result_cache.put(content_key(data), profile.json(exclude={"id"}).encode())
+                seeded += 1
+
+    results = {"gallery_size": gallery_size, "uploads": len(uploads), "seeded_uploads": seeded, "executor": settings.executor, "endpoints": {}}
+    with TestClient(main.app) as client:
+        warm_up = getattr(main.app.state, "warm_up", None)
+        if warm_up is not None:
+            # wait for the workers to load their models before timing anything
+            async def loaded():
+                await warm_up
+            client.portal.call(loaded)
+        for name, request in endpoint_requests(uploads).items():
+            def call(i):
+                path, params, files = request(i)
+                start = time.perf_counter()
+                response = client.post(path, params=params, files=files)
+                return time.perf_counter() - start, response.status_code
+
+            call(0)
+            runs = []
+            for concurrency in concurrencies:
+                start = time.perf_counter()
+                with ThreadPoolExecutor(concurrency) as pool:
+                    outcomes = list(pool.map(call, range(n_requests)))
+                elapsed = time.perf_counter() - start
+                statuses = defaultdict(int)
+                for _, status in outcomes:
+                    statuses[str(status)] += 1
+                entry = {"concurrency": concurrency, "requests": n_requests, "throughput_rps": n_requests / elapsed, "status": dict(statuses)}
+                entry.update(summarize([latency for latency, _ in outcomes]))
+                runs.append(entry)
+            results["endpoints"][name] = runs
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {name: getattr(settings, name) for name in ("executor", "executor_workers", "index", "ivf_nprobe", "dtw_band",
+                                                                 "detection_mode", "detection_max_size", "artifact_size", "cache_max_bytes")},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=None, help="directory of face photos to use instead of synthetic faces")
+    parser.add_argument("--faces", type=int, default=8, help="number of synthetic faces, or maximum number of photos")
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--repeats", type=int, default=5, help="times every stage runs on every image")
+    parser.add_argument("--gallery", type=int, nargs="+", default=[1000, 10000, 100000], help="gallery sizes of the search benchmarks")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--endpoint-gallery", type=int, default=10000, help="profiles stored while the endpoints are benchmarked")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint and concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--only", nargs="+", choices=["stages", "galleries", "endpoints"], default=["stages", "galleries", "endpoints"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.image_size, args.faces, args.seed)
+    if not images:
+        parser.error("no image with a detectable face")
+    results = {"environment": environment(), "images": {"source": args.images or "synthetic", "count": len(images)}}
+    if "stages" in args.only:
+        results["stages"] = run_stages(images, args.repeats)
+    if "galleries" in args.only:
+        results["galleries"] = [run_gallery(size, args.queries, seed=args.seed) for size in args.gallery]
+    if "endpoints" in args.only:
+        results["endpoints"] = run_endpoints(images, args.endpoint_gallery, args.requests, args.concurrency, seed=args.seed)
+    text = json.dumps(results, indent=2, default=float)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
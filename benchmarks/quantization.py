@@ -0,0 +1,74 @@
+"""
+Accuracy, latency and memory of the compressed embedding indexes ("int8" and "pq" with several code sizes)
+against the exact search on synthetic 128-d face embeddings.
+
+Usage:
+    python -m benchmarks.quantization --size 1000000 --queries 200 --subvectors 8 16 32 --recall 0.98 --output quantization.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from search import EmbeddingIndex, EmbeddingMatrix, QuantizedIndex
+from .ann_recall import synthetic_embeddings, build, summarize
+
+def run(size, n_queries, subvectors, recall_target, k=10, seed=0):
+    data, _, _ = synthetic_embeddings(size, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    queries = data[rng.choice(size, n_queries, replace=False)] + rng.normal(scale=0.05 / np.sqrt(data.shape[1]), size=(n_queries, data.shape[1])).astype(np.float32)
+
+    store = EmbeddingMatrix(data)
+    exact = EmbeddingIndex(store)
+    results = {"size": size, "queries": n_queries, "k": k, "float32_bytes": 4 * data.shape[1], "python_list_bytes": 8 * data.shape[1] + 32 * data.shape[1] + 56}
+    results["exact_build_seconds"] = build(exact)
+    truth = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = exact.search(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        truth.append(rows)
+    results["exact"] = summarize(latencies)
+
+    results["quantized"] = []
+    for kind, m in [("int8", None)] + [("pq", m) for m in subvectors]:
+        index = QuantizedIndex(store, kind=kind, train_size=min(size, 100000), recall_target=recall_target, subvectors=m or 16)
+        entry = {"kind": kind, "subvectors": m, "build_seconds": build(index)}
+        latencies = []
+        hits = top1 = 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            rows, _ = index.search(query, k=k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(expected.tolist()).intersection(rows.tolist()))
+            top1 += int(len(rows) > 0 and rows[0] == expected[0])
+        entry.update({f"recall@{k}": hits / (k * n_queries), "recall@1": top1 / n_queries, "code_bytes": index.quantizer.bytes_per_vector})
+        entry["compression_vs_float32"] = results["float32_bytes"] / entry["code_bytes"]
+        entry["compression_vs_python_list"] = results["python_list_bytes"] / entry["code_bytes"]
+        entry["calibration"] = index.report
+        entry.update(summarize(latencies))
+        results["quantized"].append(entry)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--subvectors", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--recall", type=float, default=0.98, help="recall target the shortlist is calibrated for")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.size, args.queries, args.subvectors, args.recall, k=args.k, seed=args.seed)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
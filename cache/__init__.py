@@ -0,0 +1,7 @@
+from .result_cache import ResultCache, content_key, settings_key
+
+__all__ = [
+    'ResultCache',
+    'content_key',
+    'settings_key'
+]
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+def content_key(data):
+    # identical uploads share an entry whatever their filename or content type
+    return hashlib.sha256(data).hexdigest()
+
+def settings_key(values):
+    # short hash of the settings a result depends on, so results computed under other settings are not served
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()[:16]
+
+class ResultCache:
+    """
+    Two-tier cache of encoded pipeline results, keyed by content hash.
+    The memory tier is an LRU bounded by the total size of its values. The optional disk tier
+    keeps one file per entry under directory, written atomically, so every worker process
+    sharing the directory benefits from results computed by the others.
+    The namespace, e.g. the pipeline version and a settings_key, is part of every key: it names the
+    subdirectory of the disk tier. The disk tier is bounded by max_disk_bytes over the whole directory:
+    once about a tenth of that has been written by this process, a background pass removes expired files
+    and then the oldest ones, other namespaces included, until the directory is under 90% of the bound.
+    Entries older than ttl seconds are treated as missing in both tiers; ttl 0 never expires.
+    Values are bytes; decoding them into fresh objects on every hit keeps callers from
+    mutating a shared result. The memory tier is guarded by a lock, so the cache can be used from threads
+    that do the disk I/O off the event loop; files are read and written outside of it.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=0, directory=None, namespace="v1", max_disk_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.root = directory
+        self.directory = os.path.join(directory, namespace) if directory else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._written = 0
+        self._pruning = None
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 or self.directory is not None
+
+    def get(self, key):
+        """
+        Look up an entry, returns its value or None on a miss.
+        Disk hits are promoted to the memory tier.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._evict(key)
+        if self.directory:
+            value, created = self._read(key, now)
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value, created)
+                    self.disk_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value, time.time())
+        if self.directory:
+            self._write(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _expired(self, created, now):
+        return self.ttl > 0 and now - created > self.ttl
+
+    def _remember(self, key, value, created):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (created, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _read(self, key, now):
+        path = self._path(key)
+        try:
+            created = os.stat(path).st_mtime
+            if self._expired(created, now):
+                os.remove(path)
+                return None, None
+            with open(path, "rb") as f:
+                return f.read(), created
+        except FileNotFoundError:
+            return None, None
+
+    def _write(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # readers in other processes either see the whole file or none of it
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(value)
+        os.replace(tmp, path)
+        with self._lock:
+            self._written += len(value)
+            if self.max_disk_bytes and self._written > self.max_disk_bytes // 10 and (self._pruning is None or not self._pruning.is_alive()):
+                self._written = 0
+                self._pruning = threading.Thread(target=self.prune, daemon=True)
+                self._pruning.start()
+
+    def prune(self):
+        """
+        Remove expired files of the disk tier, then the oldest files until it is under 90% of max_disk_bytes.
+        Other processes may prune or write at the same time, so files vanishing under the scan are skipped.
+        """
+        now = time.time()
+        files = []
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if self._expired(info.st_mtime, now):
+                    self._remove(path)
+                else:
+                    files.append((info.st_mtime, info.st_size, path))
+        total = sum(size for _, size, _ in files)
+        files.sort()
+        for _, size, path in files:
+            if total <= 0.9 * self.max_disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
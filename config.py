@@ -0,0 +1,109 @@
+import os
+from dataclasses import dataclass, field
+
+PREFIX = "FACE_API_"
+
+def env(name, default, cast=str):
+    # settings are read from FACE_API_<NAME> environment variables
+    value = os.environ.get(PREFIX + name)
+    if value is None:
+        return default
+    if cast is bool:
+        return value.lower() in ("1", "true", "yes", "on")
+    return cast(value)
+
+@dataclass
+class Settings:
+    """
+    Runtime configuration of the API, read once at startup from the environment.
+    """
+    # "exact" for brute force search, "ivf" for the approximate inverted file index,
+    # "int8" or "pq" to scan compressed embeddings and re-rank a shortlist with the exact ones
+    index: str = field(default_factory=lambda: env("INDEX", "exact"))
+    ivf_lists: int = field(default_factory=lambda: env("IVF_LISTS", 0, int))
+    ivf_nprobe: int = field(default_factory=lambda: env("IVF_NPROBE", 8, int))
+    ivf_train_size: int = field(default_factory=lambda: env("IVF_TRAIN_SIZE", 10000, int))
+    # recall of the re-ranked top 1 and top 10 the compressed indexes calibrate their shortlist for
+    quantize_recall: float = field(default_factory=lambda: env("QUANTIZE_RECALL", 0.98, float))
+    # bytes per embedding of the "pq" index, must divide 128
+    pq_subvectors: int = field(default_factory=lambda: env("PQ_SUBVECTORS", 16, int))
+    # where the image pipeline runs: "process", "thread" or "inline"
+    executor: str = field(default_factory=lambda: env("EXECUTOR", "process"))
+    executor_workers: int = field(default_factory=lambda: env("EXECUTOR_WORKERS", 0, int))
+    # pipeline calls allowed to run or wait at once before answering 429, 0 for 4 per worker
+    executor_max_pending: int = field(default_factory=lambda: env("EXECUTOR_MAX_PENDING", 0, int))
+    # images processed in parallel per chunk by the batch endpoints, 0 for one per executor worker
+    batch_chunk_size: int = field(default_factory=lambda: env("BATCH_CHUNK_SIZE", 0, int))
+    # archive uploads larger than this many bytes are spooled to a temporary file instead of memory
+    batch_spool_size: int = field(default_factory=lambda: env("BATCH_SPOOL_SIZE", 16 * 1024 * 1024, int))
+    # directory of the persistent profile store, profiles are kept in memory only when unset
+    store_dir: str = field(default_factory=lambda: env("STORE_DIR", ""))
+    # fsync every write to the persistent store, slower but survives power loss
+    store_fsync: bool = field(default_factory=lambda: env("STORE_FSYNC", False, bool))
+    # compact the store once this fraction of its rows are deleted, and at least compact_min_dead of them
+    compact_ratio: float = field(default_factory=lambda: env("COMPACT_RATIO", 0.25, float))
+    compact_min_dead: int = field(default_factory=lambda: env("COMPACT_MIN_DEAD", 1024, int))
+    # in-memory result cache for repeated uploads, in bytes of cached results, 0 to disable
+    cache_max_bytes: int = field(default_factory=lambda: env("CACHE_MAX_BYTES", 64 * 1024 * 1024, int))
+    # seconds a cached result stays valid, 0 to keep results until they are evicted
+    cache_ttl: float = field(default_factory=lambda: env("CACHE_TTL", 3600, float))
+    # directory of the on-disk result cache shared by worker processes, disabled when unset
+    cache_dir: str = field(default_factory=lambda: env("CACHE_DIR", ""))
+    # bound of the on-disk result cache in bytes, older entries are removed past it, 0 for no bound
+    cache_max_disk_bytes: int = field(default_factory=lambda: env("CACHE_MAX_DISK_BYTES", 1024 * 1024 * 1024, int))
+    # artifacts are measured on the face region grown by this fraction of the face size, resized to artifact_size pixels
+    artifact_margin: float = field(default_factory=lambda: env("ARTIFACT_MARGIN", 0.25, float))
+    artifact_size: int = field(default_factory=lambda: env("ARTIFACT_SIZE", 256, int))
+    # Sakoe-Chiba band of the DTW used for eyebrows and jaw, in points, -1 for no band
+    dtw_band: int = field(default_factory=lambda: env("DTW_BAND", 3, int))
+    # "cascade" detects faces on a copy downscaled to detection_max_size pixels and upsamples only when nothing is found
+    # (multi-face endpoints always upsample the copy), "full" detects on the whole image upsampled once
+    detection_mode: str = field(default_factory=lambda: env("DETECTION_MODE", "cascade"))
+    detection_max_size: int = field(default_factory=lambda: env("DETECTION_MAX_SIZE", 1024, int))
+    # uploads with more pixels than this are refused before decoding, 0 for no limit
+    decode_max_pixels: int = field(default_factory=lambda: env("DECODE_MAX_PIXELS", 100_000_000, int))
+    # decode large JPEGs at 1/2, 1/4 or 1/8 size as long as their longer edge stays at least this long, 0 for full resolution
+    decode_max_size: int = field(default_factory=lambda: env("DECODE_MAX_SIZE", 0, int))
+    # dlib model files, loaded once per process on first use
+    predictor_path: str = field(default_factory=lambda: env("PREDICTOR_PATH", "shape_predictor_68_face_landmarks.dat"))
+    face_recognition_model_path: str = field(default_factory=lambda: env("FACE_RECOGNITION_MODEL_PATH", "dlib_face_recognition_resnet_model_v1.dat"))
+    # load the models in every pipeline worker in the background at startup instead of on the first request
+    warm_up: bool = field(default_factory=lambda: env("WARM_UP", True, bool))
+    # add a Server-Timing header with the pipeline stage latencies to every response
+    server_timing: bool = field(default_factory=lambda: env("SERVER_TIMING", False, bool))
+    # videos: full face detection every video_keyframe_interval processed frames, faces are tracked in between
+    video_keyframe_interval: int = field(default_factory=lambda: env("VIDEO_KEYFRAME_INTERVAL", 15, int))
+    # process every video_frame_stride-th frame of a video, and at most video_max_frames of them, 0 for no limit
+    video_frame_stride: int = field(default_factory=lambda: env("VIDEO_FRAME_STRIDE", 1, int))
+    video_max_frames: int = field(default_factory=lambda: env("VIDEO_MAX_FRAMES", 3000, int))
+    # a tracked face gets a new descriptor when its yaw or pitch (relative to the eye distance) moved by more than
+    # video_pose_delta, or its sharpness grew by the factor video_quality_gain, since its last descriptor
+    video_pose_delta: float = field(default_factory=lambda: env("VIDEO_POSE_DELTA", 0.15, float))
+    video_quality_gain: float = field(default_factory=lambda: env("VIDEO_QUALITY_GAIN", 1.5, float))
+    # comma-separated base URLs of the shard servers, in shard index order; when set this server is a coordinator
+    # that stores profiles on the shards and fans searches out to them
+    shard_urls: str = field(default_factory=lambda: env("SHARD_URLS", ""))
+    # seconds a coordinator waits for each shard before answering with the others' results
+    shard_timeout: float = field(default_factory=lambda: env("SHARD_TIMEOUT", 2.0, float))
+    # connections the coordinator keeps open to each shard
+    shard_connections: int = field(default_factory=lambda: env("SHARD_CONNECTIONS", 32, int))
+    # on a shard server, its position in the coordinator's shard_urls and their number: it only allocates ids with id % shard_count == shard_index
+    shard_index: int = field(default_factory=lambda: env("SHARD_INDEX", 0, int))
+    shard_count: int = field(default_factory=lambda: env("SHARD_COUNT", 1, int))
+    # directory of the background job queue (jobs.sqlite3) and of the uploads waiting in it, shared by every worker process;
+    # background jobs are disabled without one
+    job_dir: str = field(default_factory=lambda: env("JOB_DIR", ""))
+    # jobs each server process runs at once; their images go through the pipeline executor like requests
+    job_workers: int = field(default_factory=lambda: env("JOB_WORKERS", 1, int))
+    # runs of a job that fails as a whole before it is marked failed
+    job_attempts: int = field(default_factory=lambda: env("JOB_ATTEMPTS", 3, int))
+    # seconds without progress after which the job of a stopped process is taken over by another one
+    job_lease: float = field(default_factory=lambda: env("JOB_LEASE", 60, float))
+    # identity clusters link profiles closer than cluster_threshold (the compare_faces threshold) and group the links
+    # by "whispers" (Chinese whispers) or into connected "components"
+    cluster_method: str = field(default_factory=lambda: env("CLUSTER_METHOD", "whispers"))
+    cluster_threshold: float = field(default_factory=lambda: env("CLUSTER_THRESHOLD", 0.6, float))
+    # relative accuracy of the streaming artifact quantiles that uploads get their percentiles from
+    population_accuracy: float = field(default_factory=lambda: env("POPULATION_ACCURACY", 0.01, float))
+
+settings = Settings()
@@ -4,6 +4,7 @@ from .asymmetry import measure_asymmetry
 from .texture import measure_skin_texture
 from .frequency import measure_high_frequency_artifacts
 from .gaze import measure_gaze_inconsistency
+from .fused import face_region, measure_face_artifacts
 
 __all__ = [
     'measure_lighting_inconsistency',
@@ -11,5 +12,7 @@ __all__ = [
     'measure_asymmetry',
     'measure_skin_texture',
     'measure_high_frequency_artifacts',
-    'measure_gaze_inconsistency'
+    'measure_gaze_inconsistency',
+    'face_region',
+    'measure_face_artifacts'
 ]
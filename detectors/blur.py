@@ -1,6 +1,7 @@
 import cv2
+from .common import to_gray
 
 def measure_blur(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = to_gray(image)
     laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
     return laplacian_var
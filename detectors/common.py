@@ -0,0 +1,7 @@
+import cv2
+
+def to_gray(image):
+    # Detectors accept either a BGR image or an already converted grayscale plane
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -1,8 +1,8 @@
-import cv2
 import numpy as np
+from .common import to_gray
 
 def measure_high_frequency_artifacts(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = to_gray(image)
     f = np.fft.fft2(gray)
     fshift = np.fft.fftshift(f)
     magnitude_spectrum = 20 * np.log(np.abs(fshift))
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+
+from .common import to_gray
+from .asymmetry import measure_asymmetry
+from .gaze import measure_gaze_inconsistency
+
+def face_region(image, landmarks, margin=0.25, size=256):
+    """
+    Square region around the landmarks, grown by margin times the face size on every side,
+    clipped to the image and resized so its longer side is size pixels.
+    Scores measured on it do not depend on the photo resolution or on the background.
+    """
+    gray = to_gray(image)
+    left, top = landmarks.min(axis=0)
+    right, bottom = landmarks.max(axis=0)
+    center_x, center_y = (left + right) / 2, (top + bottom) / 2
+    half = max(right - left, bottom - top, 1) * (0.5 + margin)
+    x0, y0 = max(0, int(center_x - half)), max(0, int(center_y - half))
+    x1, y1 = min(gray.shape[1], int(np.ceil(center_x + half))), min(gray.shape[0], int(np.ceil(center_y + half)))
+    face = gray[y0:y1, x0:x1]
+    if min(face.shape) < 3:
+        face = gray
+    scale = size / max(face.shape)
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    width, height = max(3, round(face.shape[1] * scale)), max(3, round(face.shape[0] * scale))
+    return cv2.resize(face, (width, height), interpolation=interpolation)
+
+def measure_face_artifacts(image, landmarks, margin=0.25, size=256):
+    """
+    All six artifact scores of one face, from one canonical crop of the face and shared intermediates.
+    Lighting, blur, texture and high frequency scores are measured on the face region rather than the
+    whole image, so they are comparable between photos of different sizes.
+    """
+    face = face_region(image, landmarks, margin, size)
+    pixels = face.astype(np.float32)
+
+    # one gradient pass: its magnitude measures lighting and its divergence (a Laplacian) measures blur
+    gradient_x = cv2.Sobel(pixels, cv2.CV_32F, 1, 0, ksize=3)
+    gradient_y = cv2.Sobel(pixels, cv2.CV_32F, 0, 1, ksize=3)
+    lighting = np.mean(np.sqrt(gradient_x**2 + gradient_y**2))
+    laplacian = (gradient_x[1:-1, 2:] - gradient_x[1:-1, :-2] + gradient_y[2:, 1:-1] - gradient_y[:-2, 1:-1]) / 2
+    blur = np.var(laplacian)
+
+    # the spectrum of a real image is symmetric, the real FFT only computes its non-redundant half
+    magnitude_spectrum = 20 * np.log(np.abs(np.fft.rfft2(pixels)) + 1e-12)
+    high_freq = np.mean(magnitude_spectrum)
+
+    from skimage.feature import local_binary_pattern
+    lbp = local_binary_pattern(face, P=8, R=1, method='uniform').astype(np.int64)
+    counts = np.bincount(lbp.ravel(), minlength=10)
+    # same bins as np.histogram(lbp, bins=np.arange(0, 10)), whose last bin also holds 9
+    hist = np.append(counts[:8], counts[8:].sum()).astype("float")
+    hist /= (hist.sum() + 1e-6)
+    texture = np.mean(hist)
+
+    return dict(
+        lighting_inconsistency=float(lighting),
+        blur_measure=float(blur),
+        asymmetry_score=float(measure_asymmetry(image, landmarks)),
+        texture_score=float(texture),
+        high_freq_artifacts=float(high_freq),
+        gaze_direction=float(measure_gaze_inconsistency(landmarks))
+    )
@@ -1,8 +1,9 @@
 import cv2
 import numpy as np
+from .common import to_gray
 
 def measure_lighting_inconsistency(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = to_gray(image)
     sobel_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=5)
     sobel_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=5)
     gradient_magnitude = np.sqrt(sobel_x**2 + sobel_y**2)
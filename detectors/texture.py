@@ -1,9 +1,10 @@
-import cv2
-from skimage.feature import local_binary_pattern
 import numpy as np
+from .common import to_gray
 
 def measure_skin_texture(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = to_gray(image)
+    # skimage is imported on first use, so importing the detectors stays fast
+    from skimage.feature import local_binary_pattern
     lbp = local_binary_pattern(gray, P=8, R=1, method='uniform')
     (hist, _) = np.histogram(lbp.ravel(), bins=np.arange(0, 10), range=(0, 9))
     hist = hist.astype("float")
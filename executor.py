@@ -0,0 +1,116 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from metrics import traced, record_stages
+
+class ExecutorSaturated(Exception):
+    """
+    Raised when more pipeline calls are queued than the executor accepts.
+    The API turns it into a 429 so clients back off instead of piling up.
+    """
+    pass
+
+class ExecutorUnavailable(Exception):
+    """
+    Raised when the pool broke under a call, e.g. a worker process was killed.
+    The pool is replaced on the next call; the API answers 503 meanwhile.
+    """
+    pass
+
+def initialize_worker():
+    import pipeline  # noqa: F401
+    from config import settings
+    if settings.warm_up:
+        warm_up_worker()
+
+def warm_up_worker():
+    # load the models once in this worker, before its first request
+    from utils import warm_up
+    return warm_up()
+
+class PipelineExecutor:
+    """
+    Runs the CPU-bound image pipeline away from the asyncio event loop.
+
+    mode is "process" (a process pool, one copy of the models per process),
+    "thread" (a thread pool in this process) or "inline" (call directly on the event loop).
+    At most max_pending calls may be running or queued at once; further calls raise ExecutorSaturated.
+    """
+    def __init__(self, mode="process", max_workers=None, max_pending=None):
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.max_workers
+        self.pending = 0
+        self._pool = None
+        self._slot_freed = None
+
+    def start(self):
+        if self._pool is not None or self.mode == "inline":
+            return
+        if self.mode == "process":
+            # spawn instead of fork: the server process has threads and loaded models we should not copy
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"), initializer=initialize_worker)
+        elif self.mode == "thread":
+            self._pool = ThreadPoolExecutor(self.max_workers, initializer=initialize_worker)
+        else:
+            raise ValueError(f"Unknown executor mode: {self.mode}")
+
+    async def warm_up(self):
+        """
+        Start every worker and load the models in it, e.g. in the background at server startup.
+        Returns the names of the models loaded.
+        """
+        if self.mode == "inline":
+            return await asyncio.to_thread(warm_up_worker)
+        self.start()
+        loop = asyncio.get_running_loop()
+        # one call per worker makes the pool start all of its processes
+        results = await asyncio.gather(*(loop.run_in_executor(self._pool, warm_up_worker) for _ in range(self.max_workers)))
+        return results[0]
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn, *args, wait=False):
+        """
+        Run fn(*args) on the pool and return its result. Stage timings recorded by fn are sent
+        back with the result and recorded in this process. When the executor is saturated, raise ExecutorSaturated, or with wait=True queue
+        behind the calls already running (used by batch work that must not fail as a whole).
+        """
+        if self.pending >= self.max_pending:
+            if not wait:
+                raise ExecutorSaturated()
+            await self._wait_for_slot()
+        if self.mode == "inline":
+            result, trace = traced(fn, *args)
+            record_stages(trace)
+            return result
+        self.start()
+        # only touched from the event loop thread, so a plain counter is enough
+        self.pending += 1
+        pool = self._pool
+        try:
+            result, trace = await asyncio.get_running_loop().run_in_executor(pool, traced, fn, *args)
+            record_stages(trace)
+            return result
+        except BrokenExecutor as exc:
+            # calls already queued on the broken pool fail the same way; only the first one replaces it
+            if self._pool is pool:
+                self._pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise ExecutorUnavailable("Pipeline worker stopped, retry later") from exc
+        finally:
+            self.pending -= 1
+            if self._slot_freed is not None:
+                async with self._slot_freed:
+                    self._slot_freed.notify()
+
+    async def _wait_for_slot(self):
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Condition()
+        async with self._slot_freed:
+            await self._slot_freed.wait_for(lambda: self.pending < self.max_pending)
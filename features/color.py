@@ -1,6 +1,10 @@
+import logging
+
 import cv2
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 def get_eye_color(image, landmarks):
     left_eye_region = image[landmarks[37][1]:landmarks[41][1], landmarks[36][0]:landmarks[39][0]]
     right_eye_region = image[landmarks[43][1]:landmarks[47][1], landmarks[42][0]:landmarks[45][0]]
@@ -17,8 +21,9 @@ def get_dominant_color(image_region):
     # Convert to HSV and calculate histogram
     hsv = cv2.cvtColor(image_region, cv2.COLOR_BGR2HSV)
     hist = cv2.calcHist([hsv], [0], None, [180], [0, 180])
-    dominant_color = cv2.minMaxLoc(hist)[3][1]
-    print(cv2.minMaxLoc(hist))
+    extrema = cv2.minMaxLoc(hist)
+    dominant_color = extrema[3][1]
+    logger.debug("dominant hue histogram extrema: %s", extrema)
     return interpret_color(dominant_color)
 
 def interpret_color(dominant_color):
@@ -0,0 +1,7 @@
+from .queue import JobQueue
+from .runner import JobRunner
+
+__all__ = [
+    'JobQueue',
+    'JobRunner'
+]
@@ -0,0 +1,218 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    input TEXT NOT NULL,
+    total INTEGER,
+    done INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    lease_until REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE TABLE IF NOT EXISTS results (
+    job_id INTEGER NOT NULL,
+    item INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, item)
+) WITHOUT ROWID;
+"""
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+class JobQueue:
+    """
+    Durable queue of background jobs in a SQLite database, shared by every worker process that opens it.
+
+    A job is a kind, an input file of items (an archive of images) and its progress: the number of items done,
+    with one JSON result per item kept in the results table, so partial results can be read while it runs
+    and a retried job resumes after the last recorded item.
+    A worker claims a job with a lease of lease seconds and renews it while the job runs. The job of a worker
+    that stopped without finishing is claimed again once its lease expires, as one more attempt, until max_attempts.
+    Items with side effects, such as storing a profile, can be recorded one at a time with record_item(),
+    so a retried chunk knows which of its items an earlier attempt already handled.
+    Statuses are queued, running, succeeded, failed and cancelled.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # one connection per process, used from the event loop and from threads, in autocommit mode with explicit transactions
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def submit(self, kind, input, max_attempts=3):
+        with self._lock:
+            cursor = self._db.execute("INSERT INTO jobs (kind, status, input, max_attempts, created) VALUES (?, 'queued', ?, ?, ?)",
+                                      (kind, input, max_attempts, time.time()))
+            return cursor.lastrowid
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, status=None, limit=100):
+        # most recent first
+        with self._lock:
+            if status is None:
+                rows = self._db.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = self._db.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def results(self, job_id, offset=0, limit=None):
+        with self._lock:
+            rows = self._db.execute("SELECT result FROM results WHERE job_id = ? AND item >= ? ORDER BY item LIMIT ?",
+                                    (job_id, offset, -1 if limit is None else limit)).fetchall()
+        return [json.loads(row["result"]) for row in rows]
+
+    def claim(self, lease):
+        """
+        Take the oldest queued job, or a running job whose lease expired, and mark it running for lease seconds.
+        Returns the job, or None when there is nothing to do.
+        """
+        now = time.time()
+        with self._lock, self._transaction():
+            while True:
+                row = self._db.execute("SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) ORDER BY id LIMIT 1",
+                                       (now,)).fetchone()
+                if row is None:
+                    return None
+                # a stale running job already used an attempt on the worker that stopped
+                if row["status"] == "running" and row["cancel_requested"]:
+                    self._finish(row["id"], "cancelled", None, now)
+                elif row["status"] == "running" and row["attempts"] >= row["max_attempts"]:
+                    self._finish(row["id"], "failed", "Worker stopped while running the job", now)
+                else:
+                    self._db.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, started = COALESCE(started, ?) WHERE id = ?",
+                                     (now + lease, now, row["id"]))
+                    return self._get(row["id"])
+
+    def renew(self, job_id, lease):
+        # extend the lease of a running job, e.g. from a heartbeat while a long chunk is processed
+        with self._lock:
+            self._db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'", (time.time() + lease, job_id))
+
+    def item_results(self, job_id, start, stop):
+        # results already recorded for items start to stop - 1, by item
+        with self._lock:
+            rows = self._db.execute("SELECT item, result FROM results WHERE job_id = ? AND item >= ? AND item < ?", (job_id, start, stop)).fetchall()
+        return {row["item"]: json.loads(row["result"]) for row in rows}
+
+    def record_item(self, job_id, item, result):
+        # store the result of one item without advancing the progress, which record() does for the whole chunk
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO results (job_id, item, result) VALUES (?, ?, ?)", (job_id, item, json.dumps(result)))
+
+    def set_total(self, job_id, total):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET total = ? WHERE id = ?", (total, job_id))
+
+    def record(self, job_id, start, results, lease):
+        """
+        Store the results of items start, start + 1, ... of a running job, advance its progress and renew its lease.
+        Results that have an "error" key count as failed items. Returns whether cancellation was requested.
+        """
+        rows = [(job_id, start + offset, json.dumps(result)) for offset, result in enumerate(results)]
+        errors = sum(1 for result in results if "error" in result)
+        with self._lock, self._transaction():
+            self._db.executemany("INSERT OR REPLACE INTO results (job_id, item, result) VALUES (?, ?, ?)", rows)
+            self._db.execute("UPDATE jobs SET done = ?, errors = errors + ?, lease_until = ? WHERE id = ?",
+                             (start + len(results), errors, time.time() + lease, job_id))
+            return bool(self._db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+
+    def finish(self, job_id, status, error=None):
+        with self._lock:
+            self._finish(job_id, status, error, time.time())
+
+    def retry(self, job_id, error):
+        """
+        Queue a job that raised an error again, or fail it once it used all of its attempts.
+        Returns the new status.
+        """
+        with self._lock, self._transaction():
+            row = self._db.execute("SELECT attempts, max_attempts, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row["cancel_requested"]:
+                status = "cancelled"
+            elif row["attempts"] < row["max_attempts"]:
+                status = "queued"
+            else:
+                status = "failed"
+            if status == "queued":
+                self._db.execute("UPDATE jobs SET status = 'queued', error = ?, lease_until = NULL WHERE id = ?", (error, job_id))
+            else:
+                self._finish(job_id, status, error, time.time())
+            return status
+
+    def release(self, job_id):
+        # give back a job interrupted by a shutdown, without counting the attempt
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'queued', attempts = attempts - 1, lease_until = NULL WHERE id = ? AND status = 'running'", (job_id,))
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job at once, or ask the worker of a running job to stop after its current chunk of items.
+        Finished jobs are left as they are. Returns the job, or None if there is no such job.
+        """
+        with self._lock, self._transaction():
+            job = self._get(job_id)
+            if job is not None and job["status"] not in FINISHED:
+                self._db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+                if job["status"] == "queued":
+                    self._finish(job_id, "cancelled", None, time.time())
+                job = self._get(job_id)
+            return job
+
+    def delete(self, job_id):
+        # remove a finished job and its results
+        with self._lock, self._transaction():
+            deleted = self._db.execute("DELETE FROM jobs WHERE id = ? AND status IN (?, ?, ?)", (job_id, *FINISHED)).rowcount == 1
+            if deleted:
+                self._db.execute("DELETE FROM results WHERE job_id = ?", (job_id,))
+        return deleted
+
+    def _get(self, job_id):
+        row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def _finish(self, job_id, status, error, now):
+        self._db.execute("UPDATE jobs SET status = ?, error = COALESCE(?, error), finished = ?, lease_until = NULL WHERE id = ?", (status, error, now, job_id))
+        # a finished job is never run again, so its input is no longer needed
+        row = self._db.execute("SELECT input FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is not None:
+            try:
+                os.remove(row["input"])
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes cannot claim the same job
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
@@ -0,0 +1,103 @@
+import asyncio
+from itertools import islice
+
+from utils import iter_archive_images, count_archive_images
+
+def count_items(path):
+    with open(path, "rb") as f:
+        return count_archive_images(f)
+
+class JobRunner:
+    """
+    Runs the jobs of a JobQueue on workers asyncio tasks of this process, next to the request handlers.
+
+    handlers maps each job kind to an async function (chunk, start, job_id) -> one result dict per item, where chunk is a list of
+    (filename, bytes) read from the job's input archive and start the index of its first item; it sends the images to the
+    pipeline executor, so jobs share the pipeline workers with requests and wait for a free one instead of being refused.
+    After every chunk the results are recorded and cancellation is checked. A job that raises is retried by the queue.
+    While a job runs its lease is renewed every third of the lease, however long counting, skipping or a chunk takes.
+    Queue calls run in threads, so a busy database does not stall the event loop.
+    Jobs submitted by other processes sharing the queue are picked up by polling it every poll_interval seconds.
+    """
+    def __init__(self, queue, handlers, workers=1, lease=60.0, chunk_size=8, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.lease = lease
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._wakeup = None
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # running jobs are given back to the queue, and resume from their last recorded item
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        # a job was submitted in this process, so the workers need not wait for the next poll
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self, job):
+        """
+        Process the items of a claimed job that are not recorded yet, then mark it succeeded, or cancelled if asked to stop.
+        """
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            await self._run(job)
+        finally:
+            heartbeat.cancel()
+
+    async def _run(self, job):
+        handler = self.handlers[job["kind"]]
+        if job["total"] is None:
+            await asyncio.to_thread(self.queue.set_total, job["id"], await asyncio.to_thread(count_items, job["input"]))
+        start = job["done"]
+        cancelled = False
+        with open(job["input"], "rb") as f:
+            items = iter_archive_images(f)
+            await asyncio.to_thread(lambda: next(islice(items, start, start), None))
+            while not cancelled:
+                chunk = await asyncio.to_thread(lambda: list(islice(items, self.chunk_size)))
+                if not chunk:
+                    break
+                results = await handler(chunk, start, job["id"])
+                cancelled = await asyncio.to_thread(self.queue.record, job["id"], start, results, self.lease)
+                start += len(chunk)
+        await asyncio.to_thread(self.queue.finish, job["id"], "cancelled" if cancelled else "succeeded")
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await asyncio.to_thread(self.queue.renew, job_id, self.lease)
+            except Exception:
+                # a renewal that failed, e.g. on a locked database, is retried on the next beat
+                pass
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.queue.claim, self.lease)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.run(job)
+            except asyncio.CancelledError:
+                self.queue.release(job["id"])
+                raise
+            except Exception as exc:
+                await asyncio.to_thread(self.queue.retry, job["id"], f"{type(exc).__name__}: {exc}")
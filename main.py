@@ -1,15 +1,31 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request, Body, Depends
 import uvicorn
-from pydantic import BaseModel
-from starlette.responses import StreamingResponse
+from starlette.responses import Response, StreamingResponse, JSONResponse, PlainTextResponse
 import numpy as np
-import cv2
+import asyncio
+import json
+import os
+import tarfile
+import tempfile
+import uuid
+import time
+from contextlib import asynccontextmanager
 from io import BytesIO
-from typing import List
+from typing import List, Optional
+from pydantic import parse_raw_as
 
-from utils import get_landmarks, get_image, draw_landmarks, get_face_embeddings, compare_faces, extract_shapes, procrustes_analysis, hausdorff_distance, dtw_distance
-from features import create_profile_description
-from detectors import measure_lighting_inconsistency, measure_blur, measure_asymmetry, measure_skin_texture, measure_high_frequency_artifacts, measure_gaze_inconsistency
+from utils import iter_archive_images, ImageDecodeError, ImageTooLarge
+from models import Artifacts, Profile, ProfileMatch, ProfileMatches, ProfileDistance, FaceProfile, FaceArtifacts, FaceMatches, SearchWeights, WeightedMatch, WeightedMatches, VideoProfiles, ProfileFormat, ShardQuery, ShardFeatureQuery, ShardMatches, ShardWeightedQuery, ShardWeightedMatches, Job, JobKind, JobStatus, ClusterMethod, ProfileCluster, ProfileClusters, DuplicatePair, ArtifactScores, ScoredArtifacts, PopulationStatistics
+from pipeline import PIPELINE_VERSION, profile_from_bytes, calculate_distance, landmarks_png_from_bytes, face_profiles_from_bytes, face_artifacts_from_bytes, video_profiles_from_file, video_profiles_from_frames
+from executor import PipelineExecutor, ExecutorSaturated, ExecutorUnavailable
+from search import create_index, DTWIndex, FEATURE_SLICES, SHAPE_COMPONENTS, component_distances, weighted_scores, closest_by_feature, GalleryClusters, threshold_edges
+from cache import ResultCache, content_key, settings_key
+from storage import ProfileStore, PersistentProfileStore, ARTIFACT_FIELDS, profile_dicts, dumps
+from sharding import ShardCoordinator, ShardUnavailable
+from jobs import JobQueue, JobRunner
+from population import PopulationStats, SUMMARY_QUANTILES, merge_scores, merge_summary
+from config import settings
+from metrics import metrics, request_stages, stage, traced, record_stages
 
 app = FastAPI(
     title="Josh's Facial Profile API Documentation",
@@ -35,107 +51,283 @@ app = FastAPI(
             "name": "Profile Management",
             "description": "Operations related to creating, retrieving, and managing profiles.",
         },
+        {
+            "name": "Jobs",
+            "description": "Operations to run long image batches in the background and follow their progress.",
+        },
+        {
+            "name": "Sharding",
+            "description": "Operations a coordinator calls on the shard servers of a sharded gallery.",
+        },
     ],)
 
-class Artifacts(BaseModel):
-    """
-    Stores data about how many artifacts are present in an image.
-    These artifacts are often highly present in deepfaked images,
-    so loooking at their prevalence in an image relative to the average
-    amounts in a dataset can be useful in deepfake detection.
-    """
-    lighting_inconsistency: float
-    blur_measure: float
-    asymmetry_score: float
-    texture_score: float
-    high_freq_artifacts: float
-    gaze_direction: float
-    
-class Profile(BaseModel):
-    """
-    Represents a profile of a face.
-    Has an integer identifier, text description, face embedding, artifacts, and landmarks.
-    Landmarks are produced by dlib shape predictor model.
-    Text description is calculated based on landmarks.
-    Artifacts are calculated using OpenCV methods.
-    """
-    id: int = -1
-    description: str
-    embedding: List[float]
-    artifacts: Artifacts
-    landmarks: List[List[int]]
-    
-    class Config:
-        schema_extra = {
-            "example": {
-                "id": 1,
-                "description": "Face with high cheekbones, square shape, and blue eyes.",
-                "embedding": [0.1, 0.2, 0.3],
-                "artifacts": {
-                    "lighting_inconsistency": 0.1,
-                    "blur_measure": 0.2,
-                    "asymmetry_score": 0.3,
-                    "texture_score": 0.4,
-                    "high_freq_artifacts": 0.5,
-                    "gaze_direction": 0.6
-                },
-                "landmarks": [[0, 0], [1, 1], [2, 2]]
-            }
-        }
-    
-class ProfileMatch(BaseModel):
-    current_profile: Profile
-    found_profile: Profile
-    distance: float
-    
-class ProfileDistance(BaseModel):
-    artifacts_distance: Artifacts
-    embedding_distance: float
-    eyebrow_distance: float
-    eye_distance: float
-    nose_distance: float
-    mouth_distance: float
-    jaw_distance: float
-
-profiles: List[Profile] = []
+executor = PipelineExecutor(settings.executor, max_workers=settings.executor_workers or None, max_pending=settings.executor_max_pending or None)
+
+@app.on_event("startup")
+async def start_executor():
+    executor.start()
+    if coordinator is not None:
+        coordinator.start()
+    if job_runner is not None and settings.job_workers > 0:
+        job_runner.start()
+    if settings.warm_up:
+        # the server answers right away while the workers load their models
+        app.state.warm_up = asyncio.create_task(executor.warm_up())
+
+@app.on_event("shutdown")
+async def stop_executor():
+    if job_runner is not None:
+        await job_runner.stop()
+    executor.shutdown()
+    if coordinator is not None:
+        await coordinator.close()
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    metrics.increment("face_api_rejected_total")
+    return JSONResponse(status_code=429, content={"detail": "Server is busy, retry later"}, headers={"Retry-After": "1"})
+
+@app.exception_handler(ExecutorUnavailable)
+async def executor_unavailable_handler(request: Request, exc: ExecutorUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(ShardUnavailable)
+async def shard_unavailable_handler(request: Request, exc: ShardUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(ImageDecodeError)
+async def image_decode_error_handler(request: Request, exc: ImageDecodeError):
+    return JSONResponse(status_code=413 if isinstance(exc, ImageTooLarge) else 400, content={"detail": str(exc)})
+
+# a shard only allocates the ids of its stride, so that id % shard_count finds it
+store_options = dict(compact_ratio=settings.compact_ratio, compact_min_dead=settings.compact_min_dead, id_offset=settings.shard_index, id_stride=settings.shard_count)
+profile_store = PersistentProfileStore(settings.store_dir, fsync=settings.store_fsync, **store_options) if settings.store_dir else ProfileStore(**store_options)
+# the index searches the store's embedding column and returns store rows
+if settings.index in ("int8", "pq") and not settings.store_dir:
+    # the compressed codes would only add to the in-memory float32 column they are meant to replace
+    raise ValueError(f"FACE_API_INDEX={settings.index} needs FACE_API_STORE_DIR, whose memory-mapped embeddings it re-ranks with")
+embedding_index = create_index(settings.index, profile_store, n_lists=settings.ivf_lists or None, nprobe=settings.ivf_nprobe, train_size=settings.ivf_train_size,
+                               recall_target=settings.quantize_recall, subvectors=settings.pq_subvectors)
+dtw_band = settings.dtw_band if settings.dtw_band >= 0 else None
+dtw_index = DTWIndex(profile_store, band=dtw_band)
+# identity clusters, computed on first use and extended as profiles are added
+gallery_clusters = GalleryClusters(profile_store, embedding_index, threshold=settings.cluster_threshold, method=settings.cluster_method)
+cluster_lock = asyncio.Lock()
+# store and index work is serialized under gallery_lock; the long parts (searches, scoring, index training,
+# compaction) run in a thread while it is held, so requests wait here rather than stalling the event loop
+gallery_lock = asyncio.Lock()
+# running artifact statistics of the stored profiles, which uploads are scored against
+population = PopulationStats(profile_store, relative_accuracy=settings.population_accuracy)
+# with shard urls this server is a coordinator: profiles are stored on the shards and searched there
+coordinator = ShardCoordinator(settings.shard_urls.split(","), timeout=settings.shard_timeout, connections=settings.shard_connections) if settings.shard_urls else None
+
+# single-face pipeline results by upload hash, so the same image sent to several endpoints is analyzed once
+# results also depend on these settings, so changing one of them starts a fresh namespace of the disk tier
+result_settings = {name: getattr(settings, name) for name in ("detection_mode", "detection_max_size", "decode_max_size", "artifact_margin", "artifact_size",
+                                                               "predictor_path", "face_recognition_model_path")}
+result_cache = ResultCache(max_bytes=settings.cache_max_bytes, ttl=settings.cache_ttl, directory=settings.cache_dir or None,
+                           namespace=f"v{PIPELINE_VERSION}-{settings_key(result_settings)}", max_disk_bytes=settings.cache_max_disk_bytes)
+
+async def read_profile(data, wait=False):
+    # the profile of the first face in the image, or None when there is none; both outcomes are cached.
+    # Hashing a large upload and the disk tier's file I/O run in threads, so they do not stall the event loop
+    key = await asyncio.to_thread(content_key, data) if result_cache.enabled else None
+    cached = await in_cache(result_cache.get, key) if key is not None else None
+    if cached is not None:
+        return parse_raw_as(Optional[Profile], cached)
+    profile = await executor.run(profile_from_bytes, data, wait=wait)
+    count_detections([profile.detection] if profile is not None else [])
+    if key is not None:
+        await in_cache(result_cache.put, key, profile.json(exclude={"id"}).encode() if profile is not None else b"null")
+    return profile
+
+async def in_cache(fn, *args):
+    # a cache call in a thread when it may touch the disk tier; the memory tier alone is served on the event loop
+    if result_cache.directory is None:
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+async def score_artifacts(artifacts):
+    # a coordinator scores against the profiles of every shard that answers; scores are optional, so none answering leaves them out
+    if coordinator is not None:
+        values = [getattr(artifacts, name) for name in ARTIFACT_FIELDS]
+        try:
+            parts, _ = await coordinator.fan_out("POST", "/shard/artifact-scores", artifacts.dict())
+        except ShardUnavailable:
+            return None
+        return to_artifact_scores(merge_scores(values, parts.values()))
+    async with gallery():
+        return artifact_scores(artifacts)
+
+def artifact_scores(artifacts):
+    # z-scores and percentiles of measured artifacts among the stored profiles, None while none is stored; holding the gallery lock
+    return to_artifact_scores(population.scores([getattr(artifacts, name) for name in ARTIFACT_FIELDS]))
+
+def to_artifact_scores(scores):
+    if scores is None:
+        return None
+    count, z_scores, percentiles = scores
+    return ArtifactScores(population=count, z_scores=Artifacts(**dict(zip(ARTIFACT_FIELDS, z_scores))),
+                          percentiles=Artifacts(**dict(zip(ARTIFACT_FIELDS, percentiles))))
+
+def count_detections(paths):
+    # faces found per detection path, or one "none" for an image without faces
+    for path in paths or ["none"]:
+        metrics.increment("face_api_detections_total", path=path or "none")
+
+@asynccontextmanager
+async def gallery():
+    async with gallery_lock:
+        # pick up profiles written by other worker processes sharing the same store directory
+        profile_store.refresh()
+        yield
+
+async def in_gallery(fn, *args, **kwargs):
+    # fn(*args, **kwargs) in a thread, holding the gallery lock
+    async with gallery():
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+async def search_gallery(fn, *args):
+    # in_gallery for searches, timed as the "search" stage of the request
+    result, trace = await in_gallery(traced, timed_search, fn, *args)
+    record_stages(trace)
+    return result
+
+def timed_search(fn, *args):
+    with stage("search"):
+        return fn(*args)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # pipeline stage timings of this request are collected in request_stages by the executor
+    stages = []
+    token = request_stages.set(stages)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_stages.reset(token)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    metrics.observe("face_api_request_duration_seconds", elapsed, path=path)
+    metrics.increment("face_api_requests_total", path=path, method=request.method, status=str(response.status_code))
+    if settings.server_timing:
+        timings = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages] + [f"total;dur={elapsed * 1000:.1f}"]
+        response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+metrics.gauge("face_api_profiles", "Stored profiles", lambda: len(profile_store))
+metrics.gauge("face_api_executor_pending", "Pipeline calls running or queued", lambda: executor.pending)
+metrics.counter("face_api_cache_hits_total", "Result cache memory hits", lambda: result_cache.hits)
+metrics.counter("face_api_cache_disk_hits_total", "Result cache disk hits", lambda: result_cache.disk_hits)
+metrics.counter("face_api_cache_misses_total", "Result cache misses", lambda: result_cache.misses)
+metrics.gauge("face_api_cache_bytes", "Bytes held by the result cache in memory", lambda: result_cache.stats()["bytes"])
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
     
 @app.get("/list-profiles", response_model=List[Profile], tags=["Profile Management"])
-async def list_profiles():
+async def list_profiles(cursor: Optional[int] = Query(None, description="Only list profiles with a greater id, the X-Next-Cursor header of the previous page"),
+                        limit: Optional[int] = Query(None, ge=1, description="Maximum number of profiles to return, all of them if omitted"),
+                        format: ProfileFormat = Query(ProfileFormat.full, description="full, slim (no embedding and landmarks) or binary (base64 embedding and landmarks)")):
     """
-    _List all profiles._
+    _List profiles in id order, a page at a time with limit and cursor.
+    JSON is written straight from the store's columns. Without a limit the whole gallery is streamed
+    in chunks, so listing a large gallery does not hold up other requests._
+
+    Args:
+        cursor (int, optional): _Only list profiles with a greater id._ Defaults to None.
+        limit (int, optional): _Maximum number of profiles to return._ Defaults to None.
+        format (ProfileFormat, optional): _full, slim or binary._ Defaults to full.
 
     Returns:
-        _[Profile]_: _List of all profiles._
+        _[Profile]_: _The profiles, with an X-Next-Cursor header when a limit was given and more profiles follow.
+        On a coordinator the pages of every shard are merged in id order._
     """
-    return profiles
+    if limit is None:
+        return StreamingResponse(stream_profiles(cursor, format.value), media_type="application/json")
+    profiles, more, failed = await profile_page(cursor, limit, format.value)
+    response = Response(dumps(profiles), media_type="application/json")
+    if more:
+        response.headers["X-Next-Cursor"] = str(profiles[-1]["id"])
+    if coordinator is not None:
+        report_shards(response, failed)
+    return response
+
+async def profile_page(cursor, limit, format):
+    # up to limit profile dicts after cursor in id order, whether more follow, and the shards that did not answer on a coordinator
+    if coordinator is not None:
+        return await coordinator.list_profiles(cursor, limit, format)
+    return await in_gallery(local_profile_page, cursor, limit, format)
+
+def local_profile_page(cursor, limit, format):
+    # holding the gallery lock, in a thread: a persistent store sorts its rows by id again after other workers appended some
+    rows = profile_store.rows_after(cursor, limit + 1)
+    return profile_dicts(profile_store, rows[:limit], format), len(rows) > limit, []
+
+async def stream_profiles(cursor, format, chunk_size=1000):
+    # one JSON array written chunk by chunk; each chunk continues after the last id sent, so deletes and compactions in between are harmless
+    yield b"["
+    separator = b""
+    while True:
+        profiles, more, _ = await profile_page(cursor, chunk_size, format)
+        if not profiles:
+            break
+        cursor = profiles[-1]["id"]
+        yield separator + dumps(profiles)[1:-1]
+        separator = b","
+        # let other requests run between chunks
+        await asyncio.sleep(0)
+    yield b"]"
 
 @app.get("/count-profiles", tags=["Profile Management"])
-async def count_profiles():
+async def count_profiles(response: Response):
     """
     _Count the number of profiles._
 
     Returns:
-        _int_: _The number of profiles._
+        _int_: _The number of profiles, over the shards that answered on a coordinator._
     """
-    return len(profiles)
+    if coordinator is not None:
+        counts, failed = await coordinator.fan_out("GET", "/count-profiles")
+        report_shards(response, failed)
+        return sum(counts.values())
+    async with gallery():
+        return len(profile_store)
 
 @app.get("/get-profile/{profile_id}", response_model=Profile, tags=["Profile Management"])
-async def get_profile_by_id(profile_id: int):
+async def get_profile_by_id(profile_id: int, format: ProfileFormat = Query(ProfileFormat.full, description="full, slim (no embedding and landmarks) or binary (base64 embedding and landmarks)")):
     """
     _Get a profile by id._
 
     Args:
         profile_id (int): _The id of the profile to get._
+        format (ProfileFormat, optional): _full, slim or binary._ Defaults to full.
 
     Raises:
         HTTPException: _404 if the profile is not found_
 
     Returns:
-        _int_: _description_
+        _Profile_: _The profile._
     """
-    for profile in profiles:
-        if profile.id == profile_id:
-            return profile
+    if coordinator is not None:
+        reply = await coordinator.route(profile_id, "GET", f"/get-profile/{profile_id}", params={"format": format.value})
+        if reply.status_code != 200:
+            return Response(reply.content, status_code=reply.status_code, media_type="application/json")
+        # the shard scored the artifacts against its own profiles only
+        profile = reply.json()
+        scores = await score_artifacts(Artifacts(**profile["artifacts"]))
+        profile["artifact_scores"] = scores.dict() if scores is not None else None
+        return Response(dumps(profile), media_type="application/json")
+    async with gallery():
+        row = profile_store.row_of(profile_id)
+        if row is not None:
+            profile = profile_dicts(profile_store, [row], format.value)[0]
+            scores = artifact_scores(Artifacts(**profile["artifacts"]))
+            profile["artifact_scores"] = scores.dict() if scores is not None else None
+            return Response(dumps(profile), media_type="application/json")
     raise HTTPException(status_code=404, detail="Profile not found")
 
 @app.delete("/delete-profile/{profile_id}", tags=["Profile Management"])
@@ -149,21 +341,97 @@ async def delete_profile(profile_id: int):
     Raises:
         HTTPException: _404 if the profile is not found_
     """
-    for i, profile in enumerate(profiles):
-        if profile.id == profile_id:
-            del profiles[i]
-            return
+    if coordinator is not None:
+        reply = await coordinator.route(profile_id, "DELETE", f"/delete-profile/{profile_id}")
+        return Response(reply.content, status_code=reply.status_code, media_type="application/json")
+    # a delete may compact the store
+    if await in_gallery(profile_store.delete, profile_id):
+        return
     raise HTTPException(status_code=404, detail="Profile not found")
 
+@app.post("/delete-profiles", tags=["Profile Management"])
+async def delete_profiles(profile_ids: List[int] = Body(...)):
+    """
+    _Delete several profiles by id in one call._
+
+    Args:
+        profile_ids (List[int]): _The ids of the profiles to delete._
+
+    Returns:
+        _dict_: _The ids that were deleted and the ids that did not match a profile;
+        on a coordinator also the ids held by shards that did not answer._
+    """
+    if coordinator is not None:
+        deleted, not_found, unavailable = await coordinator.delete_many(profile_ids)
+        return {"deleted": deleted, "not_found": not_found, "unavailable": unavailable}
+    deleted = await in_gallery(profile_store.delete_many, profile_ids)
+    found = set(deleted)
+    return {"deleted": deleted, "not_found": [profile_id for profile_id in dict.fromkeys(profile_ids) if profile_id not in found]}
+
+@app.post("/compact-profiles", tags=["Profile Management"])
+async def compact_profiles(response: Response):
+    """
+    _Reclaim the space of deleted profiles now instead of waiting for automatic compaction.
+    Profile ids do not change. A coordinator compacts every shard._
+    """
+    if coordinator is not None:
+        return await broadcast(response, "POST", "/compact-profiles")
+    await in_gallery(profile_store.compact)
+
 @app.delete("/delete-all-profiles", tags=["Profile Management"])
-async def delete_all_profiles():
+async def delete_all_profiles(response: Response):
+    """
+    _Delete all profiles. A coordinator deletes the profiles of every shard._
+    """
+    if coordinator is not None:
+        return await broadcast(response, "DELETE", "/delete-all-profiles")
+    await in_gallery(profile_store.clear)
+
+async def broadcast(response, method, path):
+    # run a maintenance call on every shard; X-Shards-Failed names the shards it did not reach
+    _, failed = await coordinator.fan_out(method, path)
+    report_shards(response, failed)
+
+@app.get("/cache-stats", tags=["Profile Management"])
+async def cache_stats():
+    """
+    _Hit and miss counters of the result cache for uploaded images, for this worker process._
+
+    Returns:
+        _dict_: _Memory hits, disk hits, misses, hit rate, and the number and total size of entries held in memory._
+    """
+    return result_cache.stats()
+
+@app.post("/rebuild-index", tags=["Profile Management"])
+async def rebuild_index(response: Response):
     """
-    _Delete all profiles._
+    _Rebuild the search index from the exact stored embeddings.
+    Retrains the clusters of the approximate index, or the quantizer of the compressed ones, after the gallery has grown or changed a lot.
+    A coordinator rebuilds the index of every shard._
     """
-    profiles.clear()
+    if coordinator is not None:
+        return await broadcast(response, "POST", "/rebuild-index")
+    await in_gallery(embedding_index.rebuild)
+
+@app.get("/index-stats", tags=["Profile Management"])
+async def index_stats(response: Response):
+    """
+    _Describe the embedding search index. Compressed indexes include their accuracy report:
+    the calibrated shortlist length, the recall it reaches and the compression ratio._
+
+    Returns:
+        _dict_: _Index kind, size and training state, plus the calibration measurements of compressed indexes.
+        A coordinator returns {"shards": {shard: stats}} for the shards that answered._
+    """
+    if coordinator is not None:
+        answers, failed = await coordinator.fan_out("GET", "/index-stats")
+        report_shards(response, failed)
+        return {"shards": answers}
+    async with gallery():
+        return embedding_index.stats()
 
 @app.post("/get-profile-id", response_model=int, tags=["Profile Management"])
-async def get_profile_id(file: UploadFile = File(...)):
+async def get_profile_id(response: Response, file: UploadFile = File(...)):
     """
     _Get the id of the profile of the face in the image you upload._
 
@@ -177,17 +445,22 @@ async def get_profile_id(file: UploadFile = File(...)):
     Returns:
         _int_: _The id of the profile of the face in the image._
     """
-    img = await get_image(file)
-    landmarks = get_landmarks(img)
-    if landmarks is not None:
-        current_profile = create_profile_helper(img, landmarks)
-        for profile in profiles:
-            if np.array_equal(profile.embedding, current_profile.embedding):
-                return profile.id
+    current_profile = await read_profile(await file.read())
+    if current_profile is not None:
+        profile_id = await exact_profile_id(current_profile.embedding, response)
+        if profile_id is not None:
+            return profile_id
         raise HTTPException(status_code=404, detail="Profile not found")
     else:
         raise HTTPException(status_code=400, detail="No face detected")
 
+async def exact_profile_id(embedding, response=None):
+    # id of the stored profile with exactly this embedding, which only the same image gives, or None
+    found_profiles, _ = await search_profiles(embedding, response, k=1)
+    if found_profiles and np.array_equal(np.asarray(found_profiles[0].embedding, dtype=np.float32), np.asarray(embedding, dtype=np.float32)):
+        return found_profiles[0].id
+    return None
+
 @app.post("/create-profile", response_model=Profile, tags=["Profile Management"])
 async def create_profile(file: UploadFile = File(...)):
     """
@@ -221,24 +494,281 @@ async def get_profile(file: UploadFile = File(...)):
     return await get_profile(False, file)
     
 async def get_profile(create: bool, file: UploadFile = File(...), tags=["Profile Management"]):
-    img = await get_image(file)
-    landmarks = get_landmarks(img)
-    if landmarks is not None:
-        profile = create_profile_helper(img, landmarks)
+    profile = await read_profile(await file.read())
+    if profile is not None:
+        # scored against the gallery before the profile joins it
+        profile.artifact_scores = await score_artifacts(profile.artifacts)
         if create: 
-            profile.id = len(profiles)
-            profiles.append(profile)
+            await add_profile(profile)
         return profile
     else:
         raise HTTPException(status_code=400, detail="No face detected")
+
+@app.post("/create-face-profiles", response_model=List[FaceProfile], tags=["Profile Management"])
+async def create_face_profiles(file: UploadFile = File(...)):
+    """
+    _Create a profile for every face in the image you upload, e.g. a group photo._
+
+    Args:
+        file (UploadFile, optional): _The image to get the profiles from._ Defaults to File(...).
+
+    Raises:
+        HTTPException: _400 if no face is detected_
+
+    Returns:
+        _[FaceProfile]_: _The bounding box and new profile of each face in the image._
+    """
+    return await get_face_profiles(True, file)
+
+@app.post("/get-face-profiles", response_model=List[FaceProfile], tags=["Profile Management"])
+async def get_face_profiles_endpoint(file: UploadFile = File(...)):
+    """
+    _Get the profile of every face in the image you upload, without storing them._
+
+    Args:
+        file (UploadFile, optional): _The image to get the profiles from._ Defaults to File(...).
+
+    Raises:
+        HTTPException: _400 if no face is detected_
+
+    Returns:
+        _[FaceProfile]_: _The bounding box and profile of each face in the image._
+    """
+    return await get_face_profiles(False, file)
+
+async def get_face_profiles(create: bool, file: UploadFile):
+    face_profiles = await executor.run(face_profiles_from_bytes, await file.read())
+    count_detections([face_profile.profile.detection for face_profile in face_profiles])
+    if face_profiles:
+        for face_profile in face_profiles:
+            face_profile.profile.artifact_scores = await score_artifacts(face_profile.profile.artifacts)
+        if create:
+            for face_profile in face_profiles:
+                await add_profile(face_profile.profile)
+        return face_profiles
+    else:
+        raise HTTPException(status_code=400, detail="No face detected")
+
+@app.post("/get-video-profiles", response_model=VideoProfiles, tags=["Profile Management"])
+async def get_video_profiles(request: Request, create: bool = Query(False, description="Also store the aggregated profile of every track")):
+    """
+    _Follow every face through a video sent as the raw request body and get one aggregated profile per face.
+    Faces are detected on keyframes only and tracked in between; descriptors are only recomputed when a face turns
+    or gets sharper. Each track also reports its artifact statistics over time, which show deepfake flicker
+    that single frames do not. The body is streamed to a temporary file, never held in memory._
+
+    Args:
+        request (Request): _Request whose body is a video file, e.g. mp4, avi or webm._
+        create (bool, optional): _Also store the aggregated profile of every track._ Defaults to False.
+
+    Raises:
+        HTTPException: _400 if the body is not a readable video or no face is detected_
+
+    Returns:
+        _VideoProfiles_: _Frame counts and one TrackProfile per face._
+    """
+    with tempfile.NamedTemporaryFile() as video:
+        async for chunk in request.stream():
+            video.write(chunk)
+        video.flush()
+        result = await executor.run(video_profiles_from_file, video.name)
+    return await add_video_profiles(result, create)
+
+@app.post("/get-frame-profiles", response_model=VideoProfiles, tags=["Profile Management"])
+async def get_frame_profiles(files: List[UploadFile] = File(...), create: bool = Query(False, description="Also store the aggregated profile of every track")):
+    """
+    _Like /get-video-profiles for a sequence of frames uploaded as images, in order._
+
+    Args:
+        files (List[UploadFile], optional): _The frames, in order._ Defaults to File(...).
+        create (bool, optional): _Also store the aggregated profile of every track._ Defaults to False.
+
+    Raises:
+        HTTPException: _400 if a frame is not an image or no face is detected_
+
+    Returns:
+        _VideoProfiles_: _Frame counts and one TrackProfile per face._
+    """
+    frames = [await file.read() for file in files]
+    return await add_video_profiles(await executor.run(video_profiles_from_frames, frames), create)
+
+async def add_video_profiles(result, create):
+    count_detections(["tracked"] * len(result.tracks))
+    if not result.tracks:
+        raise HTTPException(status_code=400, detail="No face detected")
+    if create:
+        for track in result.tracks:
+            await add_profile(track.profile)
+    return result
+
+async def add_profile(profile):
+    # a coordinator stores the profile on a shard, which sets its id
+    if coordinator is not None:
+        profile.id = await coordinator.add(profile)
+    else:
+        await store_profile(profile)
+
+async def store_profile(profile):
+    # syncing the index may train it once enough profiles are stored
+    await in_gallery(store_and_index, profile)
+
+def store_and_index(profile):
+    profile_store.add(profile)
+    embedding_index.sync()
+
+def require_local_gallery(operation):
+    # operations over the whole gallery at once are not merged across shards; a coordinator refuses them
+    if coordinator is not None:
+        raise HTTPException(status_code=501, detail=f"{operation} is not available on a coordinator, call it on each shard")
+
+def report_shards(response, failed):
+    # partial results are still answered, with the shards that did not answer named in headers; outside a request only counted
+    if response is not None:
+        response.headers["X-Shards-Answered"] = f"{len(coordinator.urls) - len(failed)}/{len(coordinator.urls)}"
+    if response is not None and failed:
+        response.headers["X-Shards-Failed"] = ", ".join(f"{shard['shard']} ({shard['error']})" for shard in failed)
+    for shard in failed:
+        metrics.increment("face_api_shard_failures_total", shard=str(shard["shard"]), error=shard["error"])
+
+async def search_profiles(embedding, response=None, k=1, max_distance=None, nprobe=None):
+    # the closest stored profiles and their distances, from the local index or, on a coordinator, from every shard
+    if coordinator is None:
+        return await search_gallery(local_search, embedding, k, max_distance, nprobe)
+    profiles, distances, failed = await coordinator.search(embedding, k=k, max_distance=max_distance, nprobe=nprobe)
+    report_shards(response, failed)
+    return [Profile.parse_obj(profile) for profile in profiles], distances
+
+def local_search(embedding, k=1, max_distance=None, nprobe=None):
+    rows, distances = embedding_index.search(embedding, k=k, max_distance=max_distance, nprobe=nprobe)
+    return [profile_store.profile_at(row) for row in rows], distances.tolist()
+
+@app.post("/create-profiles", tags=["Profile Management"])
+async def create_profiles(files: List[UploadFile] = File(...)):
+    """
+    _Create a profile for each of the images you upload.
+    Images are processed in parallel chunks and one JSON line is streamed back per image as soon as its chunk finishes,
+    either its new profile id or an error such as no face being detected. One bad image does not fail the others._
+
+    Args:
+        files (List[UploadFile], optional): _The images to create profiles from._ Defaults to File(...).
+
+    Returns:
+        _StreamingResponse_: _Newline-delimited JSON, one {"index", "filename", "id"} or {"index", "filename", "error"} object per image._
+    """
+    async def uploads():
+        for file in files:
+            yield file.filename, await file.read()
+    return StreamingResponse(ingest_images(uploads()), media_type="application/x-ndjson")
+
+@app.post("/create-profiles-archive", tags=["Profile Management"])
+async def create_profiles_archive(request: Request):
+    """
+    _Create a profile for each image in a zip or tar archive sent as the raw request body.
+    The body is spooled to disk rather than held in memory and members are read one chunk at a time,
+    so large imports stream through. Results are streamed back like /create-profiles._
+
+    Args:
+        request (Request): _Request whose body is a zip, tar, tar.gz or tar.bz2 archive of images._
+
+    Raises:
+        HTTPException: _400 if the body is not a zip or tar archive_
+
+    Returns:
+        _StreamingResponse_: _Newline-delimited JSON, one {"index", "filename", "id"} or {"index", "filename", "error"} object per image._
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.batch_spool_size)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    members = iter_archive_images(spool)
+    try:
+        first = next(members, None)
+    except Exception:
+        spool.close()
+        raise HTTPException(status_code=400, detail="Body is not a zip or tar archive")
+
+    async def archive_members():
+        try:
+            if first is not None:
+                yield first
+                for member in members:
+                    yield member
+        finally:
+            spool.close()
+    return StreamingResponse(ingest_images(archive_members()), media_type="application/x-ndjson")
+
+async def ingest_images(images):
+    # images is an async iterator of (filename, bytes); at most one chunk of images is in memory at a time
+    chunk_size = settings.batch_chunk_size or executor.max_workers
+    index = 0
+    chunk = []
+    async for image in images:
+        chunk.append(image)
+        if len(chunk) >= chunk_size:
+            for line in await ingest_chunk(chunk, index):
+                yield line
+            index += len(chunk)
+            chunk = []
+    if chunk:
+        for line in await ingest_chunk(chunk, index):
+            yield line
+
+async def ingest_chunk(chunk, start):
+    return [json.dumps(line) + "\n" for line in await ingest_results(chunk, start)]
+
+async def ingest_results(chunk, start, job_id=None):
+    # one {"index", "filename", "id"} or {"index", "filename", "error"} dict per image of the chunk;
+    # in a job, the images an earlier attempt of the chunk already stored keep the id it recorded
+    recorded = await asyncio.to_thread(job_queue.item_results, job_id, start, start + len(chunk)) if job_id is not None else {}
+    todo = [offset for offset in range(len(chunk)) if recorded.get(start + offset, {}).get("id") is None]
+    results = dict(zip(todo, await asyncio.gather(*(read_profile(chunk[offset][1], wait=True) for offset in todo), return_exceptions=True)))
+    lines = []
+    for offset, (filename, _) in enumerate(chunk):
+        if offset not in results:
+            lines.append(recorded[start + offset])
+            continue
+        profile = results[offset]
+        line = {"index": start + offset, "filename": filename}
+        if isinstance(profile, ImageDecodeError):
+            line["error"] = str(profile)
+        elif isinstance(profile, Exception):
+            line["error"] = "Could not process image"
+        elif profile is None:
+            line["error"] = "No face detected"
+        else:
+            try:
+                if job_id is not None:
+                    line["id"] = await store_job_profile(job_id, line, profile, pending=start + offset in recorded)
+                else:
+                    await add_profile(profile)
+                    line["id"] = profile.id
+            except ShardUnavailable as exc:
+                line["error"] = str(exc)
+        lines.append(line)
+    return lines
+
+async def store_job_profile(job_id, line, profile, pending):
+    # the image is marked pending before its profile is stored and recorded with its id right after, so a retried chunk
+    # stores again only the images an earlier attempt did not; a pending one may have been stored just before that attempt stopped
+    if pending:
+        profile_id = await exact_profile_id(profile.embedding)
+        if profile_id is not None:
+            return profile_id
+    else:
+        await asyncio.to_thread(job_queue.record_item, job_id, line["index"], {**line, "pending": True})
+    await add_profile(profile)
+    await asyncio.to_thread(job_queue.record_item, job_id, line["index"], {**line, "id": profile.id})
+    return profile.id
     
 @app.post("/find-profile", response_model=ProfileMatch, tags=["Profile Matching"])
-async def find_profile(file: UploadFile = File(...)):
+async def find_profile(response: Response, file: UploadFile = File(...), nprobe: Optional[int] = Query(None, ge=1, description="Clusters to scan with the approximate index, higher is slower but more accurate")):
     """
-    _Find the closest matching profile based on face embeddings._
+    _Find the closest matching profile based on face embeddings.
+    On a coordinator every shard is searched at once; X-Shards-Answered and X-Shards-Failed tell whether some did not answer in time._
 
     Args:
         file (UploadFile, optional): _The image to find the closest matching profile of._ Defaults to File(...).
+        nprobe (int, optional): _Recall/latency knob of the approximate index, ignored by the exact index._ Defaults to Query(None).
 
     Raises:
         HTTPException: _401 if no matching profile is found_
@@ -247,28 +777,129 @@ async def find_profile(file: UploadFile = File(...)):
     Returns:
         _ProfileMatch_: _The profile of the image you uploaded, the closest matching profile, and the distance between the two profiles._
     """
-    img = await get_image(file)
-    landmarks = get_landmarks(img)
-    if landmarks is not None:
-        current_profile = create_profile_helper(img, landmarks)
-        embedding = np.array(current_profile.embedding)
-        
-        min_distance = float("inf")
-        closest_profile = None
-        for profile in profiles:
-            stored_embedding = np.array(profile.embedding)
-            _, distance = compare_faces(embedding, stored_embedding)
-            if distance < min_distance:
-                min_distance = distance
-                closest_profile = profile
+    current_profile = await read_profile(await file.read())
+    if current_profile is not None:
+        found_profiles, distances = await search_profiles(current_profile.embedding, response, k=1, nprobe=nprobe)
                 
-        if closest_profile is not None:
-            return ProfileMatch(current_profile=current_profile, found_profile=closest_profile, distance=min_distance)
+        if len(found_profiles) > 0:
+            return ProfileMatch(current_profile=current_profile, found_profile=found_profiles[0], distance=distances[0])
         else:
             raise HTTPException(status_code=401, detail="No matching profile found")
     else:
         raise HTTPException(status_code=400, detail="No face detected")
+
+@app.post("/find-profiles", response_model=ProfileMatches, tags=["Profile Matching"])
+async def find_profiles(response: Response, file: UploadFile = File(...), k: Optional[int] = Query(None, ge=1, description="Maximum number of matches to return, all matches if omitted"), 
+                        max_distance: Optional[float] = Query(None, gt=0, description="Only return profiles closer than this embedding distance, 0.6 (the dlib same-person threshold) if k is also omitted"),
+                        nprobe: Optional[int] = Query(None, ge=1, description="Clusters to scan with the approximate index, higher is slower but more accurate")):
+    """
+    _Find every profile matching the face in the image you upload, closest first, in one batched search over the face embeddings.
+    On a coordinator the matches of every shard are merged._
+
+    Args:
+        file (UploadFile, optional): _The image to find matching profiles of._ Defaults to File(...).
+        k (int, optional): _Maximum number of matches to return._ Defaults to Query(None).
+        max_distance (float, optional): _Maximum embedding distance of a match._ Defaults to Query(None).
+        nprobe (int, optional): _Recall/latency knob of the approximate index, ignored by the exact index._ Defaults to Query(None).
+
+    Raises:
+        HTTPException: _400 if no face is detected_
+
+    Returns:
+        _ProfileMatches_: _The profile of the image you uploaded, the matching profiles and their distances._
+    """
+    if k is None and max_distance is None:
+        max_distance = 0.6
+    current_profile = await read_profile(await file.read())
+    if current_profile is not None:
+        found_profiles, distances = await search_profiles(current_profile.embedding, response, k=k, max_distance=max_distance, nprobe=nprobe)
+        return ProfileMatches(current_profile=current_profile, found_profiles=found_profiles, distances=distances)
+    else:
+        raise HTTPException(status_code=400, detail="No face detected")
     
+@app.post("/find-face-profiles", response_model=List[FaceMatches], tags=["Profile Matching"])
+async def find_face_profiles(response: Response, file: UploadFile = File(...), k: Optional[int] = Query(None, ge=1, description="Maximum number of matches to return per face, all matches if omitted"), 
+                             max_distance: Optional[float] = Query(None, gt=0, description="Only return profiles closer than this embedding distance, 0.6 (the dlib same-person threshold) if k is also omitted"),
+                             nprobe: Optional[int] = Query(None, ge=1, description="Clusters to scan with the approximate index, higher is slower but more accurate")):
+    """
+    _Find the profiles matching every face in the image you upload, closest first.
+    On a coordinator every shard is searched for each face._
+
+    Args:
+        file (UploadFile, optional): _The image to find matching profiles of._ Defaults to File(...).
+        k (int, optional): _Maximum number of matches to return per face._ Defaults to Query(None).
+        max_distance (float, optional): _Maximum embedding distance of a match._ Defaults to Query(None).
+        nprobe (int, optional): _Recall/latency knob of the approximate index, ignored by the exact index._ Defaults to Query(None).
+
+    Raises:
+        HTTPException: _400 if no face is detected_
+
+    Returns:
+        _[FaceMatches]_: _For each face, its bounding box, its profile, the matching profiles and their distances._
+    """
+    if k is None and max_distance is None:
+        max_distance = 0.6
+    face_profiles = await executor.run(face_profiles_from_bytes, await file.read())
+    count_detections([face_profile.profile.detection for face_profile in face_profiles])
+    if face_profiles:
+        matches = []
+        for face_profile in face_profiles:
+            found_profiles, distances = await search_profiles(face_profile.profile.embedding, response, k=k, max_distance=max_distance, nprobe=nprobe)
+            matches.append(FaceMatches(box=face_profile.box, current_profile=face_profile.profile, found_profiles=found_profiles, distances=distances))
+        return matches
+    else:
+        raise HTTPException(status_code=400, detail="No face detected")
+    
+@app.post("/find-profiles-weighted", response_model=WeightedMatches, tags=["Profile Matching"])
+async def find_profiles_weighted(response: Response, file: UploadFile = File(...), weights: SearchWeights = Depends(),
+                                 k: int = Query(10, ge=1, description="Number of matches to return"),
+                                 shortlist: Optional[int] = Query(None, ge=1, description="Candidates taken from the embedding index before the other distances are computed, 10 times k if omitted"),
+                                 nprobe: Optional[int] = Query(None, ge=1, description="Clusters to scan with the approximate index, higher is slower but more accurate")):
+    """
+    _Find the profiles closest to the face in the image you upload by a weighted sum of the ProfileDistance components:
+    embedding, eyebrow, eye, nose, mouth and jaw shapes, and each artifact.
+    Candidates are shortlisted by embedding distance first, and only the shortlist is compared on shapes and artifacts.
+    On a coordinator every shard scores its own shortlist and the best matches are merged._
+
+    Args:
+        file (UploadFile, optional): _The image to find matching profiles of._ Defaults to File(...).
+        weights (SearchWeights, optional): _Weight of each component, embedding only by default._ Defaults to Depends().
+        k (int, optional): _Number of matches to return._ Defaults to Query(10).
+        shortlist (int, optional): _Number of candidates scored, more is slower but less likely to miss a match with a large embedding distance._ Defaults to Query(None).
+        nprobe (int, optional): _Recall/latency knob of the approximate index, ignored by the exact index._ Defaults to Query(None).
+
+    Raises:
+        HTTPException: _400 if no face is detected_
+
+    Returns:
+        _WeightedMatches_: _The profile of the image you uploaded and the best matches with their scores and distances, best first._
+    """
+    current_profile = await read_profile(await file.read())
+    if current_profile is not None:
+        if coordinator is not None:
+            matches, failed = await coordinator.weighted_search(current_profile, weights.dict(), k, shortlist, nprobe)
+            report_shards(response, failed)
+            matches = [WeightedMatch.parse_obj(match) for match in matches]
+        else:
+            matches = await search_gallery(weighted_search, current_profile, weights.dict(), k, shortlist, nprobe)
+        return WeightedMatches(current_profile=current_profile, matches=matches)
+    else:
+        raise HTTPException(status_code=400, detail="No face detected")
+
+def weighted_search(current_profile, weight_values, k=10, shortlist=None, nprobe=None):
+    rows, embedding_distances = embedding_index.search(current_profile.embedding, k=max(shortlist or 10 * k, k), nprobe=nprobe)
+    current_artifacts = [getattr(current_profile.artifacts, name) for name in ARTIFACT_FIELDS]
+    components = component_distances(profile_store, rows, current_profile.landmarks, current_artifacts, embedding_distances, band=dtw_band)
+    scores = weighted_scores(components, {component: weight_values[component] for component in ['embedding', *SHAPE_COMPONENTS]},
+                             [weight_values[name] for name in ARTIFACT_FIELDS])
+    matches = []
+    for i in np.argsort(scores, kind="stable")[:k]:
+        distance = ProfileDistance(artifacts_distance=Artifacts(**dict(zip(ARTIFACT_FIELDS, components['artifacts'][i].tolist()))),
+                                   embedding_distance=components['embedding'][i],
+                                   **{f"{component}_distance": components[component][i] for component in SHAPE_COMPONENTS})
+        matches.append(WeightedMatch(profile=profile_store.profile_at(rows[i]), score=scores[i], distance=distance))
+    return matches
+
 @app.post("/compare-profiles", response_model=ProfileDistance, tags=["Profile Matching"])
 async def compare_profiles(file1: UploadFile = File(...), file2: UploadFile = File(...)):
     """
@@ -285,49 +916,17 @@ async def compare_profiles(file1: UploadFile = File(...), file2: UploadFile = Fi
     Returns:
         _ProfileDistance_: _Distance between the two profiles._
     """
-    img1 = await get_image(file1)
-    img2 = await get_image(file2)
-    landmarks1 = get_landmarks(img1)
-    landmarks2 = get_landmarks(img2)
-    if landmarks1 is not None and landmarks2 is not None:
-        return calculate_distance(img1, img2, landmarks1, landmarks2)
+    profile1, profile2 = await asyncio.gather(read_profile(await file1.read()), read_profile(await file2.read()))
+    if profile1 is not None and profile2 is not None:
+        return calculate_distance(profile1, profile2, band=dtw_band)
     else:
         raise HTTPException(status_code=400, detail="No face detected")
 
-def calculate_distance(img1, img2, landmarks1, landmarks2): 
-    # embedding distance
-    embedding1 = np.array(get_face_embeddings(img1)[0])
-    embedding2 = np.array(get_face_embeddings(img2)[0])
-    embedding_distance = compare_faces(embedding1, embedding2)[1]
-    
-    # artifacts distance
-    lighting_inconsistency = abs(measure_lighting_inconsistency(img1) - measure_lighting_inconsistency(img2))
-    blur_measure = abs(measure_blur(img1) - measure_blur(img2))
-    asymmetry_score = abs(measure_asymmetry(img1, landmarks1) - measure_asymmetry(img2, landmarks2))
-    texture_score = abs(measure_skin_texture(img1) - measure_skin_texture(img2))
-    high_freq_artifacts = abs(measure_high_frequency_artifacts(img1) - measure_high_frequency_artifacts(img2))
-    gaze_direction = abs(measure_gaze_inconsistency(landmarks1) - measure_gaze_inconsistency(landmarks2))
-    artifacts_distance = Artifacts(lighting_inconsistency=lighting_inconsistency, blur_measure=blur_measure, asymmetry_score=asymmetry_score, 
-                                   texture_score=texture_score, high_freq_artifacts=high_freq_artifacts, gaze_direction=gaze_direction)
-    
-    # shape distance
-    shapes1 = extract_shapes(landmarks1)
-    shapes2 = extract_shapes(landmarks2)
-    eyebrow_distance = dtw_distance(shapes1['left_eyebrow'], shapes2['left_eyebrow']) + dtw_distance(shapes1['right_eyebrow'], shapes2['right_eyebrow'])
-    eye_distance = procrustes_analysis(shapes1['left_eye'], shapes2['left_eye']) + procrustes_analysis(shapes1['right_eye'], shapes2['right_eye'])
-    nose_distance = procrustes_analysis(shapes1['nose'], shapes2['nose'])
-    mouth_distance = procrustes_analysis(shapes1['mouth'], shapes2['mouth'])
-    jaw_distance = dtw_distance(shapes1['jaw'], shapes2['jaw'])
-    
-    distance = ProfileDistance(artifacts_distance=artifacts_distance, embedding_distance=embedding_distance, 
-                               eyebrow_distance=eyebrow_distance, eye_distance=eye_distance, nose_distance=nose_distance, mouth_distance=mouth_distance, jaw_distance=jaw_distance)
-    
-    return distance 
-
 @app.post("/find-closest-profile", response_model=ProfileMatch, tags=["Profile Matching"])
-async def find_closest_profile(file: UploadFile = File(...), feature: str = Query(..., description="Facial feature to compare ('right_eyebrow', 'left_eyebrow', 'right_eye', 'left_eye', 'nose', 'mouth', 'jaw')")):
+async def find_closest_profile(response: Response, file: UploadFile = File(...), feature: str = Query(..., description="Facial feature to compare ('right_eyebrow', 'left_eyebrow', 'right_eye', 'left_eye', 'nose', 'mouth', 'jaw')")):
     """
-    _Find the closest matching profile based on a specific facial feature._
+    _Find the closest matching profile based on a specific facial feature.
+    On a coordinator every shard is searched at once, as for /find-profile._
 
     Args:
         file (UploadFile, optional): _Image to find the closest profile to._ Defaults to File(...).
@@ -341,38 +940,248 @@ async def find_closest_profile(file: UploadFile = File(...), feature: str = Quer
     Returns:
         _ProfileMatch_: _The profile of the image you uploaded, the closest matching profile, and the distance between the two profiles._
     """
-    img = await get_image(file)
-    landmarks = get_landmarks(img)
-    if landmarks is not None:
-        shapes = extract_shapes(landmarks)
-        if feature not in shapes:
+    current_profile = await read_profile(await file.read())
+    if current_profile is not None:
+        if feature not in FEATURE_SLICES:
             raise HTTPException(status_code=401, detail="Invalid feature specified")
+        if coordinator is not None:
+            found_profiles, distances, failed = await coordinator.closest_by_feature(current_profile.landmarks, feature)
+            report_shards(response, failed)
+            if not found_profiles:
+                raise HTTPException(status_code=404, detail="No matching profile found")
+            return ProfileMatch(current_profile=current_profile, found_profile=Profile.parse_obj(found_profiles[0]), distance=distances[0])
         
-        current_shape = shapes[feature]
-        min_distance = float("inf")
-        closest_profile = None
-        for profile in profiles:
-            stored_shape = np.array(extract_shapes(profile.landmarks)[feature])
-            distance = dtw_distance(current_shape, stored_shape) if feature in ['left_eyebrow', 'right_eyebrow', 'jaw'] else procrustes_analysis(current_shape, stored_shape)
-            if distance < min_distance:
-                min_distance = distance
-                closest_profile = profile
-
-        if closest_profile is not None:
-            current_profile = create_profile_helper(img, landmarks)
-            return ProfileMatch(current_profile=current_profile, found_profile=closest_profile, distance=min_distance)
-        else:
+        closest = await search_gallery(closest_profile, current_profile.landmarks, feature)
+        if closest is None:
             raise HTTPException(status_code=404, detail="No matching profile found")
+        return ProfileMatch(current_profile=current_profile, found_profile=closest[0], distance=closest[1])
     else:
         raise HTTPException(status_code=400, detail="No face detected")
     
+def closest_profile(landmarks, feature):
+    # (profile, distance) of the stored profile whose feature is closest in shape, or None when the store is empty
+    rows = profile_store.live_rows()
+    if len(rows) == 0:
+        return None
+    # stored shapes are already normalized and DTW is lower-bounded, so the gallery is scanned in batches
+    closest_row, distance = closest_by_feature(profile_store, dtw_index, landmarks, feature, rows)
+    return profile_store.profile_at(closest_row), distance
+
+async def current_clusters(method=None, threshold=None, rebuild=False):
+    # the whole gallery is clustered from a snapshot outside the gallery lock; profiles added since are assigned on the next sync
+    global gallery_clusters
+    async with cluster_lock:
+        method = method.value if method is not None else gallery_clusters.method
+        threshold = threshold if threshold is not None else gallery_clusters.threshold
+        if method != gallery_clusters.method or threshold != gallery_clusters.threshold:
+            gallery_clusters = GalleryClusters(profile_store, embedding_index, threshold=threshold, method=method)
+        if rebuild or not gallery_clusters.built:
+            # a compaction while clustering renumbers the rows, then the new gallery is clustered
+            applied = False
+            while not applied:
+                snapshot = await in_gallery(gallery_clusters.snapshot)
+                labels = await asyncio.to_thread(gallery_clusters.compute, snapshot)
+                applied = await in_gallery(gallery_clusters.apply, snapshot, labels)
+        return gallery_clusters
+
+def profile_cluster(label, members, representative):
+    return ProfileCluster(cluster_id=label, size=len(members), representative=profile_store.profile_at(representative),
+                          profile_ids=sorted(profile_store.ids[members].tolist()))
+
+@app.get("/cluster-profiles", response_model=ProfileClusters, tags=["Profile Matching"])
+async def cluster_profiles(min_size: int = Query(2, ge=1, description="Only return clusters with at least this many profiles"),
+                           limit: int = Query(100, ge=1, description="Maximum number of clusters to return, largest first"),
+                           method: Optional[ClusterMethod] = Query(None, description="whispers or components, FACE_API_CLUSTER_METHOD if omitted"),
+                           threshold: Optional[float] = Query(None, gt=0, description="Embedding distance under which two profiles are linked, FACE_API_CLUSTER_THRESHOLD if omitted")):
+    """
+    _Group the stored profiles that appear to be the same person, without comparing images again.
+    Profiles closer than the threshold are linked and the links grouped into clusters. The gallery is clustered once,
+    in blocks of profiles so no N x N distance matrix is built, and profiles added later are assigned to the existing clusters.
+    A different method or threshold clusters the gallery again._
+
+    Args:
+        min_size (int, optional): _Only return clusters with at least this many profiles, 1 to include singletons._ Defaults to 2.
+        limit (int, optional): _Maximum number of clusters to return._ Defaults to 100.
+        method (ClusterMethod, optional): _whispers or components._ Defaults to None.
+        threshold (float, optional): _Link distance._ Defaults to None.
+
+    Returns:
+        _ProfileClusters_: _The clusters, largest first, each with its representative profile and member ids._
+
+    Raises:
+        HTTPException: _501 on a coordinator, clusters are kept per shard_
+    """
+    require_local_gallery("Clustering")
+    clusters = await current_clusters(method, threshold)
+    return await in_gallery(list_clusters, clusters, min_size, limit)
+
+def list_clusters(clusters, min_size, limit):
+    found = clusters.clusters(min_size)
+    return ProfileClusters(method=clusters.method, threshold=clusters.threshold, profiles=len(profile_store), clusters_total=len(found),
+                           clusters=[profile_cluster(*cluster) for cluster in found[:limit]])
+
+@app.get("/profile-cluster/{profile_id}", response_model=ProfileCluster, tags=["Profile Matching"])
+async def get_profile_cluster(profile_id: int):
+    """
+    _Get the cluster of one stored profile: the other profiles that appear to be the same person._
+
+    Args:
+        profile_id (int): _The id of the profile._
+
+    Raises:
+        HTTPException: _404 if the profile is not found_
+        HTTPException: _501 on a coordinator, clusters are kept per shard_
+
+    Returns:
+        _ProfileCluster_: _The cluster of the profile._
+    """
+    require_local_gallery("Clustering")
+    clusters = await current_clusters()
+    cluster = await in_gallery(cluster_of_profile, clusters, profile_id)
+    if cluster is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return cluster
+
+def cluster_of_profile(clusters, profile_id):
+    cluster = clusters.cluster_of(profile_id)
+    return profile_cluster(*cluster) if cluster is not None else None
+
+@app.post("/rebuild-clusters", tags=["Profile Matching"])
+async def rebuild_clusters():
+    """
+    _Cluster the whole gallery again. Profiles added since the last clustering were only assigned to existing clusters,
+    which never splits a cluster; after many changes a full clustering may group them better._
+
+    Raises:
+        HTTPException: _501 on a coordinator, clusters are kept per shard_
+    """
+    require_local_gallery("Clustering")
+    await current_clusters(rebuild=True)
+
+@app.get("/find-duplicates", response_model=List[DuplicatePair], tags=["Profile Matching"])
+async def find_duplicates(max_distance: float = Query(0.2, gt=0, le=0.6, description="Embedding distance under which two profiles are near-duplicates, at most the same-person threshold of 0.6"),
+                          limit: int = Query(1000, ge=1, description="Maximum number of pairs to return, closest first")):
+    """
+    _Find pairs of stored profiles with nearly identical embeddings, such as the same image or video frame enrolled twice.
+    Distances are computed in blocks of profiles, so no N x N distance matrix is built._
+
+    Args:
+        max_distance (float, optional): _Embedding distance under which two profiles are near-duplicates, up to 0.6; larger ones would pair up most of the gallery._ Defaults to 0.2.
+        limit (int, optional): _Maximum number of pairs to return._ Defaults to 1000.
+
+    Raises:
+        HTTPException: _501 on a coordinator, pairs across shards are not compared_
+
+    Returns:
+        _[DuplicatePair]_: _The ids of each pair of near-duplicates and their distance, closest first._
+    """
+    require_local_gallery("Duplicate search")
+    # the distances are computed outside the gallery lock, on a copy of the live embeddings
+    async with gallery():
+        rows = profile_store.live_rows()
+        embeddings, ids = profile_store.embeddings[rows], profile_store.ids[rows]
+    first, second, distances = await asyncio.to_thread(threshold_edges, embeddings, max_distance)
+    order = np.argsort(distances, kind="stable")[:limit]
+    return [DuplicatePair(profile_ids=[int(ids[first[i]]), int(ids[second[i]])], distance=float(distances[i])) for i in order]
+
+@app.post("/shard/find-profiles", response_model=ShardMatches, tags=["Sharding"])
+async def shard_find_profiles(query: ShardQuery):
+    """
+    _Search the profiles of this shard by embedding, for a coordinator that computed the query profile once._
+
+    Args:
+        query (ShardQuery): _The query embedding, k, max_distance and nprobe, as for /find-profiles._
+
+    Returns:
+        _ShardMatches_: _The matching profiles of this shard and their distances, closest first._
+    """
+    return Response(dumps(await search_gallery(shard_search, query)), media_type="application/json")
+
+def shard_search(query):
+    rows, distances = embedding_index.search(query.embedding, k=query.k, max_distance=query.max_distance, nprobe=query.nprobe)
+    return {"found_profiles": profile_dicts(profile_store, rows), "distances": distances.tolist()}
+
+@app.post("/shard/find-closest-profile", response_model=ShardMatches, tags=["Sharding"])
+async def shard_find_closest_profile(query: ShardFeatureQuery):
+    """
+    _Find the profile of this shard whose facial feature is closest in shape to the query landmarks._
+
+    Args:
+        query (ShardFeatureQuery): _The query landmarks and the feature to compare, as for /find-closest-profile._
+
+    Raises:
+        HTTPException: _401 if an invalid feature is specified_
+
+    Returns:
+        _ShardMatches_: _The closest profile of this shard and its distance, or no match when the shard is empty._
+    """
+    if query.feature not in FEATURE_SLICES:
+        raise HTTPException(status_code=401, detail="Invalid feature specified")
+    closest = await search_gallery(closest_profile, query.landmarks, query.feature)
+    if closest is None:
+        return ShardMatches(found_profiles=[], distances=[])
+    return ShardMatches(found_profiles=[closest[0]], distances=[float(closest[1])])
+
+@app.post("/shard/find-profiles-weighted", response_model=ShardWeightedMatches, tags=["Sharding"])
+async def shard_find_profiles_weighted(query: ShardWeightedQuery):
+    """
+    _Find the best weighted matches among the profiles of this shard, for a coordinator that computed the query profile once._
+
+    Args:
+        query (ShardWeightedQuery): _The query profile, weights, k, shortlist and nprobe, as for /find-profiles-weighted._
+
+    Returns:
+        _ShardWeightedMatches_: _The best matches of this shard with their scores and distances, best first._
+    """
+    matches = await search_gallery(weighted_search, query.profile, query.weights.dict(), query.k, query.shortlist, query.nprobe)
+    return ShardWeightedMatches(matches=matches)
+
+@app.post("/shard/artifact-scores", tags=["Sharding"])
+async def shard_artifact_scores(artifacts: Artifacts):
+    """
+    _This shard's share of the scores of measured artifacts, which a coordinator merges over the shards._
+
+    Args:
+        artifacts (Artifacts): _The measured artifacts._
+
+    Returns:
+        _dict_: _"count", "mean" and "variance" of the stored artifacts, and the "percentiles" of the measured ones among them._
+    """
+    async with gallery():
+        return population.part_scores([getattr(artifacts, name) for name in ARTIFACT_FIELDS])
+
+@app.get("/shard/artifact-population", tags=["Sharding"])
+async def shard_artifact_population():
+    """
+    _The artifact statistics of this shard in mergeable form, for a coordinator's /artifact-statistics._
+
+    Returns:
+        _dict_: _"count", "mean" and "variance" of the stored artifacts, and the bucket counts of each quantile sketch._
+    """
+    async with gallery():
+        return population.state()
+
+@app.post("/shard/add-profile", response_model=int, tags=["Sharding"])
+async def shard_add_profile(profile: Profile):
+    """
+    _Store a profile computed by a coordinator on this shard, under a new id of the shard's stride._
+
+    Args:
+        profile (Profile): _The profile to store, its id is ignored._
+
+    Returns:
+        _int_: _The id of the stored profile._
+    """
+    await store_profile(profile)
+    return profile.id
 
-@app.post("/measure-artifacts", response_model=Artifacts, tags=["Profile Matching"])
+@app.post("/measure-artifacts", response_model=ScoredArtifacts, tags=["Profile Matching"])
 async def measure_artifacts(file: UploadFile = File(...)):
     """
     _Measure artifacts in the image you upload.
     Artifacts are chosen based on their prevalence in
-    deepfaked photos._
+    deepfaked photos. Scores give the z-score and percentile
+    of each artifact among the stored profiles._
 
     Args:
         file (UploadFile, optional): The image to analyze the artifacts in. Defaults to File(...).
@@ -381,16 +1190,63 @@ async def measure_artifacts(file: UploadFile = File(...)):
         HTTPException: _400 if no face is detected_
 
     Returns:
-        _Artifacts_: _The artifacts in the image._
+        _ScoredArtifacts_: _The artifacts in the image and their scores, None while no profile is stored._
+    """
+    profile = await read_profile(await file.read())
+    if profile is not None:
+        return ScoredArtifacts(**profile.artifacts.dict(), scores=await score_artifacts(profile.artifacts))
+    else:
+        raise HTTPException(status_code=400, detail="No face detected")
+    
+@app.post("/measure-face-artifacts", response_model=List[FaceArtifacts], tags=["Profile Matching"])
+async def measure_face_artifacts(file: UploadFile = File(...)):
+    """
+    _Measure artifacts for every face in the image you upload.
+    Each face is measured on its own region of the image._
+
+    Args:
+        file (UploadFile, optional): _The image to analyze the artifacts in._ Defaults to File(...).
+
+    Raises:
+        HTTPException: _400 if no face is detected_
+
+    Returns:
+        _[FaceArtifacts]_: _The bounding box, artifacts and artifact scores of each face in the image._
     """
-    img = await get_image(file)
-    landmarks = get_landmarks(img)
-    if landmarks is not None:
-        artifact_scores = get_artifacts(img, landmarks)
-        return artifact_scores
+    face_artifacts = await executor.run(face_artifacts_from_bytes, await file.read())
+    count_detections([face.detection for face in face_artifacts])
+    if face_artifacts:
+        for face in face_artifacts:
+            face.artifact_scores = await score_artifacts(face.artifacts)
+        return face_artifacts
     else:
         raise HTTPException(status_code=400, detail="No face detected")
     
+@app.get("/artifact-statistics", response_model=PopulationStatistics, tags=["Profile Matching"])
+async def artifact_statistics(response: Response):
+    """
+    _Get the artifact statistics of the stored profiles that uploads are scored against.
+    They are updated as profiles are stored and deleted, without rescanning the gallery;
+    on a coordinator each shard keeps the statistics of its own profiles and they are merged over the shards that answer._
+
+    Returns:
+        _PopulationStatistics_: _Number of profiles, mean, standard deviation and quantiles of each artifact._
+    """
+    if coordinator is not None:
+        parts, failed = await coordinator.fan_out("GET", "/shard/artifact-population")
+        report_shards(response, failed)
+        summary = merge_summary(list(parts.values()), population.relative_accuracy)
+    else:
+        async with gallery():
+            summary = population.summary()
+    quantiles = {}
+    if summary["count"]:
+        for i, q in enumerate(SUMMARY_QUANTILES):
+            quantiles[f"{q:g}"] = Artifacts(**{name: values[i] for name, values in zip(ARTIFACT_FIELDS, summary["quantiles"])})
+    return PopulationStatistics(profiles=summary["count"], relative_accuracy=population.relative_accuracy,
+                                mean=Artifacts(**dict(zip(ARTIFACT_FIELDS, summary["mean"]))),
+                                std=Artifacts(**dict(zip(ARTIFACT_FIELDS, summary["std"]))), quantiles=quantiles)
+
 @app.post("/show-landmarks", tags=["Profile Matching"])
 async def show_landmarks(file: UploadFile = File(...)):
     """
@@ -405,32 +1261,215 @@ async def show_landmarks(file: UploadFile = File(...)):
     Returns:
         _StreamingResponse_: _Image with facial landmarks drawn on top._
     """
-    img = await get_image(file)
-    landmarks = get_landmarks(img)
-    if landmarks is not None:
-        img_with_landmarks = draw_landmarks(img, landmarks)
-        _, img_encoded = cv2.imencode('.png', img_with_landmarks)
-        return StreamingResponse(BytesIO(img_encoded.tobytes()), media_type="image/png")
+    data = await file.read()
+    profile = await read_profile(data)
+    if profile is not None:
+        img_encoded = await executor.run(landmarks_png_from_bytes, data, profile.landmarks)
+        return StreamingResponse(BytesIO(img_encoded), media_type="image/png")
     else:
         raise HTTPException(status_code=400, detail="No face detected")
 
-def get_artifacts(img, landmarks):
-    return Artifacts(
-            lighting_inconsistency=measure_lighting_inconsistency(img),
-            blur_measure=measure_blur(img),
-            asymmetry_score=measure_asymmetry(img, landmarks),
-            texture_score=measure_skin_texture(img),
-            high_freq_artifacts=measure_high_frequency_artifacts(img),
-            gaze_direction=measure_gaze_inconsistency(landmarks)
-        
-        )
-    
-def create_profile_helper(img, landmarks):
-    profile_description = create_profile_description(img, landmarks)
-    embedding = get_face_embeddings(img)[0]
-    artifacts = get_artifacts(img, landmarks)
-    # print the type of landmarks for debugging purposes
-    return Profile(description=profile_description, embedding=embedding.tolist(), artifacts=artifacts, landmarks=landmarks.tolist())
+async def measure_artifacts_results(chunk, start, job_id=None):
+    # one {"index", "filename", "faces"} or {"index", "filename", "error"} dict per image of the chunk
+    results = await asyncio.gather(*(executor.run(face_artifacts_from_bytes, data, wait=True) for _, data in chunk), return_exceptions=True)
+    lines = []
+    for offset, ((filename, _), faces) in enumerate(zip(chunk, results)):
+        line = {"index": start + offset, "filename": filename}
+        if isinstance(faces, ImageDecodeError):
+            line["error"] = str(faces)
+        elif isinstance(faces, Exception):
+            line["error"] = "Could not process image"
+        elif not faces:
+            count_detections([])
+            line["error"] = "No face detected"
+        else:
+            count_detections([face.detection for face in faces])
+            line["faces"] = [face.dict() for face in faces]
+        lines.append(line)
+    return lines
+
+# background jobs need a job directory shared by the worker processes; without one the job endpoints answer 503
+job_queue = JobQueue(os.path.join(settings.job_dir, "jobs.sqlite3")) if settings.job_dir else None
+job_runner = JobRunner(job_queue, {JobKind.create_profiles.value: ingest_results, JobKind.measure_artifacts.value: measure_artifacts_results},
+                       workers=settings.job_workers, lease=settings.job_lease, chunk_size=settings.batch_chunk_size or executor.max_workers) if job_queue is not None else None
+
+def require_jobs():
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Background jobs are disabled, set FACE_API_JOB_DIR to enable them")
+
+def job_input_path():
+    # uploads waiting in the queue are kept next to it, so any worker process can run the job
+    directory = os.path.join(settings.job_dir, "inputs")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, uuid.uuid4().hex)
+
+async def submit_job(kind, path):
+    job_id = await asyncio.to_thread(job_queue.submit, kind.value, path, settings.job_attempts)
+    job_runner.notify()
+    return Job(**await asyncio.to_thread(job_queue.get, job_id))
+
+@app.post("/jobs/{kind}", response_model=Job, tags=["Jobs"])
+async def submit_job_files(kind: JobKind, files: List[UploadFile] = File(...)):
+    """
+    _Run create-profiles or measure-artifacts over the images you upload as a background job, and return at once.
+    The images are written to the job queue, so the job survives restarts and runs on any worker process.
+    Follow it with /jobs/{job_id} and read its results with /jobs/{job_id}/results while it runs._
+
+    Args:
+        kind (JobKind): _create-profiles to store a profile per image, measure-artifacts to measure the artifacts of every face._
+        files (List[UploadFile], optional): _The images._ Defaults to File(...).
+
+    Raises:
+        HTTPException: _503 if background jobs are disabled_
+
+    Returns:
+        _Job_: _The queued job._
+    """
+    require_jobs()
+    path = job_input_path()
+    # the uploads are stored as an uncompressed tar, the same input as an archive job
+    with tarfile.open(path, "w") as archive:
+        for index, file in enumerate(files):
+            data = await file.read()
+            info = tarfile.TarInfo(os.path.basename(file.filename or "") or str(index))
+            info.size = len(data)
+            archive.addfile(info, BytesIO(data))
+    return await submit_job(kind, path)
+
+@app.post("/jobs/{kind}/archive", response_model=Job, tags=["Jobs"])
+async def submit_job_archive(kind: JobKind, request: Request):
+    """
+    _Like /jobs/{kind} for the images of a zip or tar archive sent as the raw request body, which is streamed to the job queue._
+
+    Args:
+        kind (JobKind): _create-profiles or measure-artifacts._
+        request (Request): _Request whose body is a zip, tar, tar.gz or tar.bz2 archive of images._
+
+    Raises:
+        HTTPException: _400 if the body is not a zip or tar archive_
+        HTTPException: _503 if background jobs are disabled_
+
+    Returns:
+        _Job_: _The queued job._
+    """
+    require_jobs()
+    path = job_input_path()
+    with open(path, "wb") as f:
+        async for chunk in request.stream():
+            f.write(chunk)
+    try:
+        with open(path, "rb") as f:
+            next(iter_archive_images(f), None)
+    except Exception:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail="Body is not a zip or tar archive")
+    return await submit_job(kind, path)
+
+@app.get("/jobs", response_model=List[Job], tags=["Jobs"])
+async def list_jobs(status: Optional[JobStatus] = Query(None, description="Only list jobs with this status"),
+                    limit: int = Query(100, ge=1, description="Maximum number of jobs to return")):
+    """
+    _List background jobs, most recent first._
+
+    Args:
+        status (JobStatus, optional): _Only list jobs with this status._ Defaults to None.
+        limit (int, optional): _Maximum number of jobs to return._ Defaults to 100.
+
+    Raises:
+        HTTPException: _503 if background jobs are disabled_
+
+    Returns:
+        _[Job]_: _The jobs and their progress._
+    """
+    require_jobs()
+    return [Job(**job) for job in await asyncio.to_thread(job_queue.list, status.value if status is not None else None, limit)]
+
+@app.get("/jobs/{job_id}", response_model=Job, tags=["Jobs"])
+async def get_job(job_id: int):
+    """
+    _Get the status and progress of a background job._
+
+    Args:
+        job_id (int): _The id of the job._
+
+    Raises:
+        HTTPException: _404 if the job is not found_
+        HTTPException: _503 if background jobs are disabled_
+
+    Returns:
+        _Job_: _The job._
+    """
+    require_jobs()
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return Job(**job)
+
+@app.get("/jobs/{job_id}/results", tags=["Jobs"])
+async def get_job_results(job_id: int, offset: int = Query(0, ge=0, description="Index of the first image to return the result of"),
+                          limit: Optional[int] = Query(None, ge=1, description="Maximum number of results to return, all of them if omitted")):
+    """
+    _Get the per-image results a background job recorded so far, in image order.
+    Results are recorded a chunk of images at a time, so they can be read while the job runs._
+
+    Args:
+        job_id (int): _The id of the job._
+        offset (int, optional): _Index of the first image._ Defaults to 0.
+        limit (int, optional): _Maximum number of results._ Defaults to None.
+
+    Raises:
+        HTTPException: _404 if the job is not found_
+        HTTPException: _503 if background jobs are disabled_
+
+    Returns:
+        _[dict]_: _{"index", "filename"} with "id" (create-profiles), "faces" (measure-artifacts) or "error", per image.
+        An image whose profile is being stored is briefly marked "pending"._
+    """
+    require_jobs()
+    if await asyncio.to_thread(job_queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await asyncio.to_thread(job_queue.results, job_id, offset, limit)
+
+@app.post("/jobs/{job_id}/cancel", response_model=Job, tags=["Jobs"])
+async def cancel_job(job_id: int):
+    """
+    _Cancel a background job. A queued job is cancelled at once, a running one after its current chunk of images;
+    the results recorded until then are kept. Finished jobs are left as they are._
+
+    Args:
+        job_id (int): _The id of the job._
+
+    Raises:
+        HTTPException: _404 if the job is not found_
+        HTTPException: _503 if background jobs are disabled_
+
+    Returns:
+        _Job_: _The job, with cancel_requested set._
+    """
+    require_jobs()
+    job = await asyncio.to_thread(job_queue.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return Job(**job)
+
+@app.delete("/jobs/{job_id}", tags=["Jobs"])
+async def delete_job(job_id: int):
+    """
+    _Delete a finished background job and its results._
+
+    Args:
+        job_id (int): _The id of the job._
+
+    Raises:
+        HTTPException: _404 if the job is not found_
+        HTTPException: _409 if the job is queued or running_
+        HTTPException: _503 if background jobs are disabled_
+    """
+    require_jobs()
+    if await asyncio.to_thread(job_queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await asyncio.to_thread(job_queue.delete, job_id):
+        raise HTTPException(status_code=409, detail="Job is not finished, cancel it first")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,120 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# stage timings of the pipeline call running in this context, set by traced()
+_trace = contextvars.ContextVar("trace", default=None)
+# stage timings of the HTTP request being served, for the Server-Timing header
+request_stages = contextvars.ContextVar("request_stages", default=None)
+
+class Metrics:
+    """
+    Counters, histograms and gauges of one process, rendered in the Prometheus text format.
+    Metrics are created on first use; labels are keyword arguments.
+    """
+    def __init__(self):
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._readers = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help):
+        self._help[name] = (kind, help)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = (buckets, [0] * (len(buckets) + 1), [0.0])
+            histogram[1][bisect.bisect_left(buckets, value)] += 1
+            histogram[2][0] += value
+
+    def gauge(self, name, help, read):
+        # read() is called at render time and returns the current value
+        self.describe(name, "gauge", help)
+        self._readers[name] = read
+
+    def counter(self, name, help, read):
+        # a count kept elsewhere (e.g. by the result cache) that only grows, read at render time like a gauge
+        self.describe(name, "counter", help)
+        self._readers[name] = read
+
+    def render(self):
+        lines = []
+        with self._lock:
+            series = {}
+            for (name, labels), value in self._counters.items():
+                series.setdefault(name, []).append(_sample(name, labels, value))
+            for (name, labels), (buckets, counts, total) in self._histograms.items():
+                samples = series.setdefault(name, [])
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], counts):
+                    cumulative += count
+                    samples.append(_sample(name + "_bucket", labels + (("le", str(bound)),), cumulative))
+                samples.append(_sample(name + "_sum", labels, total[0]))
+                samples.append(_sample(name + "_count", labels, cumulative))
+        for name, read in self._readers.items():
+            series[name] = [_sample(name, (), read())]
+        for name in sorted(series):
+            kind, help = self._help.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(series[name])
+        return "\n".join(lines) + "\n"
+
+def _sample(name, labels, value):
+    if labels:
+        pairs = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+        return f"{name}{{{pairs}}} {value}"
+    return f"{name} {value}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metrics = Metrics()
+metrics.describe("face_api_requests_total", "counter", "HTTP requests by route, method and status")
+metrics.describe("face_api_request_duration_seconds", "histogram", "HTTP request latency by route")
+metrics.describe("face_api_stage_duration_seconds", "histogram", "Latency of each image pipeline stage")
+metrics.describe("face_api_detections_total", "counter", "Faces found by each detection path, \"tracked\" for video tracks")
+metrics.describe("face_api_rejected_total", "counter", "Pipeline calls refused because the executor was saturated")
+metrics.describe("face_api_shard_failures_total", "counter", "Shard calls of a coordinator that timed out or failed, by shard")
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage into the trace of the current call. Costs nothing outside traced().
+    """
+    trace = _trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.append((name, time.perf_counter() - start))
+
+def traced(fn, *args):
+    # run fn(*args) and return its result with the stage timings recorded meanwhile; picklable for worker processes
+    token = _trace.set([])
+    try:
+        return fn(*args), _trace.get()
+    finally:
+        _trace.reset(token)
+
+def record_stages(trace):
+    # back in the server process: feed the histograms and the current request's Server-Timing
+    stages = request_stages.get()
+    for name, seconds in trace:
+        metrics.observe("face_api_stage_duration_seconds", seconds, stage=name)
+        if stages is not None:
+            stages.append((name, seconds))
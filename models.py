@@ -0,0 +1,305 @@
+from enum import Enum
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+class Artifacts(BaseModel):
+    """
+    Stores data about how many artifacts are present in an image.
+    These artifacts are often highly present in deepfaked images,
+    so loooking at their prevalence in an image relative to the average
+    amounts in a dataset can be useful in deepfake detection.
+    """
+    lighting_inconsistency: float
+    blur_measure: float
+    asymmetry_score: float
+    texture_score: float
+    high_freq_artifacts: float
+    gaze_direction: float
+
+class ArtifactScores(BaseModel):
+    """
+    Standing of artifact measurements among the stored profiles: population is the number of profiles compared
+    against, z_scores the distance of each metric from the population mean in standard deviations, and
+    percentiles the percentage (0 to 100) of stored profiles with a lower value. Unusual values on several
+    metrics at once are a stronger deepfake signal than any single measurement.
+    """
+    population: int
+    z_scores: Artifacts
+    percentiles: Artifacts
+
+class ScoredArtifacts(Artifacts):
+    """
+    Artifacts with their scores against the stored profiles, None while no profile is stored.
+    """
+    scores: Optional[ArtifactScores] = None
+    
+class Profile(BaseModel):
+    """
+    Represents a profile of a face.
+    Has an integer identifier, text description, face embedding, artifacts, and landmarks.
+    Landmarks are produced by dlib shape predictor model.
+    Text description is calculated based on landmarks.
+    Artifacts are calculated using OpenCV methods.
+    Detection tells which face detection path found the face ("downscaled", "upsampled", "unscaled" or "full"),
+    or "tracked" for the aggregated profile of a video track; it is only set on profiles computed from an upload.
+    Artifact scores rank the artifacts against the stored profiles, see ArtifactScores; they are set on the profiles
+    returned by the profile endpoints, not in lists and search results.
+    """
+    id: int = -1
+    description: str
+    embedding: List[float]
+    artifacts: Artifacts
+    landmarks: List[List[int]]
+    detection: Optional[str] = None
+    artifact_scores: Optional[ArtifactScores] = None
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": 1,
+                "description": "Face with high cheekbones, square shape, and blue eyes.",
+                "embedding": [0.1, 0.2, 0.3],
+                "artifacts": {
+                    "lighting_inconsistency": 0.1,
+                    "blur_measure": 0.2,
+                    "asymmetry_score": 0.3,
+                    "texture_score": 0.4,
+                    "high_freq_artifacts": 0.5,
+                    "gaze_direction": 0.6
+                },
+                "landmarks": [[0, 0], [1, 1], [2, 2]]
+            }
+        }
+    
+class ProfileFormat(str, Enum):
+    """
+    How stored profiles are returned: "full" is the Profile JSON, "slim" leaves out the embedding and landmarks,
+    "binary" sends them as base64 strings of little-endian float16 (128 values) and int16 (68 x 2 values) arrays.
+    """
+    full = "full"
+    slim = "slim"
+    binary = "binary"
+
+class ProfileMatch(BaseModel):
+    current_profile: Profile
+    found_profile: Profile
+    distance: float
+    
+class ProfileMatches(BaseModel):
+    current_profile: Profile
+    found_profiles: List[Profile]
+    distances: List[float]
+    
+class ProfileDistance(BaseModel):
+    artifacts_distance: Artifacts
+    embedding_distance: float
+    eyebrow_distance: float
+    eye_distance: float
+    nose_distance: float
+    mouth_distance: float
+    jaw_distance: float
+
+class SearchWeights(BaseModel):
+    """
+    Weight of each ProfileDistance component in a compound search score.
+    The components have very different scales (an embedding distance is around 0.5, a blur
+    difference can be in the thousands), so the weights also normalize them.
+    """
+    embedding: float = 1.0
+    eyebrow: float = 0.0
+    eye: float = 0.0
+    nose: float = 0.0
+    mouth: float = 0.0
+    jaw: float = 0.0
+    lighting_inconsistency: float = 0.0
+    blur_measure: float = 0.0
+    asymmetry_score: float = 0.0
+    texture_score: float = 0.0
+    high_freq_artifacts: float = 0.0
+    gaze_direction: float = 0.0
+
+class WeightedMatch(BaseModel):
+    profile: Profile
+    score: float
+    distance: ProfileDistance
+
+class WeightedMatches(BaseModel):
+    current_profile: Profile
+    matches: List[WeightedMatch]
+
+class BoundingBox(BaseModel):
+    """
+    Pixel coordinates of a detected face in the uploaded image.
+    """
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+class FaceProfile(BaseModel):
+    box: BoundingBox
+    profile: Profile
+
+class FaceArtifacts(BaseModel):
+    box: BoundingBox
+    artifacts: Artifacts
+    detection: Optional[str] = None
+    artifact_scores: Optional[ArtifactScores] = None
+
+class FaceMatches(BaseModel):
+    box: BoundingBox
+    current_profile: Profile
+    found_profiles: List[Profile]
+    distances: List[float]
+
+class ArtifactStatistics(BaseModel):
+    """
+    Artifact measurements of one face over the frames of a track.
+    Temporal change is the mean absolute difference between consecutive frames: real faces change
+    smoothly, while many deepfakes flicker from frame to frame.
+    """
+    mean: Artifacts
+    std: Artifacts
+    min: Artifacts
+    max: Artifacts
+    temporal_change: Artifacts
+
+class TrackProfile(BaseModel):
+    """
+    One face followed through a video or a sequence of frames.
+    The profile aggregates the track: its embedding is the mean of the track's descriptors, its artifacts
+    the mean over its frames, its landmarks and description come from its sharpest frame, where box is.
+    Landmark jitter is the mean landmark movement between consecutive frames relative to the face width.
+    """
+    track_id: int
+    first_frame: int
+    last_frame: int
+    frames: int
+    keyframes: int
+    descriptors: int
+    box: BoundingBox
+    profile: Profile
+    artifact_statistics: ArtifactStatistics
+    landmark_jitter: float
+
+class VideoProfiles(BaseModel):
+    frames: int
+    keyframes: int
+    fps: Optional[float] = None
+    tracks: List[TrackProfile]
+
+class ShardQuery(BaseModel):
+    """
+    Embedding search sent by a coordinator to every shard; the coordinator computes the query profile once.
+    """
+    embedding: List[float]
+    k: Optional[int] = None
+    max_distance: Optional[float] = None
+    nprobe: Optional[int] = None
+
+class ShardFeatureQuery(BaseModel):
+    """
+    Facial feature search sent by a coordinator to every shard.
+    """
+    landmarks: List[List[int]]
+    feature: str
+
+class ShardMatches(BaseModel):
+    """
+    The matches of one shard, closest first.
+    """
+    found_profiles: List[Profile]
+    distances: List[float]
+
+class ShardWeightedQuery(BaseModel):
+    """
+    Weighted search sent by a coordinator to every shard, with the query profile it computed once.
+    """
+    profile: Profile
+    weights: SearchWeights
+    k: int = 10
+    shortlist: Optional[int] = None
+    nprobe: Optional[int] = None
+
+class ShardWeightedMatches(BaseModel):
+    """
+    The weighted matches of one shard, best first.
+    """
+    matches: List[WeightedMatch]
+
+class JobKind(str, Enum):
+    """
+    Background job kinds: "create-profiles" stores a profile for each image, like /create-profiles,
+    "measure-artifacts" measures the artifacts of every face in each image, like /measure-face-artifacts.
+    """
+    create_profiles = "create-profiles"
+    measure_artifacts = "measure-artifacts"
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
+class Job(BaseModel):
+    """
+    A background job and its progress. total is the number of images, known once the job starts;
+    done counts the images processed so far, of which errors failed (e.g. no face detected).
+    attempts counts the runs of the job, which is retried up to max_attempts times when it fails as a whole;
+    error is the last error that made it retry or fail.
+    Times are Unix timestamps.
+    """
+    id: int
+    kind: JobKind
+    status: JobStatus
+    total: Optional[int] = None
+    done: int = 0
+    errors: int = 0
+    attempts: int = 0
+    max_attempts: int
+    cancel_requested: bool = False
+    error: Optional[str] = None
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+class ClusterMethod(str, Enum):
+    """
+    How profiles linked by an embedding distance under the threshold are grouped: "whispers" (Chinese whispers),
+    which keeps a few borderline links from chaining different people together, or connected "components".
+    """
+    whispers = "whispers"
+    components = "components"
+
+class ProfileCluster(BaseModel):
+    """
+    Profiles of the gallery that appear to be the same person. The representative is the member closest to the
+    mean embedding of the cluster.
+    """
+    cluster_id: int
+    size: int
+    representative: Profile
+    profile_ids: List[int]
+
+class ProfileClusters(BaseModel):
+    method: ClusterMethod
+    threshold: float
+    profiles: int
+    clusters_total: int
+    clusters: List[ProfileCluster]
+
+class DuplicatePair(BaseModel):
+    profile_ids: List[int]
+    distance: float
+
+class PopulationStatistics(BaseModel):
+    """
+    Artifact statistics of the stored profiles, kept up to date as profiles are stored and deleted.
+    quantiles maps each quantile (0.01 to 0.99) to the metric values at it, within the sketch's relative accuracy.
+    """
+    profiles: int
+    relative_accuracy: float
+    mean: Artifacts
+    std: Artifacts
+    quantiles: Dict[str, Artifacts]
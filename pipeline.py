@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+
+from models import Artifacts, Profile, ProfileDistance, BoundingBox, FaceProfile, FaceArtifacts, ArtifactStatistics, TrackProfile, VideoProfiles
+from utils import analyze_face, analyze_faces, compute_embeddings, decode_image, draw_landmarks, compare_faces, extract_shapes, procrustes_analysis, dtw_distance, iter_video_frames, video_fps
+from features import create_profile_description
+from detectors import measure_face_artifacts
+from tracking import FaceTracker, landmark_box
+from config import settings
+from metrics import stage
+
+# bump when the values computed here change, so results cached by older code are not reused
+PIPELINE_VERSION = 4
+
+def get_artifacts(analysis):
+    # one fused pass over the face region of the grayscale plane computed during detection
+    with stage("artifacts"):
+        return Artifacts(**measure_face_artifacts(analysis.gray, analysis.landmarks, margin=settings.artifact_margin, size=settings.artifact_size))
+    
+def create_profile_helper(analysis):
+    with stage("description"):
+        profile_description = create_profile_description(analysis.image, analysis.landmarks)
+    embedding = analysis.embedding
+    artifacts = get_artifacts(analysis)
+    return Profile(description=profile_description, embedding=embedding.tolist(), artifacts=artifacts, landmarks=analysis.landmarks.tolist(), detection=analysis.detection)
+
+def get_box(analysis):
+    rect = analysis.rect
+    return BoundingBox(left=rect.left(), top=rect.top(), right=rect.right(), bottom=rect.bottom())
+
+def calculate_distance(profile1, profile2, band=None): 
+    # profiles rather than images, so cached or stored profiles are compared without running the models;
+    # band is the DTW band of the eyebrows and jaw, pass the one the searches use so every endpoint agrees
+    # embedding distance
+    embedding_distance = compare_faces(np.asarray(profile1.embedding), np.asarray(profile2.embedding))[1]
+    
+    # artifacts distance
+    artifacts_distance = Artifacts(**{name: abs(value - getattr(profile2.artifacts, name)) for name, value in profile1.artifacts.dict().items()})
+    
+    # shape distance
+    shapes1 = extract_shapes(np.asarray(profile1.landmarks))
+    shapes2 = extract_shapes(np.asarray(profile2.landmarks))
+    eyebrow_distance = dtw_distance(shapes1['left_eyebrow'], shapes2['left_eyebrow'], band) + dtw_distance(shapes1['right_eyebrow'], shapes2['right_eyebrow'], band)
+    eye_distance = procrustes_analysis(shapes1['left_eye'], shapes2['left_eye']) + procrustes_analysis(shapes1['right_eye'], shapes2['right_eye'])
+    nose_distance = procrustes_analysis(shapes1['nose'], shapes2['nose'])
+    mouth_distance = procrustes_analysis(shapes1['mouth'], shapes2['mouth'])
+    jaw_distance = dtw_distance(shapes1['jaw'], shapes2['jaw'], band)
+    
+    distance = ProfileDistance(artifacts_distance=artifacts_distance, embedding_distance=embedding_distance, 
+                               eyebrow_distance=eyebrow_distance, eye_distance=eye_distance, nose_distance=nose_distance, mouth_distance=mouth_distance, jaw_distance=jaw_distance)
+    
+    return distance
+
+# The functions below are the units of work sent to the executor.
+# They take the raw upload bytes and return small picklable results,
+# so decoding and all model inference happen inside the worker.
+
+def load_image(data):
+    with stage("decode"):
+        return decode_image(data, max_size=settings.decode_max_size or None, max_pixels=settings.decode_max_pixels or None)
+
+def profile_from_bytes(data):
+    analysis = analyze_face(load_image(data))
+    if analysis is None:
+        return None
+    return create_profile_helper(analysis)
+
+def landmarks_png_from_bytes(data, landmarks=None):
+    # landmarks of a cached profile skip detection and the predictor, only decoding and drawing are left
+    img = load_image(data)
+    if landmarks is None:
+        analysis = analyze_face(img)
+        if analysis is None:
+            return None
+        landmarks = analysis.landmarks
+    with stage("draw"):
+        img_with_landmarks = draw_landmarks(img, np.asarray(landmarks))
+        _, img_encoded = cv2.imencode('.png', img_with_landmarks)
+    return img_encoded.tobytes()
+
+def face_profiles_from_bytes(data):
+    # every face in the image: one detection pass, one batched descriptor call
+    analyses = analyze_faces(load_image(data))
+    if not analyses:
+        return []
+    compute_embeddings(analyses)
+    return [FaceProfile(box=get_box(analysis), profile=create_profile_helper(analysis)) for analysis in analyses]
+
+def face_artifacts_from_bytes(data):
+    analyses = analyze_faces(load_image(data))
+    if not analyses:
+        return []
+    return [FaceArtifacts(box=get_box(analysis), artifacts=get_artifacts(analysis), detection=analysis.detection) for analysis in analyses]
+
+def track_profile(track):
+    # aggregate a finished track into one profile with artifact statistics over its frames
+    fields = list(Artifacts.__fields__)
+    values = np.array([[artifacts[name] for name in fields] for artifacts in track.artifacts], dtype=np.float64)
+    changes = np.abs(np.diff(values, axis=0)) if len(values) > 1 else np.zeros((1, len(fields)))
+    as_artifacts = lambda row: Artifacts(**dict(zip(fields, row.tolist())))
+    statistics = ArtifactStatistics(mean=as_artifacts(values.mean(axis=0)), std=as_artifacts(values.std(axis=0)), min=as_artifacts(values.min(axis=0)),
+                                    max=as_artifacts(values.max(axis=0)), temporal_change=as_artifacts(changes.mean(axis=0)))
+    with stage("description"):
+        description = create_profile_description(track.best_image, track.best_landmarks)
+    profile = Profile(description=description, embedding=np.mean(track.embeddings, axis=0).tolist(), artifacts=statistics.mean,
+                      landmarks=track.best_landmarks.tolist(), detection="tracked")
+    left, top, right, bottom = landmark_box(track.best_landmarks)
+    return TrackProfile(track_id=track.track_id, first_frame=track.first_frame, last_frame=track.last_frame, frames=track.frames,
+                        keyframes=track.keyframes, descriptors=len(track.embeddings), box=BoundingBox(left=left, top=top, right=right, bottom=bottom),
+                        profile=profile, artifact_statistics=statistics, landmark_jitter=float(np.mean(track.landmark_motion)) if track.landmark_motion else 0.0)
+
+def track_frames(frames):
+    # frames is an iterator of (frame index, image), consumed one frame at a time
+    tracker = FaceTracker(settings.video_keyframe_interval, settings.video_pose_delta, settings.video_quality_gain,
+                          margin=settings.artifact_margin, size=settings.artifact_size)
+    for index, image in frames:
+        tracker.update(index, image)
+    tracks = tracker.finish()
+    return VideoProfiles(frames=tracker.frames, keyframes=tracker.keyframes, tracks=[track_profile(track) for track in tracks])
+
+def video_profiles_from_file(path):
+    # the video is read from a file the server spooled the upload to, so only its path crosses to the worker
+    result = track_frames(iter_video_frames(path, stride=max(1, settings.video_frame_stride), max_frames=settings.video_max_frames or None))
+    result.fps = video_fps(path)
+    return result
+
+def video_profiles_from_frames(frames):
+    # frames is the list of encoded images of a frame sequence, in order
+    return track_frames((index, load_image(data)) for index, data in enumerate(frames[:settings.video_max_frames or None]))
@@ -0,0 +1,13 @@
+from .running import RunningStats
+from .sketch import QuantileSketch
+from .stats import PopulationStats, SUMMARY_QUANTILES, merge_moments, merge_scores, merge_summary
+
+__all__ = [
+    'PopulationStats',
+    'RunningStats',
+    'QuantileSketch',
+    'SUMMARY_QUANTILES',
+    'merge_moments',
+    'merge_scores',
+    'merge_summary'
+]
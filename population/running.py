@@ -0,0 +1,49 @@
+import numpy as np
+
+class RunningStats:
+    """
+    Count, mean and variance of each column of a stream of rows, kept as (count, mean, M2) by Welford's method
+    in the batch form of Chan et al., so adding a batch of rows costs one pass over the batch and nothing over the past rows.
+    Removing rows applies the inverse update, which keeps the statistics exact when profiles are deleted.
+    """
+    def __init__(self, columns):
+        self.count = 0
+        self.mean = np.zeros(columns)
+        self._m2 = np.zeros(columns)
+
+    @property
+    def variance(self):
+        # population variance; rounding in repeated removals can leave M2 a hair under zero
+        return np.maximum(self._m2, 0) / self.count if self.count else np.zeros_like(self.mean)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def add(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        if len(rows) == 0:
+            return
+        count, mean, m2 = len(rows), rows.mean(axis=0), ((rows - rows.mean(axis=0)) ** 2).sum(axis=0)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self._m2 = self._m2 + m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def remove(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        if len(rows) == 0:
+            return
+        count, mean, m2 = len(rows), rows.mean(axis=0), ((rows - rows.mean(axis=0)) ** 2).sum(axis=0)
+        remaining = self.count - count
+        if remaining <= 0:
+            self.count = 0
+            self.mean = np.zeros_like(self.mean)
+            self._m2 = np.zeros_like(self._m2)
+            return
+        remaining_mean = (self.count * self.mean - count * mean) / remaining
+        delta = mean - remaining_mean
+        self._m2 = self._m2 - m2 - delta * delta * remaining * count / self.count
+        self.mean = remaining_mean
+        self.count = remaining
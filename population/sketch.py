@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+
+# keys of positive values start here, so negative, zero and positive buckets sort in value order as plain integers
+KEY_OFFSET = 1 << 20
+
+class QuantileSketch:
+    """
+    Streaming quantiles of a stream of numbers, after DDSketch: every value is counted in a logarithmic bucket,
+    bucket i holding the magnitudes in (gamma^(i-1), gamma^i] with gamma = (1 + relative_accuracy) / (1 - relative_accuracy),
+    so any quantile is returned within relative_accuracy of a true value of that rank. Negative values are counted
+    in mirrored buckets and magnitudes under min_value in a zero bucket. Adding and removing values only changes
+    bucket counts, so deletes are exact, and the sketch stays a few hundred buckets whatever the number of values.
+    """
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._counts = {}
+        self.count = 0
+        self._keys = None
+        self._cumulative = None
+
+    def add(self, values):
+        self._update(values, 1)
+
+    def remove(self, values):
+        self._update(values, -1)
+
+    def counts(self):
+        # bucket key -> count, e.g. to send to a coordinator that merges the sketches of several shards
+        return dict(self._counts)
+
+    def merge(self, counts):
+        # add the bucket counts of another sketch with the same relative_accuracy; JSON keys arrive as strings
+        for key, count in counts.items():
+            key = int(key)
+            self._counts[key] = self._counts.get(key, 0) + int(count)
+            self.count += int(count)
+        self._keys = None
+
+    def quantile(self, q):
+        """
+        The value of rank q (0 to 1) among the counted values, or None when there are none.
+        """
+        if self.count == 0:
+            return None
+        keys, cumulative = self._sorted()
+        position = int(np.searchsorted(cumulative, q * (self.count - 1), side="right"))
+        return self._value(int(keys[min(position, len(keys) - 1)]))
+
+    def percentile(self, value):
+        """
+        Percentage of the counted values below value, counting half of those in its bucket, or None when there are none.
+        """
+        if self.count == 0:
+            return None
+        keys, cumulative = self._sorted()
+        key = int(self.keys([value])[0])
+        position = int(np.searchsorted(keys, key))
+        below = int(cumulative[position - 1]) if position > 0 else 0
+        equal = self._counts.get(key, 0)
+        return 100.0 * (below + equal / 2) / self.count
+
+    def keys(self, values):
+        # bucket key of each value
+        values = np.asarray(values, dtype=np.float64)
+        magnitudes = np.abs(values)
+        keys = np.zeros(len(values), dtype=np.int64)
+        counted = magnitudes > self.min_value
+        keys[counted] = KEY_OFFSET + np.ceil(np.log(magnitudes[counted]) / self._log_gamma).astype(np.int64)
+        return np.where(values < 0, -keys, keys)
+
+    def _value(self, key):
+        # the value that is within relative_accuracy of every magnitude of the bucket
+        if key == 0:
+            return 0.0
+        magnitude = 2 * self.gamma ** (abs(key) - KEY_OFFSET) / (self.gamma + 1)
+        return magnitude if key > 0 else -magnitude
+
+    def _update(self, values, sign):
+        keys, counts = np.unique(self.keys(values), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            total = self._counts.get(key, 0) + sign * count
+            if total > 0:
+                self._counts[key] = total
+            else:
+                self._counts.pop(key, None)
+        self.count = max(0, self.count + sign * int(counts.sum()))
+        self._keys = None
+
+    def _sorted(self):
+        # bucket keys in value order and their cumulative counts, rebuilt after the counts change
+        if self._keys is None:
+            self._keys = np.array(sorted(self._counts), dtype=np.int64)
+            self._cumulative = np.cumsum([self._counts[key] for key in self._keys.tolist()])
+        return self._keys, self._cumulative
@@ -0,0 +1,146 @@
+import numpy as np
+
+from .running import RunningStats
+from .sketch import QuantileSketch
+
+SUMMARY_QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+class PopulationStats:
+    """
+    Running statistics of the artifact metrics of the live profiles of a store: mean and standard deviation per metric
+    (RunningStats) and one QuantileSketch per metric, so the z-score and percentile of a new measurement against the
+    gallery cost O(1) instead of a scan of the stored profiles.
+
+    Like the indexes, sync() folds in the rows stored since the last call, and removes the rows deleted since then,
+    read from the store's deletion journal: tombstoned rows keep their artifacts, so their values are subtracted exactly.
+    A sync costs the rows stored and deleted since the last one, not the size of the gallery. A change of the store
+    generation (a compaction or clear) recounts the live rows once.
+    """
+    def __init__(self, store, relative_accuracy=0.01):
+        self.store = store
+        self.relative_accuracy = relative_accuracy
+        self._reset()
+
+    def __len__(self):
+        return self._stats.count
+
+    def _reset(self):
+        columns = self.store.artifacts.shape[1]
+        self._stats = RunningStats(columns)
+        self._sketches = [QuantileSketch(self.relative_accuracy) for _ in range(columns)]
+        self._counted = np.zeros(1024, dtype=bool)
+        self._synced = 0
+        self._generation = self.store.generation
+        # deletions before the rows are first read are seen as dead rows then
+        _, self._deletions = self.store.deletions()
+
+    def sync(self):
+        if self.store.generation != self._generation:
+            self._reset()
+        stop = self.store.rows
+        if stop > self._synced:
+            alive = self.store.alive[self._synced:stop] != 0
+            if stop > len(self._counted):
+                counted = np.zeros(max(stop, 2 * len(self._counted)), dtype=bool)
+                counted[:self._synced] = self._counted[:self._synced]
+                self._counted = counted
+            self._counted[self._synced:stop] = alive
+            self._add(self.store.artifacts[self._synced:stop][alive])
+            self._synced = stop
+        # read after the new rows, so a row deleted meanwhile is either not counted yet or in the journal
+        deleted, self._deletions = self.store.deletions(self._deletions)
+        deleted = deleted[deleted < self._synced]
+        deleted = np.unique(deleted[self._counted[deleted]])
+        if len(deleted):
+            self._counted[deleted] = False
+            self._remove(self.store.artifacts[deleted])
+
+    def _add(self, values):
+        if len(values) == 0:
+            return
+        self._stats.add(values)
+        for sketch, column in zip(self._sketches, np.asarray(values, dtype=np.float64).T):
+            sketch.add(column)
+
+    def _remove(self, values):
+        self._stats.remove(values)
+        for sketch, column in zip(self._sketches, np.asarray(values, dtype=np.float64).T):
+            sketch.remove(column)
+
+    def part_scores(self, values):
+        # this population's share of the scores of values, in the form merge_scores() combines over shards
+        self.sync()
+        return {"count": len(self), "mean": self._stats.mean.tolist(), "variance": self._stats.variance.tolist(),
+                "percentiles": [sketch.percentile(value) for sketch, value in zip(self._sketches, np.asarray(values, dtype=np.float64).tolist())]}
+
+    def state(self):
+        # moments and sketch buckets, in the form merge_summary() combines over shards
+        self.sync()
+        return {"count": len(self), "mean": self._stats.mean.tolist(), "variance": self._stats.variance.tolist(),
+                "sketches": [sketch.counts() for sketch in self._sketches]}
+
+    def scores(self, values):
+        """
+        Standing of one set of artifact measurements among the stored profiles.
+
+        Returns:
+            _(int, list, list) or None_: _Number of profiles compared against, z-score and percentile (0 to 100) per metric,
+            or None when no profile is stored. A metric that does not vary in the gallery gets a z-score of 0._
+        """
+        return merge_scores(values, [self.part_scores(values)])
+
+    def summary(self):
+        """
+        Population statistics per metric.
+
+        Returns:
+            _dict_: _"count", and per-metric lists "mean", "std" and "quantiles" (one list of SUMMARY_QUANTILES values
+            per metric, each within relative_accuracy of the exact quantile, None when the population is empty)._
+        """
+        return merge_summary([self.state()], self.relative_accuracy)
+
+def merge_moments(parts):
+    """
+    Count, mean and (population) variance of the union of several populations, exactly, from theirs.
+    """
+    parts = [part for part in parts if part["count"]]
+    count = sum(part["count"] for part in parts)
+    if count == 0:
+        return 0, None, None
+    counts = np.array([part["count"] for part in parts], dtype=np.float64)[:, None]
+    means = np.array([part["mean"] for part in parts], dtype=np.float64)
+    variances = np.array([part["variance"] for part in parts], dtype=np.float64)
+    mean = (counts * means).sum(axis=0) / count
+    variance = (counts * (variances + (means - mean) ** 2)).sum(axis=0) / count
+    return count, mean, variance
+
+def merge_scores(values, parts):
+    """
+    scores() of values over several populations, e.g. one per shard, from their part_scores(values).
+    Percentiles combine as the count-weighted mean of each population's, which is exact for the sketch ranks.
+    """
+    count, mean, variance = merge_moments(parts)
+    if count == 0:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    std = np.sqrt(variance)
+    z_scores = np.divide(values - mean, std, out=np.zeros_like(values), where=std > 0)
+    percentiles = sum(np.asarray(part["percentiles"], dtype=np.float64) * part["count"] for part in parts if part["count"]) / count
+    return count, z_scores.tolist(), percentiles.tolist()
+
+def merge_summary(parts, relative_accuracy=0.01):
+    """
+    summary() of several populations, e.g. one per shard, from their state(); the sketches are merged bucket by bucket.
+    """
+    count, mean, variance = merge_moments(parts)
+    columns = len(parts[0]["sketches"]) if parts else 0
+    sketches = [QuantileSketch(relative_accuracy) for _ in range(columns)]
+    for part in parts:
+        for sketch, counts in zip(sketches, part["sketches"]):
+            sketch.merge(counts)
+    return {
+        "count": count,
+        "mean": [0.0] * columns if count == 0 else mean.tolist(),
+        "std": [0.0] * columns if count == 0 else np.sqrt(variance).tolist(),
+        "quantiles": [[sketch.quantile(q) for q in SUMMARY_QUANTILES] for sketch in sketches]
+    }
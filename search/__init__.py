@@ -0,0 +1,35 @@
+from .index import EmbeddingIndex, EmbeddingMatrix, select_nearest
+from .ivf import IVFIndex, kmeans
+from .quantized import QuantizedIndex, ScalarQuantizer, ProductQuantizer
+from .factory import create_index
+from .dtw import DTWIndex, dtw_distances
+from .compound import SHAPE_COMPONENTS, component_distances, weighted_scores, closest_by_feature
+from .clustering import CLUSTER_METHODS, GalleryClusters, threshold_edges, chinese_whispers, connected_components
+from .shapes import FEATURE_SLICES, DTW_FEATURES, normalize_shapes, procrustes_disparities
+
+__all__ = [
+    'EmbeddingIndex',
+    'EmbeddingMatrix',
+    'IVFIndex',
+    'QuantizedIndex',
+    'ScalarQuantizer',
+    'ProductQuantizer',
+    'DTWIndex',
+    'dtw_distances',
+    'create_index',
+    'select_nearest',
+    'kmeans',
+    'FEATURE_SLICES',
+    'DTW_FEATURES',
+    'normalize_shapes',
+    'procrustes_disparities',
+    'SHAPE_COMPONENTS',
+    'component_distances',
+    'weighted_scores',
+    'closest_by_feature',
+    'CLUSTER_METHODS',
+    'GalleryClusters',
+    'threshold_edges',
+    'chinese_whispers',
+    'connected_components'
+]
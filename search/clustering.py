@@ -0,0 +1,220 @@
+import numpy as np
+
+CLUSTER_METHODS = ("whispers", "components")
+
+def threshold_edges(embeddings, threshold, block_size=2048):
+    """
+    Pairs (i, j), i < j, of rows of embeddings closer than threshold, and their distances.
+    Distances are computed one block_size x block_size tile at a time, upper triangle only,
+    so the N x N distance matrix never exists; only the pairs under the threshold are kept.
+
+    Returns:
+        _(np.ndarray, np.ndarray, np.ndarray)_: _First rows, second rows and distances of the pairs._
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.einsum('ij,ij->i', embeddings, embeddings)
+    limit = threshold * threshold
+    first, second, distances = [], [], []
+    for start in range(0, len(embeddings), block_size):
+        block = embeddings[start:start + block_size]
+        for other in range(start, len(embeddings), block_size):
+            sq = norms[start:start + block_size, None] - 2 * (block @ embeddings[other:other + block_size].T) + norms[None, other:other + block_size]
+            i, j = np.nonzero(sq < limit)
+            if other == start:
+                keep = i < j
+                i, j = i[keep], j[keep]
+            first.append(i + start)
+            second.append(j + other)
+            distances.append(np.sqrt(np.maximum(sq[i, j], 0)))
+    if not first:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return np.concatenate(first), np.concatenate(second), np.concatenate(distances)
+
+def connected_components(n, first, second):
+    # one label per node, the components of the undirected graph with the given edges
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components as components
+    graph = coo_matrix((np.ones(len(first), dtype=np.int8), (first, second)), shape=(n, n))
+    return components(graph, directed=False)[1]
+
+def chinese_whispers(n, first, second, weights, iterations=20, seed=0):
+    """
+    Chinese whispers clustering of an undirected weighted graph of n nodes, as in dlib's chinese_whispers_clustering.
+    Every node starts in a cluster of its own and repeatedly takes the label with the largest total edge weight
+    among its neighbours. Unlike connected components, a few borderline edges do not chain two dense groups together.
+    Updates are vectorized over a random half of the nodes at a time, which keeps neighbours from swapping labels forever,
+    and stop after two such passes in a row leave every label unchanged. Ties go to the smallest label, so results only depend on seed.
+    """
+    labels = np.arange(n)
+    sources = np.concatenate([first, second])
+    targets = np.concatenate([second, first])
+    weights = np.concatenate([weights, weights]).astype(np.float64)
+    rng = np.random.default_rng(seed)
+    quiet = 0
+    for _ in range(iterations):
+        update = rng.random(n) < 0.5
+        edges = update[sources]
+        nodes, neighbour_labels = sources[edges], labels[targets[edges]]
+        # total weight of each (node, label) pair
+        pairs, inverse = np.unique(nodes * n + neighbour_labels, return_inverse=True)
+        totals = np.bincount(inverse, weights=weights[edges])
+        pair_nodes, pair_labels = pairs // n, pairs % n
+        # heaviest label of each node, the first one of its group once sorted by node and decreasing weight
+        order = np.lexsort((-totals, pair_nodes))
+        best = order[np.r_[True, pair_nodes[order][1:] != pair_nodes[order][:-1]]] if len(order) else order
+        changed = np.count_nonzero(labels[pair_nodes[best]] != pair_labels[best])
+        labels[pair_nodes[best]] = pair_labels[best]
+        quiet = quiet + 1 if changed == 0 else 0
+        if quiet == 2:
+            break
+    return labels
+
+class GalleryClusters:
+    """
+    Identity clusters of the profiles of a store: profiles closer than threshold (the compare_faces threshold by default)
+    are linked, and the links are grouped by Chinese whispers ("whispers") or into connected components ("components").
+
+    rebuild() clusters the whole gallery, with the links from threshold_edges over the live embeddings. It runs in three
+    steps so the long one needs neither the store nor the index: snapshot() copies the live ids and embeddings,
+    compute() clusters the copy, and apply() installs the labels unless a compaction renumbered the rows in between.
+    Profiles stored afterwards are assigned on sync(), like the indexes pick up new rows: a new profile joins the cluster with the largest
+    total link weight among its neighbours, merging the clusters it links for "components", or starts a new one.
+    Labels are kept by profile id, so compactions do not change them; deleted profiles simply drop out.
+    """
+    def __init__(self, store, index, threshold=0.6, method="whispers", block_size=2048, iterations=20):
+        if method not in CLUSTER_METHODS:
+            raise ValueError(f"Unknown clustering method: {method}")
+        self.store = store
+        self.index = index
+        self.threshold = threshold
+        self.method = method
+        self.block_size = block_size
+        self.iterations = iterations
+        self.built = False
+        self._labels = np.full(0, -1, dtype=np.int64)
+        self._next_label = 0
+        self._synced = 0
+        self._generation = store.generation
+
+    def rebuild(self):
+        snapshot = self.snapshot()
+        self.apply(snapshot, self.compute(snapshot))
+
+    def snapshot(self):
+        # (ids, embeddings, rows, generation): copies of the live ids and embeddings, and the size and generation of the store
+        rows = self.store.live_rows()
+        return self.store.ids[rows].copy(), np.array(self.store.embeddings[rows], dtype=np.float32), self.store.rows, self.store.generation
+
+    def compute(self, snapshot):
+        # cluster labels 0, 1, ... of the snapshot's profiles; reads nothing else, so it can run while the store changes
+        ids, embeddings, _, _ = snapshot
+        first, second, distances = threshold_edges(embeddings, self.threshold, self.block_size)
+        if self.method == "components":
+            labels = connected_components(len(ids), first, second)
+        else:
+            labels = chinese_whispers(len(ids), first, second, self.threshold - distances, self.iterations)
+        return np.unique(labels, return_inverse=True)[1]
+
+    def apply(self, snapshot, labels):
+        """
+        Install the labels compute() found for a snapshot. Profiles stored since the snapshot are assigned by the next sync
+        and deleted ones drop out, but a compaction renumbered the rows the snapshot covers, so then nothing changes.
+
+        Returns:
+            _bool_: _Whether the labels were installed._
+        """
+        ids, _, rows, generation = snapshot
+        if generation != self.store.generation:
+            return False
+        self._labels = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int64)
+        self._labels[ids] = labels
+        self._next_label = int(labels.max()) + 1 if len(labels) else 0
+        self._synced = rows
+        self._generation = generation
+        self.built = True
+        return True
+
+    def sync(self):
+        """
+        Assign the profiles stored since the last call, or cluster the whole gallery on first use.
+        """
+        if not self.built:
+            self.rebuild()
+            return
+        if self.store.generation != self._generation:
+            # rows were renumbered, labelled profiles keep their labels and the others are found again
+            self._generation = self.store.generation
+            self._synced = 0
+        stop = self.store.rows
+        rows = np.arange(self._synced, stop)
+        for row in rows[(self.store.alive[rows] != 0) & (self.labels_of(self.store.ids[rows]) < 0)]:
+            self.assign(row)
+        self._synced = stop
+
+    def assign(self, row):
+        # cluster of a new profile from its labelled neighbours under the threshold
+        profile_id = int(self.store.ids[row])
+        found, distances = self.index.search(self.store.embeddings[row], k=None, max_distance=self.threshold)
+        neighbour_ids = self.store.ids[found]
+        labels = self.labels_of(neighbour_ids)
+        known = (labels >= 0) & (neighbour_ids != profile_id)
+        if np.any(known):
+            totals = np.bincount(labels[known], weights=self.threshold - distances[known])
+            label = int(np.argmax(totals))
+            if self.method == "components":
+                linked = np.flatnonzero(totals > 0)
+                self._labels[np.isin(self._labels, linked)] = label
+        else:
+            label = self._next_label
+            self._next_label += 1
+        if profile_id >= len(self._labels):
+            labels = np.full(max(profile_id + 1, 2 * len(self._labels)), -1, dtype=np.int64)
+            labels[:len(self._labels)] = self._labels
+            self._labels = labels
+        self._labels[profile_id] = label
+        return label
+
+    def labels_of(self, profile_ids):
+        profile_ids = np.asarray(profile_ids, dtype=np.int64)
+        labels = np.full(len(profile_ids), -1, dtype=np.int64)
+        known = profile_ids < len(self._labels)
+        labels[known] = self._labels[profile_ids[known]]
+        return labels
+
+    def clusters(self, min_size=1):
+        """
+        The clusters of the live profiles with at least min_size members, largest first.
+
+        Returns:
+            _list_: _(label, member rows, representative row) per cluster, see representative()._
+        """
+        self.sync()
+        rows = self.store.live_rows()
+        labels = self.labels_of(self.store.ids[rows])
+        if len(rows) == 0:
+            return []
+        order = np.argsort(labels, kind="stable")
+        rows, labels = rows[order], labels[order]
+        boundaries = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+        result = []
+        for members, label in zip(np.split(rows, boundaries), labels[np.r_[0, boundaries]]):
+            if len(members) < min_size:
+                continue
+            result.append((int(label), members, self.representative(members)))
+        result.sort(key=lambda cluster: -len(cluster[1]))
+        return result
+
+    def cluster_of(self, profile_id):
+        # (label, member rows, representative row) of the cluster of one profile, or None if it is not stored
+        self.sync()
+        if self.store.row_of(profile_id) is None:
+            return None
+        label = int(self.labels_of([profile_id])[0])
+        rows = self.store.live_rows()
+        members = rows[self.labels_of(self.store.ids[rows]) == label]
+        return label, members, self.representative(members)
+
+    def representative(self, rows):
+        # the row closest to the mean embedding of the given rows
+        embeddings = np.asarray(self.store.embeddings[rows], dtype=np.float32)
+        return int(rows[int(np.argmin(np.sum((embeddings - embeddings.mean(axis=0)) ** 2, axis=1)))])
@@ -0,0 +1,61 @@
+import numpy as np
+
+from .dtw import dtw_distances
+from .shapes import FEATURE_SLICES, DTW_FEATURES, normalize_shapes, procrustes_disparities
+
+# shape components of ProfileDistance and the features summed into each, compared like calculate_distance does
+SHAPE_COMPONENTS = {
+    'eyebrow': ('left_eyebrow', 'right_eyebrow'),
+    'eye': ('left_eye', 'right_eye'),
+    'nose': ('nose',),
+    'mouth': ('mouth',),
+    'jaw': ('jaw',)
+}
+DTW_COMPONENTS = ('eyebrow', 'jaw')
+
+def component_distances(store, rows, landmarks, artifacts, embedding_distances, band=None):
+    """
+    Every ProfileDistance component between one query and the profiles at the given store rows,
+    each as a vector over the rows. Shapes use the stored normalized shapes (procrustes) or landmarks (DTW),
+    artifacts are absolute differences per field.
+
+    Returns:
+        _dict_: _'embedding', the shape components of SHAPE_COMPONENTS and 'artifacts' (rows x fields) arrays._
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+    shapes = normalize_shapes(landmarks)
+    components = {'embedding': np.asarray(embedding_distances, dtype=np.float64)}
+    for component, features in SHAPE_COMPONENTS.items():
+        total = np.zeros(len(rows))
+        for feature in features:
+            feature_slice = FEATURE_SLICES[feature]
+            if component in DTW_COMPONENTS:
+                total += dtw_distances(landmarks[feature_slice], store.landmarks[rows, feature_slice], band)
+            else:
+                total += procrustes_disparities(shapes[feature_slice], store.shapes[rows, feature_slice])
+        components[component] = total
+    components['artifacts'] = np.abs(store.artifacts[rows].astype(np.float64) - np.asarray(artifacts, dtype=np.float64))
+    return components
+
+def weighted_scores(components, weights, artifact_weights):
+    # weighted sum of the components; artifact_weights has one weight per artifact field
+    scores = components['artifacts'] @ np.asarray(artifact_weights, dtype=np.float64)
+    for component, weight in weights.items():
+        if weight:
+            scores += weight * components[component]
+    return scores
+
+def closest_by_feature(store, dtw_index, landmarks, feature, rows):
+    """
+    The store row among rows whose shape of one feature is closest to the query landmarks, and its distance.
+    DTW features go through the lower-bounded DTWIndex, the others through one batched procrustes
+    over the stored normalized shapes.
+    """
+    if feature in DTW_FEATURES:
+        # lower bounds prune most of the gallery before the exact DTW runs
+        return dtw_index.search(np.asarray(landmarks), feature, rows)
+    feature_slice = FEATURE_SLICES[feature]
+    current_shape = normalize_shapes(landmarks)[feature_slice]
+    distances = procrustes_disparities(current_shape, store.shapes[rows, feature_slice])
+    closest = int(np.argmin(distances))
+    return rows[closest], distances[closest]
@@ -0,0 +1,137 @@
+import numpy as np
+
+from .shapes import FEATURE_SLICES, DTW_FEATURES
+
+def dtw_distances(query, candidates, band=None):
+    """
+    Exact dynamic time warping distance between one polyline (n x 2) and N candidates (N x m x 2),
+    with Euclidean point costs, computed for all candidates at once.
+    The warping path is restricted to a Sakoe-Chiba band of band points around the diagonal, None for no band.
+    """
+    query = np.asarray(query, dtype=np.float64)
+    candidates = np.asarray(candidates, dtype=np.float64)
+    n, m = len(query), candidates.shape[1]
+    band = max(n, m) if band is None else max(band, abs(n - m))
+    cost = np.sqrt(np.sum((query[None, :, None, :] - candidates[:, None, :, :])**2, axis=-1))
+    # one row of the accumulated cost matrix per query point, each cell a vector over the candidates
+    total = np.full((len(candidates), m), np.inf)
+    for i in range(n):
+        previous = total
+        total = np.full_like(previous, np.inf)
+        for j in range(max(0, i - band), min(m, i + band + 1)):
+            if i == 0 and j == 0:
+                total[:, j] = cost[:, 0, 0]
+                continue
+            best = previous[:, j]
+            if j > 0:
+                best = np.minimum(best, np.minimum(previous[:, j - 1], total[:, j - 1]))
+            total[:, j] = cost[:, i, j] + best
+    return total[:, -1]
+
+def envelopes(polylines, band):
+    # per point, the bounding box of the points a band-limited warping path can match it with
+    lower = np.array(polylines, dtype=np.float64)
+    upper = lower.copy()
+    n = lower.shape[-2]
+    for shift in range(1, min(band, n - 1) + 1):
+        lower[..., :-shift, :] = np.minimum(lower[..., :-shift, :], polylines[..., shift:, :])
+        lower[..., shift:, :] = np.minimum(lower[..., shift:, :], polylines[..., :-shift, :])
+        upper[..., :-shift, :] = np.maximum(upper[..., :-shift, :], polylines[..., shift:, :])
+        upper[..., shift:, :] = np.maximum(upper[..., shift:, :], polylines[..., :-shift, :])
+    return lower, upper
+
+def lb_kim(query, candidates):
+    # every warping path matches the first points together and the last points together
+    query = np.asarray(query, dtype=np.float64)
+    first = np.linalg.norm(candidates[:, 0] - query[0], axis=-1)
+    if len(query) == 1:
+        return first
+    return first + np.linalg.norm(candidates[:, -1] - query[-1], axis=-1)
+
+def lb_keogh(query, lower, upper):
+    # each query point pays at least its distance to the box of candidate points it may be matched with
+    query = np.asarray(query, dtype=np.float64)
+    outside = np.maximum(lower - query, 0) + np.maximum(query - upper, 0)
+    return np.sum(np.sqrt(np.sum(outside**2, axis=-1)), axis=-1)
+
+class DTWIndex:
+    """
+    Nearest-shape search by exact banded DTW over the landmark column of a profile store,
+    for the features compared as polylines (eyebrows, 5 points, and jaw, 17 points).
+    Keeps the band envelopes of every stored feature, extended as the store grows like the
+    embedding index norms. A query computes cheap lower bounds (LB_Kim and LB_Keogh both ways)
+    for every candidate, then runs the full DTW in batches in order of increasing bound and
+    stops as soon as the next bound cannot beat the best distance found, so most of a large
+    gallery is never compared exactly.
+    """
+    def __init__(self, store, band=3, batch_size=64):
+        self.store = store
+        self.band = band
+        self.batch_size = batch_size
+        self._envelopes = {}
+        self._synced = 0
+        self._generation = store.generation
+
+    def sync(self):
+        rows = self.store.rows
+        if self.store.generation != self._generation:
+            self._generation = self.store.generation
+            self.clear()
+        if rows > self._synced:
+            landmarks = np.asarray(self.store.landmarks[self._synced:rows], dtype=np.float64)
+            for feature in DTW_FEATURES:
+                lower, upper = envelopes(landmarks[:, FEATURE_SLICES[feature]], self._band_of(feature))
+                if feature in self._envelopes:
+                    old_lower, old_upper = self._envelopes[feature]
+                    lower, upper = np.concatenate([old_lower, lower]), np.concatenate([old_upper, upper])
+                self._envelopes[feature] = (lower, upper)
+            self._synced = rows
+
+    def clear(self):
+        self._envelopes = {}
+        self._synced = 0
+
+    def search(self, landmarks, feature, rows=None):
+        """
+        Find the stored profile whose feature is closest to the same feature of landmarks.
+
+        Args:
+            landmarks (np.ndarray): _The 68 query landmarks._
+            feature (str): _One of the DTW features: 'left_eyebrow', 'right_eyebrow' or 'jaw'._
+            rows (np.ndarray, optional): _Store rows to search, the live rows if omitted._ Defaults to None.
+
+        Returns:
+            _(int, float)_: _Closest row and its DTW distance, (None, inf) if there are no rows._
+        """
+        self.sync()
+        if rows is None:
+            rows = self.store.live_rows()
+        feature_slice = FEATURE_SLICES[feature]
+        band = self._band_of(feature)
+        query = np.asarray(landmarks, dtype=np.float64)[feature_slice]
+        candidates = np.asarray(self.store.landmarks[rows, feature_slice], dtype=np.float64)
+        lower, upper = (envelope[rows] for envelope in self._envelopes[feature])
+        query_lower, query_upper = envelopes(query[None], band)
+        bounds = np.maximum.reduce([
+            lb_kim(query, candidates),
+            lb_keogh(query, lower, upper),
+            lb_keogh(candidates, query_lower, query_upper),
+        ])
+
+        order = np.argsort(bounds, kind="stable")
+        best_row, best_distance = None, np.inf
+        start, batch_size = 0, self.batch_size
+        while start < len(order) and bounds[order[start]] < best_distance:
+            batch = order[start:start + batch_size]
+            batch = batch[bounds[batch] < best_distance]
+            distances = dtw_distances(query, candidates[batch], band)
+            closest = int(np.argmin(distances))
+            if distances[closest] < best_distance:
+                best_row, best_distance = int(rows[batch[closest]]), float(distances[closest])
+            start += batch_size
+            batch_size *= 2
+        return best_row, best_distance
+
+    def _band_of(self, feature):
+        n = FEATURE_SLICES[feature].stop - FEATURE_SLICES[feature].start
+        return n if self.band is None else self.band
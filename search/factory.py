@@ -0,0 +1,17 @@
+from .index import EmbeddingIndex
+from .ivf import IVFIndex
+from .quantized import QuantizedIndex
+
+IVF_OPTIONS = ("n_lists", "nprobe", "train_size")
+QUANTIZED_OPTIONS = ("train_size", "recall_target", "subvectors")
+
+def create_index(kind, store, **kwargs):
+    # every index exposes the same sync/add/clear/search/rebuild/stats interface over the store's embeddings,
+    # each index only takes the options that apply to it
+    if kind == "exact":
+        return EmbeddingIndex(store)
+    if kind == "ivf":
+        return IVFIndex(store, **{name: kwargs[name] for name in IVF_OPTIONS if name in kwargs})
+    if kind in ("int8", "pq"):
+        return QuantizedIndex(store, kind=kind, **{name: kwargs[name] for name in QUANTIZED_OPTIONS if name in kwargs})
+    raise ValueError(f"Unknown index type: {kind}")
@@ -0,0 +1,119 @@
+import numpy as np
+
+class EmbeddingIndex:
+    """
+    Exact search over the float32 (N x 128) embedding column of a profile store.
+    The store owns the matrix, in memory or memory-mapped and shared between workers;
+    the index only keeps derived data (here the squared row norms) and extends it as the store grows.
+    Results are store rows. Deleted rows stay in the matrix and are left out of results.
+    When the store is compacted or cleared its rows are renumbered and its generation changes,
+    and the index rebuilds its derived data on the next sync.
+    Distances are Euclidean, matching compare_faces.
+    """
+    def __init__(self, store):
+        self.store = store
+        self._norms = np.empty(1024, dtype=np.float32)
+        self._synced = 0
+        self._generation = store.generation
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def _sq_norms(self):
+        return self._norms[:self._synced]
+
+    def sync(self):
+        # pick up rows appended to the store since the last call, including by other workers
+        rows = self.store.rows
+        if self.store.generation != self._generation:
+            self._generation = self.store.generation
+            self._renumbered()
+        if rows > self._synced:
+            if rows > len(self._norms):
+                norms = np.empty(max(rows, 2 * len(self._norms)), dtype=np.float32)
+                norms[:self._synced] = self._sq_norms
+                self._norms = norms
+            new = np.asarray(self.store.embeddings[self._synced:rows], dtype=np.float32)
+            self._norms[self._synced:rows] = np.einsum('ij,ij->i', new, new)
+            self._synced = rows
+
+    def add(self, row):
+        self.sync()
+
+    def clear(self):
+        self._synced = 0
+
+    def _renumbered(self):
+        self.clear()
+
+    def distances(self, embedding):
+        self.sync()
+        query = np.asarray(embedding, dtype=np.float32)
+        # ||a - b||^2 = ||a||^2 - 2ab + ||b||^2, one matrix-vector product for the whole gallery
+        sq = self._sq_norms - 2 * (self.store.embeddings @ query) + np.dot(query, query)
+        return np.sqrt(np.maximum(sq, 0))
+
+    def row_distances(self, embedding, rows):
+        # same as distances() restricted to a subset of rows
+        self.sync()
+        query = np.asarray(embedding, dtype=np.float32)
+        sq = self._sq_norms[rows] - 2 * (self.store.embeddings[rows] @ query) + np.dot(query, query)
+        return np.sqrt(np.maximum(sq, 0))
+
+    def search(self, embedding, k=1, max_distance=None, nprobe=None):
+        """
+        Find the closest stored embeddings.
+
+        Args:
+            embedding (np.ndarray): _Query embedding._
+            k (int, optional): _Maximum number of results, None for no limit._ Defaults to 1.
+            max_distance (float, optional): _Only return rows strictly closer than this._ Defaults to None.
+            nprobe (int, optional): _Recall/latency knob of approximate indexes, ignored by the exact search._ Defaults to None.
+
+        Returns:
+            _(np.ndarray, np.ndarray)_: _Rows and distances, sorted from closest to furthest._
+        """
+        distances = self.distances(embedding)
+        rows = np.flatnonzero(self.store.alive)
+        return select_nearest(rows, distances[rows], k, max_distance)
+
+    def rebuild(self):
+        self.clear()
+        self.sync()
+
+    def stats(self):
+        return {"kind": "exact", "profiles": len(self.store), "resident_bytes_per_profile": self.resident_bytes_per_profile()}
+
+    def resident_bytes_per_profile(self):
+        # memory this process holds per stored profile: the squared norm, and the embedding unless the store memory-maps it
+        embedding_bytes = 0 if self.store.memory_mapped else self.store.embeddings.shape[1] * self.store.embeddings.dtype.itemsize
+        return 4 + embedding_bytes
+
+def select_nearest(rows, distances, k=1, max_distance=None):
+    # distances[i] belongs to rows[i]; keep those under max_distance, then the k closest in order
+    if max_distance is not None:
+        keep = distances < max_distance
+        rows, distances = rows[keep], distances[keep]
+    if k is not None and k < len(rows):
+        nearest = np.argpartition(distances, k - 1)[:k]
+        rows, distances = rows[nearest], distances[nearest]
+    order = np.argsort(distances, kind="stable")
+    return rows[order], distances[order]
+
+class EmbeddingMatrix:
+    """
+    Minimal read-only stand-in for a profile store over a fixed embedding matrix,
+    for building indexes offline, e.g. in benchmarks.
+    """
+    def __init__(self, embeddings):
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.alive = np.ones(len(self.embeddings), dtype=np.uint8)
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @property
+    def rows(self):
+        return len(self.embeddings)
@@ -0,0 +1,152 @@
+import numpy as np
+
+from .index import EmbeddingIndex, select_nearest
+
+def kmeans(data, n_clusters, n_iter=10, sample_size=None, seed=0):
+    """
+    Lloyd's k-means on the rows of data, returns float32 centroids.
+    Trains on a random sample when sample_size is given, which is plenty for coarse quantization.
+    """
+    rng = np.random.default_rng(seed)
+    if sample_size is not None and len(data) > sample_size:
+        data = data[rng.choice(len(data), sample_size, replace=False)]
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = assign(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        counts = np.bincount(labels, minlength=n_clusters)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # re-seed empty clusters on random points so every list stays usable
+        centroids[empty] = data[rng.choice(len(data), int(empty.sum()))]
+    return centroids
+
+def assign(data, centroids, block_size=16384):
+    # nearest centroid per row, in blocks so an N x C distance matrix is never materialized
+    labels = np.empty(len(data), dtype=np.int64)
+    centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+    for start in range(0, len(data), block_size):
+        block = np.asarray(data[start:start + block_size], dtype=np.float32)
+        labels[start:start + block_size] = np.argmin(centroid_sq - 2 * (block @ centroids.T), axis=1)
+    return labels
+
+class IVFIndex(EmbeddingIndex):
+    """
+    Inverted file index over the embedding column of a profile store.
+    Embeddings are partitioned into n_lists clusters by a coarse k-means quantizer, and a query
+    only computes exact distances for the rows in its nprobe closest clusters.
+    Rows and results are the same as EmbeddingIndex, so the two are interchangeable.
+    New rows are assigned to their closest cluster as they appear; deleted rows are skipped at
+    search time and dropped from the lists on the next rebuild or store compaction, which
+    reassigns the renumbered rows to the existing clusters.
+    Until train_size profiles are stored the index answers with the exact search.
+    """
+    def __init__(self, store, n_lists=None, nprobe=8, train_size=10000):
+        super().__init__(store)
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.centroids = None
+        self._lists = []
+        self._list_sizes = None
+        self._assigned = 0
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def sync(self):
+        super().sync()
+        rows = self.store.rows
+        if self.trained and rows > self._assigned:
+            labels = assign(self.store.embeddings[self._assigned:rows], self.centroids)
+            for row, label in zip(range(self._assigned, rows), labels):
+                self._append(int(label), row)
+            self._assigned = rows
+        elif not self.trained and len(self.store) >= self.train_size:
+            self.rebuild()
+
+    def clear(self):
+        super().clear()
+        self._reset()
+
+    def rebuild(self, n_lists=None):
+        """
+        Retrain the coarse quantizer on the live embeddings and reassign every live row.
+        Call after the gallery has grown or drifted a lot since the last training.
+        """
+        EmbeddingIndex.sync(self)
+        live = np.flatnonzero(self.store.alive)
+        if len(live) == 0:
+            self._reset()
+            return
+        n_lists = n_lists or self.n_lists or max(1, int(np.sqrt(len(live))))
+        n_lists = min(n_lists, len(live))
+        sample = live if len(live) <= 256 * n_lists else np.sort(np.random.default_rng(0).choice(live, 256 * n_lists, replace=False))
+        self.centroids = kmeans(self.store.embeddings[sample], n_lists)
+        self._assign_live(live)
+
+    def search(self, embedding, k=1, max_distance=None, nprobe=None):
+        """
+        Find the closest stored embeddings among the nprobe closest clusters.
+
+        Args:
+            embedding (np.ndarray): _Query embedding._
+            k (int, optional): _Maximum number of results, None for no limit._ Defaults to 1.
+            max_distance (float, optional): _Only return rows strictly closer than this._ Defaults to None.
+            nprobe (int, optional): _Number of clusters to scan; higher is slower but finds more true neighbours._ Defaults to the index setting.
+
+        Returns:
+            _(np.ndarray, np.ndarray)_: _Rows and distances, sorted from closest to furthest._
+        """
+        self.sync()
+        nprobe = min(nprobe or self.nprobe, len(self._lists))
+        if not self.trained or nprobe >= len(self._lists):
+            return super().search(embedding, k, max_distance)
+        query = np.asarray(embedding, dtype=np.float32)
+        centroid_distances = np.einsum('ij,ij->i', self.centroids, self.centroids) - 2 * (self.centroids @ query)
+        probe = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        rows = np.concatenate([self._lists[label][:self._list_sizes[label]] for label in probe])
+        rows = rows[self.store.alive[rows] != 0]
+        return select_nearest(rows, self.row_distances(query, rows), k, max_distance)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(kind="ivf", trained=self.trained, lists=len(self._lists), nprobe=self.nprobe)
+        return stats
+
+    def resident_bytes_per_profile(self):
+        # plus the row number in its list
+        return super().resident_bytes_per_profile() + (8 if self.trained else 0)
+
+    def _renumbered(self):
+        # only the row numbers changed: keep the trained clusters and rebuild the norms and lists
+        EmbeddingIndex.clear(self)
+        if self.trained:
+            self._assign_live(np.flatnonzero(self.store.alive))
+
+    def _assign_live(self, live):
+        # assign in blocks over the whole column rather than copying out the live rows
+        labels = assign(self.store.embeddings, self.centroids)[live]
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=len(self.centroids))
+        self._lists = np.split(live[order], np.cumsum(counts)[:-1])
+        self._list_sizes = counts
+        self._assigned = self.store.rows
+
+    def _reset(self):
+        self.centroids = None
+        self._lists = []
+        self._list_sizes = None
+        self._assigned = 0
+
+    def _append(self, label, row):
+        size = self._list_sizes[label]
+        if size == len(self._lists[label]):
+            members = np.empty(max(4, 2 * size), dtype=np.int64)
+            members[:size] = self._lists[label][:size]
+            self._lists[label] = members
+        self._lists[label][size] = row
+        self._list_sizes[label] += 1
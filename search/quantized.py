@@ -0,0 +1,280 @@
+import numpy as np
+
+from .index import EmbeddingIndex, select_nearest
+from .ivf import kmeans, assign
+
+class ScalarQuantizer:
+    """
+    8-bit scalar quantization: every dimension is mapped linearly from its trained [min, max] range
+    to 0..255, so a 128-d float32 vector takes 128 bytes, plus a float32 norm term kept per code.
+    """
+    has_norms = True
+
+    def __init__(self):
+        self.low = None
+        self.scale = None
+
+    @property
+    def code_size(self):
+        return len(self.low)
+
+    @property
+    def bytes_per_vector(self):
+        return self.code_size + 4
+
+    def fit(self, data):
+        data = np.asarray(data, dtype=np.float32)
+        self.low = data.min(axis=0)
+        self.scale = np.maximum(data.max(axis=0) - self.low, 1e-12) / 255
+
+    def encode(self, data):
+        codes = np.rint((np.asarray(data, dtype=np.float32) - self.low) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes):
+        return codes.astype(np.float32) * self.scale + self.low
+
+    def code_norms(self, codes):
+        # the (c * c).scale^2 term of the distance below, which only depends on the code
+        codes = codes.astype(np.float32)
+        return (codes * codes) @ (self.scale * self.scale)
+
+    def query_state(self, query):
+        # ||q - (low + scale * c)||^2 = ||q - low||^2 - 2 c.(scale * (q - low)) + (c * c).scale^2
+        shifted = query - self.low
+        return float(np.dot(shifted, shifted)), self.scale * shifted
+
+    def distances(self, state, codes, norms):
+        constant, weights = state
+        return constant - 2 * (codes.astype(np.float32) @ weights) + norms
+
+class ProductQuantizer:
+    """
+    Product quantization: the vector is split into subvectors sub-vectors, each replaced by the index of its
+    closest centroid in a codebook of 256 trained by k-means, so a vector takes subvectors bytes.
+    Distances are asymmetric: the query stays exact and is compared to the centroids through one lookup table.
+    """
+    has_norms = False
+
+    def __init__(self, subvectors=16):
+        self.subvectors = subvectors
+        self.codebooks = None
+
+    @property
+    def code_size(self):
+        return self.subvectors
+
+    @property
+    def bytes_per_vector(self):
+        return self.subvectors
+
+    def fit(self, data):
+        data = np.asarray(data, dtype=np.float32)
+        if data.shape[1] % self.subvectors:
+            raise ValueError(f"Embedding size {data.shape[1]} is not divisible into {self.subvectors} subvectors")
+        n_centroids = min(256, len(data))
+        self.codebooks = np.stack([kmeans(part, n_centroids) for part in self._split(data)])
+
+    def encode(self, data):
+        parts = self._split(np.asarray(data, dtype=np.float32))
+        return np.stack([assign(part, codebook) for part, codebook in zip(parts, self.codebooks)], axis=1).astype(np.uint8)
+
+    def decode(self, codes):
+        return np.concatenate([codebook[codes[:, j]] for j, codebook in enumerate(self.codebooks)], axis=1)
+
+    def query_state(self, query):
+        # squared distance from each query sub-vector to every centroid of its codebook
+        parts = self._split(query[None, :])
+        return np.stack([np.sum((codebook - part) ** 2, axis=1) for part, codebook in zip(parts, self.codebooks)]).astype(np.float32)
+
+    def distances(self, table, codes, norms=None):
+        # one table lookup per sub-vector, summed column by column, which beats a 2-d fancy index
+        sq = table[0][codes[:, 0]]
+        for j in range(1, self.subvectors):
+            sq += table[j][codes[:, j]]
+        return sq
+
+    def _split(self, data):
+        return np.split(data, self.subvectors, axis=1)
+
+class QuantizedIndex(EmbeddingIndex):
+    """
+    Search over compressed copies of the store's embeddings: "int8" scalar codes (128 bytes per profile)
+    or "pq" product quantization codes (pq_subvectors bytes per profile).
+    A query scans the codes of every live row, then re-ranks a shortlist of the closest ones with
+    the full-precision embeddings of the store, which are memory-mapped when the store is persistent,
+    so only the shortlisted vectors are read. Over an in-memory store the codes come on top of the float32
+    column, so memory only goes down with a persistent store; resident_bytes_per_profile() counts both.
+
+    Training samples the stored embeddings once train_size profiles are stored; until then the exact search is used.
+    Training also calibrates the shortlist: on gallery embeddings left out of training it measures how long the shortlist must be
+    for the re-ranked top 1 and top 10 to reach recall_target, and how much the compressed distances overestimate
+    the exact ones, which widens the threshold of searches without k. The measurements are in report.
+    """
+    # shortlist lengths tried during calibration, in multiples of k
+    RERANK_FACTORS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+    def __init__(self, store, kind="pq", train_size=10000, recall_target=0.99, subvectors=16, block_size=4096, calibration_size=20000, calibration_queries=200):
+        super().__init__(store)
+        self.kind = kind
+        self.train_size = train_size
+        self.recall_target = recall_target
+        self.subvectors = subvectors
+        self.block_size = block_size
+        self.calibration_size = calibration_size
+        self.calibration_queries = calibration_queries
+        self.quantizer = None
+        self.rerank = self.RERANK_FACTORS[-1]
+        self.slack = 0.0
+        self.report = {}
+        self._codes = None
+        self._code_norms = None
+        self._encoded = 0
+
+    @property
+    def trained(self):
+        return self.quantizer is not None
+
+    def sync(self):
+        super().sync()
+        rows = self.store.rows
+        if self.trained and rows > self._encoded:
+            self._encode(self._encoded, rows)
+        elif not self.trained and len(self.store) >= self.train_size:
+            self.rebuild()
+
+    def clear(self):
+        super().clear()
+        self._encoded = 0
+
+    def rebuild(self):
+        """
+        Retrain the quantizer on the live embeddings, re-encode every row and recalibrate the shortlist.
+        """
+        EmbeddingIndex.sync(self)
+        live = np.flatnonzero(self.store.alive)
+        if len(live) == 0:
+            self.quantizer = None
+            self._encoded = 0
+            return
+        rng = np.random.default_rng(0)
+        sample = live if len(live) <= self.train_size else np.sort(rng.choice(live, self.train_size, replace=False))
+        quantizer = ScalarQuantizer() if self.kind == "int8" else ProductQuantizer(self.subvectors)
+        quantizer.fit(self.store.embeddings[sample])
+        self.quantizer = quantizer
+        self._codes = None
+        self._encoded = 0
+        self._encode(0, self.store.rows)
+        # codes of training vectors are closer to them than those of unseen ones, so calibrate on the others when there are enough
+        held_out = np.setdiff1d(live, sample, assume_unique=True)
+        self._calibrate(held_out if len(held_out) >= min(len(live), self.calibration_queries) else live)
+
+    def search(self, embedding, k=1, max_distance=None, nprobe=None):
+        """
+        Find the closest stored embeddings from their compressed codes, re-ranked with the exact embeddings.
+
+        Args:
+            embedding (np.ndarray): _Query embedding._
+            k (int, optional): _Maximum number of results, None for no limit._ Defaults to 1.
+            max_distance (float, optional): _Only return rows strictly closer than this._ Defaults to None.
+            nprobe (int, optional): _Ignored, the shortlist length comes from the calibration._ Defaults to None.
+
+        Returns:
+            _(np.ndarray, np.ndarray)_: _Rows and distances, sorted from closest to furthest._
+        """
+        self.sync()
+        if not self.trained or (k is None and max_distance is None):
+            return super().search(embedding, k, max_distance)
+        query = np.asarray(embedding, dtype=np.float32)
+        rows = np.flatnonzero(self.store.alive)
+        approximate = self.approximate_distances(query, rows)
+        if k is not None and self.rerank * k < len(rows):
+            shortlist = np.argpartition(approximate, self.rerank * k - 1)[:self.rerank * k]
+            rows, approximate = rows[shortlist], approximate[shortlist]
+        if max_distance is not None:
+            rows = rows[approximate < max_distance + self.slack]
+        return select_nearest(rows, self.row_distances(query, rows), k, max_distance)
+
+    def approximate_distances(self, query, rows):
+        # distances from the codes of the given rows, in blocks small enough for the converted codes to stay in cache
+        state = self.quantizer.query_state(np.asarray(query, dtype=np.float32))
+        sq = np.empty(len(rows), dtype=np.float32)
+        # with every row alive the blocks are slices of the codes rather than gathered copies
+        contiguous = len(rows) == self._encoded and (len(rows) == 0 or rows[-1] == len(rows) - 1)
+        for start in range(0, len(rows), self.block_size):
+            block = slice(start, min(start + self.block_size, len(rows))) if contiguous else rows[start:start + self.block_size]
+            sq[start:start + self.block_size] = self.quantizer.distances(state, self._codes[block], None if self._code_norms is None else self._code_norms[block])
+        return np.sqrt(np.maximum(sq, 0))
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(kind=self.kind, trained=self.trained, bytes_per_profile=self.quantizer.bytes_per_vector if self.trained else None, **self.report)
+        return stats
+
+    def resident_bytes_per_profile(self):
+        return super().resident_bytes_per_profile() + (self.quantizer.bytes_per_vector if self.trained else 0)
+
+    def _renumbered(self):
+        super()._renumbered()
+        if self.trained:
+            self._encode(0, self.store.rows)
+
+    def _encode(self, start, stop):
+        # codes of rows start..stop, and the norm terms of quantizers that keep them, growing the arrays as needed
+        if self._codes is None or stop > len(self._codes):
+            capacity = max(stop, 2 * self._encoded, 1024)
+            codes = np.empty((capacity, self.quantizer.code_size), dtype=np.uint8)
+            norms = np.empty(capacity, dtype=np.float32) if self.quantizer.has_norms else None
+            if start:
+                codes[:start] = self._codes[:start]
+                if norms is not None:
+                    norms[:start] = self._code_norms[:start]
+            self._codes, self._code_norms = codes, norms
+        for block in range(start, stop, self.block_size):
+            end = min(block + self.block_size, stop)
+            codes = self.quantizer.encode(self.store.embeddings[block:end])
+            self._codes[block:end] = codes
+            if self._code_norms is not None:
+                self._code_norms[block:end] = self.quantizer.code_norms(codes)
+        self._encoded = stop
+
+    def _calibrate(self, live):
+        # leave-one-out queries over a sample of the given rows: where do the exact top k land in the compressed ranking?
+        rng = np.random.default_rng(1)
+        rows = live if len(live) <= self.calibration_size else np.sort(rng.choice(live, self.calibration_size, replace=False))
+        n_queries = min(self.calibration_queries, len(rows) - 1)
+        if n_queries < 1:
+            return
+        queries = rng.choice(len(rows), n_queries, replace=False)
+        gallery = np.asarray(self.store.embeddings[rows], dtype=np.float32)
+        positions = {1: [], 10: []}
+        errors = []
+        for query in queries:
+            exact = np.sqrt(np.maximum(np.sum((gallery - gallery[query]) ** 2, axis=1), 0))
+            approximate = self.approximate_distances(gallery[query], rows)
+            exact[query] = approximate[query] = np.inf
+            finite = np.isfinite(exact)
+            errors.append(approximate[finite] - exact[finite])
+            rank = np.empty(len(rows), dtype=np.int64)
+            rank[np.argsort(approximate, kind="stable")] = np.arange(len(rows))
+            order = np.argsort(exact, kind="stable")
+            for k in positions:
+                positions[k].append(rank[order[:min(k, len(rows) - 1)]])
+        positions = {k: np.concatenate(found) for k, found in positions.items()}
+
+        self.rerank = self.RERANK_FACTORS[-1]
+        for factor in self.RERANK_FACTORS:
+            if all(np.mean(found < factor * k) >= self.recall_target for k, found in positions.items()):
+                self.rerank = factor
+                break
+        self.slack = max(0.0, float(np.quantile(np.concatenate(errors), self.recall_target)))
+        code_bytes = self.quantizer.bytes_per_vector
+        self.report = {
+            "recall_target": self.recall_target,
+            "rerank_factor": self.rerank,
+            **{f"recall@{k}": float(np.mean(found < self.rerank * k)) for k, found in positions.items()},
+            "threshold_slack": self.slack,
+            "calibration_profiles": len(rows),
+            "calibration_queries": n_queries,
+            "compression": 4 * self.store.embeddings.shape[1] / code_bytes,
+        }
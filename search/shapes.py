@@ -0,0 +1,39 @@
+import numpy as np
+
+# landmark ranges of each facial feature, as in utils.extract_shapes; together they cover all 68 points
+FEATURE_SLICES = {
+    'left_eyebrow': slice(17, 22),
+    'right_eyebrow': slice(22, 27),
+    'left_eye': slice(36, 42),
+    'right_eye': slice(42, 48),
+    'nose': slice(27, 36),
+    'mouth': slice(48, 68),
+    'jaw': slice(0, 17)
+}
+# features compared by the order of their points rather than by their overall shape
+DTW_FEATURES = ('left_eyebrow', 'right_eyebrow', 'jaw')
+
+def normalize_shapes(landmarks):
+    """
+    Standardize every feature of one or more (..., 68, 2) landmark sets the way procrustes does before
+    aligning two shapes: centered on its centroid and scaled to unit Frobenius norm.
+    Stored once per profile so feature queries do not redo it for every candidate.
+    """
+    shapes = np.array(landmarks, dtype=np.float64)
+    for feature in FEATURE_SLICES.values():
+        points = shapes[..., feature, :]
+        points -= points.mean(axis=-2, keepdims=True)
+        norm = np.sqrt(np.sum(points**2, axis=(-2, -1), keepdims=True))
+        points /= np.where(norm > 0, norm, 1)
+    return shapes.astype(np.float32)
+
+def procrustes_disparities(shape, shapes):
+    """
+    Procrustes disparity between one normalized feature shape (P x 2) and N normalized shapes (N x P x 2),
+    equal to scipy.spatial.procrustes on each pair, in one batched computation.
+    For centered unit-norm shapes the best rotation (reflections allowed) and scale leave a disparity of
+    1 - (sum of the singular values of the 2 x 2 cross-covariance)^2.
+    """
+    cross = np.einsum('pi,npj->nij', np.asarray(shape, dtype=np.float64), np.asarray(shapes, dtype=np.float64))
+    singular_values = np.linalg.svd(cross, compute_uv=False)
+    return np.maximum(1 - singular_values.sum(axis=1)**2, 0)
@@ -0,0 +1,12 @@
+from .partition import shard_of, placement, merge_matches, merge_pages, merge_weighted
+from .coordinator import ShardCoordinator, ShardUnavailable
+
+__all__ = [
+    'ShardCoordinator',
+    'ShardUnavailable',
+    'shard_of',
+    'placement',
+    'merge_matches',
+    'merge_pages',
+    'merge_weighted'
+]
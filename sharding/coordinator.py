@@ -0,0 +1,184 @@
+import asyncio
+
+from storage import dumps
+from .partition import shard_of, placement, merge_matches, merge_pages, merge_weighted
+
+class ShardUnavailable(Exception):
+    """
+    Raised when the shard a request has to go to, or every shard of a fan-out, did not answer.
+    The API turns it into a 503.
+    """
+    pass
+
+def failure(reply):
+    # why a shard call did not produce an answer, or None if it did
+    if isinstance(reply, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(reply, Exception):
+        return "unreachable"
+    if reply.status_code != 200:
+        return f"HTTP {reply.status_code}"
+    return None
+
+class ShardCoordinator:
+    """
+    Front of a sharded gallery. Every shard is a server running this API over its own part of the profiles,
+    and the coordinator talks to them over pooled keep-alive HTTP connections (httpx, only needed on coordinators).
+
+    Searches go to every shard at once, each call bounded by timeout seconds, and the per-shard top k are merged.
+    Shards that time out or fail are left out and reported, so a slow or dead shard costs partial results
+    instead of failing the request. New profiles go to the shard placement() picks, which gives them an id of its stride,
+    and requests for a stored profile go to the shard shard_of() finds from its id.
+    """
+    def __init__(self, urls, timeout=2.0, connections=32):
+        self.urls = [url.rstrip("/") for url in urls]
+        self.timeout = timeout
+        self.connections = connections
+        self._client = None
+
+    def start(self):
+        if self._client is not None:
+            return
+        import httpx
+        # the pool limits are shared by all hosts, so allow connections per shard in total
+        pool_size = self.connections * len(self.urls)
+        self._client = httpx.AsyncClient(limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size), timeout=self.timeout)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, shard, method, path, payload=None, params=None):
+        # one call to one shard, bounded by the timeout as a whole: waiting for a pooled connection, sending and reading
+        self.start()
+        content = dumps(payload) if payload is not None else None
+        headers = {"Content-Type": "application/json"} if content is not None else None
+        call = self._client.request(method, self.urls[shard] + path, content=content, params=params, headers=headers)
+        return await asyncio.wait_for(call, self.timeout)
+
+    async def route(self, profile_id, method, path, params=None):
+        """
+        Send a call about one stored profile to the shard that holds it and return the shard's response.
+
+        Raises:
+            ShardUnavailable: _If the shard does not answer or fails._
+        """
+        shard = shard_of(profile_id, len(self.urls))
+        try:
+            reply = await self.request(shard, method, path, params=params)
+        except Exception as exc:
+            raise ShardUnavailable(f"Shard {shard} did not answer: {failure(exc)}") from exc
+        if reply.status_code >= 500:
+            raise ShardUnavailable(f"Shard {shard} did not answer: HTTP {reply.status_code}")
+        return reply
+
+    async def fan_out(self, method, path, payload=None, params=None):
+        """
+        Send the same call to every shard concurrently.
+
+        Raises:
+            ShardUnavailable: _If no shard answered._
+
+        Returns:
+            _(dict, list)_: _The decoded JSON answers by shard index, and a {"shard", "url", "error"} dict per shard that did not answer._
+        """
+        replies = await asyncio.gather(*(self.request(shard, method, path, payload, params) for shard in range(len(self.urls))), return_exceptions=True)
+        answers = {}
+        failed = []
+        for shard, reply in enumerate(replies):
+            error = failure(reply)
+            if error is None:
+                answers[shard] = reply.json()
+            else:
+                failed.append({"shard": shard, "url": self.urls[shard], "error": error})
+        if not answers:
+            raise ShardUnavailable("No shard answered")
+        return answers, failed
+
+    async def search(self, embedding, k=1, max_distance=None, nprobe=None):
+        """
+        Find the closest profiles over every shard, closest first.
+
+        Returns:
+            _(list, list, list)_: _Profile dicts, their distances, and the shards that did not answer._
+        """
+        payload = {"embedding": list(embedding), "k": k, "max_distance": max_distance, "nprobe": nprobe}
+        answers, failed = await self.fan_out("POST", "/shard/find-profiles", payload)
+        profiles, distances = merge_matches(answers.values(), k)
+        return profiles, distances, failed
+
+    async def closest_by_feature(self, landmarks, feature):
+        """
+        Find the profile whose facial feature is closest in shape over every shard.
+
+        Returns:
+            _(list, list, list)_: _At most one Profile dict, its distance, and the shards that did not answer._
+        """
+        answers, failed = await self.fan_out("POST", "/shard/find-closest-profile", {"landmarks": landmarks, "feature": feature})
+        profiles, distances = merge_matches(answers.values(), 1)
+        return profiles, distances, failed
+
+    async def weighted_search(self, profile, weights, k=10, shortlist=None, nprobe=None):
+        """
+        Find the best weighted matches over every shard. Scores only depend on the query and the candidate,
+        so merging the per-shard top k by score gives the top k of the whole gallery.
+
+        Returns:
+            _(list, list)_: _WeightedMatch dicts, best first, and the shards that did not answer._
+        """
+        payload = {"profile": profile.dict(exclude={"artifact_scores"}), "weights": weights, "k": k, "shortlist": shortlist, "nprobe": nprobe}
+        answers, failed = await self.fan_out("POST", "/shard/find-profiles-weighted", payload)
+        return merge_weighted(answers.values(), k), failed
+
+    async def list_profiles(self, cursor=None, limit=1000, format="full"):
+        """
+        One page of the profiles of every shard in id order, as /list-profiles.
+
+        Returns:
+            _(list, bool, list)_: _Profile dicts, whether more profiles follow, and the shards that did not answer._
+        """
+        params = {"limit": limit + 1, "format": format}
+        if cursor is not None:
+            params["cursor"] = cursor
+        answers, failed = await self.fan_out("GET", "/list-profiles", params=params)
+        profiles, more = merge_pages(answers.values(), limit)
+        return profiles, more, failed
+
+    async def delete_many(self, profile_ids):
+        """
+        Delete profiles on the shards that hold them, one call per shard.
+
+        Returns:
+            _(list, list, list)_: _The ids deleted, the ids no shard holds, and the ids of shards that did not answer._
+        """
+        by_shard = {}
+        for profile_id in dict.fromkeys(profile_ids):
+            by_shard.setdefault(shard_of(profile_id, len(self.urls)), []).append(profile_id)
+        shards = list(by_shard)
+        replies = await asyncio.gather(*(self.request(shard, "POST", "/delete-profiles", by_shard[shard]) for shard in shards), return_exceptions=True)
+        deleted, not_found, unavailable = [], [], []
+        for shard, reply in zip(shards, replies):
+            if failure(reply) is None:
+                answer = reply.json()
+                deleted.extend(answer["deleted"])
+                not_found.extend(answer["not_found"])
+            else:
+                unavailable.extend(by_shard[shard])
+        return deleted, not_found, unavailable
+
+    async def add(self, profile):
+        """
+        Store a profile on its shard and return the id the shard gave it.
+
+        Raises:
+            ShardUnavailable: _If the shard does not answer or fails._
+        """
+        shard = placement(profile.embedding, len(self.urls))
+        try:
+            reply = await self.request(shard, "POST", "/shard/add-profile", profile.dict(exclude={"id", "artifact_scores"}))
+        except Exception as exc:
+            raise ShardUnavailable(f"Shard {shard} did not answer: {failure(exc)}") from exc
+        if reply.status_code != 200:
+            raise ShardUnavailable(f"Shard {shard} did not answer: HTTP {reply.status_code}")
+        return reply.json()
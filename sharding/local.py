@@ -0,0 +1,52 @@
+"""
+Run a sharded gallery on this machine: shard servers on the ports after --port and a coordinator on --port,
+each a uvicorn process of this API configured through its FACE_API_SHARD_* variables.
+Other FACE_API_* variables are passed to every process. Stop them all with Ctrl-C.
+
+Usage:
+    python -m sharding.local --shards 3 --port 8000 --store-dir /var/lib/face-api
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+def start_server(port, host, environment):
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", host, "--port", str(port)], env=environment)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8000, help="port of the coordinator, shard i listens on port + 1 + i")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--store-dir", default=None, help="give every shard a persistent store in a shard-<i> directory under this one")
+    args = parser.parse_args()
+
+    urls = [f"http://{args.host}:{args.port + 1 + shard}" for shard in range(args.shards)]
+    servers = []
+    try:
+        for shard in range(args.shards):
+            environment = dict(os.environ, FACE_API_SHARD_INDEX=str(shard), FACE_API_SHARD_COUNT=str(args.shards))
+            environment.pop("FACE_API_SHARD_URLS", None)
+            if args.store_dir:
+                environment["FACE_API_STORE_DIR"] = os.path.join(args.store_dir, f"shard-{shard}")
+            servers.append(start_server(args.port + 1 + shard, args.host, environment))
+        # the coordinator only computes query profiles and keeps no gallery of its own
+        environment = dict(os.environ, FACE_API_SHARD_URLS=",".join(urls))
+        environment.pop("FACE_API_STORE_DIR", None)
+        servers.append(start_server(args.port, args.host, environment))
+        while all(server.poll() is None for server in servers):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            if server.poll() is None:
+                server.send_signal(signal.SIGINT)
+        for server in servers:
+            server.wait()
+
+if __name__ == "__main__":
+    main()
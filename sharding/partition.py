@@ -0,0 +1,38 @@
+import hashlib
+
+import numpy as np
+
+def shard_of(profile_id, shard_count):
+    # shards allocate ids in strides (id_offset and id_stride of the store), so the id alone names its shard
+    return profile_id % shard_count
+
+def placement(embedding, shard_count):
+    # the shard a new profile is stored on: a hash of its embedding spreads profiles evenly,
+    # and the same upload always lands on the same shard
+    digest = hashlib.blake2b(np.asarray(embedding, dtype=np.float32).tobytes(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % shard_count
+
+def merge_pages(answers, limit):
+    """
+    Merge pages of profiles listed by several shards, each in id order and holding up to limit + 1 profiles,
+    into the first limit profiles in id order, and whether more follow.
+    """
+    profiles = sorted((profile for answer in answers for profile in answer), key=lambda profile: profile["id"])
+    return profiles[:limit], len(profiles) > limit
+
+def merge_weighted(answers, k):
+    # merge the {"matches"} of several shards, each sorted by score, into the k best matches
+    matches = [match for answer in answers for match in answer["matches"]]
+    order = np.argsort(np.array([match["score"] for match in matches], dtype=np.float64), kind="stable")[:k]
+    return [matches[i] for i in order]
+
+def merge_matches(answers, k=None):
+    """
+    Merge the matches of several shards into one list, closest first.
+    Each answer is a {"found_profiles", "distances"} dict sorted by distance; ties keep the shard order.
+    Since every shard returns its own top k, the merged top k is exact whenever each shard's is.
+    """
+    profiles = [profile for answer in answers for profile in answer["found_profiles"]]
+    distances = np.array([distance for answer in answers for distance in answer["distances"]], dtype=np.float64)
+    order = np.argsort(distances, kind="stable")[:k]
+    return [profiles[i] for i in order], distances[order].tolist()
@@ -0,0 +1,14 @@
+from .store import ProfileStore, ARTIFACT_FIELDS
+from .persistent import PersistentProfileStore
+from .encoding import PROFILE_FORMATS, profile_dicts, dumps, decode_embedding, decode_landmarks
+
+__all__ = [
+    'ProfileStore',
+    'PersistentProfileStore',
+    'ARTIFACT_FIELDS',
+    'PROFILE_FORMATS',
+    'profile_dicts',
+    'dumps',
+    'decode_embedding',
+    'decode_landmarks'
+]
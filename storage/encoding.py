@@ -0,0 +1,62 @@
+import base64
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    # optional, only makes serialization faster
+    orjson = None
+
+from .store import ARTIFACT_FIELDS
+
+# "full" is the Profile JSON, "slim" leaves out the embedding and landmarks,
+# "binary" sends them base64-encoded as little-endian float16 (128) and int16 (68 x 2) arrays
+PROFILE_FORMATS = ("full", "slim", "binary")
+
+def profile_dicts(store, rows, format="full"):
+    """
+    JSON-ready dicts of the profiles at the given store rows, built from whole column slices at once
+    instead of one Profile model per row. The keys are those of Profile, in the same order.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    ids = store.ids[rows].tolist()
+    artifacts = store.artifacts[rows].tolist()
+    descriptions = [store.description(row) for row in rows.tolist()]
+    if format == "full":
+        embeddings = store.embeddings[rows].tolist()
+        landmarks = store.landmarks[rows].tolist()
+    elif format == "binary":
+        embeddings = [base64.b64encode(row.tobytes()).decode() for row in store.embeddings[rows].astype("<f2")]
+        landmarks = [base64.b64encode(row.tobytes()).decode() for row in store.landmarks[rows].astype("<i2")]
+    elif format == "slim":
+        embeddings = landmarks = [None] * len(rows)
+    else:
+        raise ValueError(f"Unknown profile format: {format}")
+    profiles = []
+    for profile_id, description, embedding, values, face in zip(ids, descriptions, embeddings, artifacts, landmarks):
+        profile = {"id": profile_id, "description": description}
+        if embedding is not None:
+            profile["embedding"] = embedding
+        profile["artifacts"] = dict(zip(ARTIFACT_FIELDS, values))
+        if face is not None:
+            profile["landmarks"] = face
+        profile["detection"] = None
+        profile["artifact_scores"] = None
+        profiles.append(profile)
+    return profiles
+
+def dumps(value):
+    # compact JSON bytes, through orjson when it is installed
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+def decode_embedding(data):
+    # inverse of the "binary" embedding encoding
+    return np.frombuffer(base64.b64decode(data), dtype="<f2").astype(np.float32)
+
+def decode_landmarks(data):
+    # inverse of the "binary" landmarks encoding
+    return np.frombuffer(base64.b64decode(data), dtype="<i2").reshape(-1, 2)
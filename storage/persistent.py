@@ -0,0 +1,285 @@
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+
+from search.shapes import normalize_shapes
+from .store import ProfileStore, ARTIFACT_FIELDS
+
+class PersistentProfileStore(ProfileStore):
+    """
+    Durable profile storage in a directory, shared by every worker process that opens it.
+
+    Each generation of the store is a set of files, in the directory itself for generation 0
+    and in gen-<n>/ after compactions, with CURRENT naming the live generation:
+
+    profiles.log      append-only JSON lines with profile metadata and descriptions
+                      ({"op": "add", "id", "row", "description"}, {"op": "delete", "ids"})
+    ids.i64           int64 profile id of each row
+    embeddings.f32    float32 N x 128
+    landmarks.i16     int16 N x 68 x 2
+    shapes.f32        float32 N x 68 x 2, normalized feature shapes
+    artifacts.f32     float32 N x 6
+    descriptions.i64  int64 N x 2, offset and length of each row's add record in profiles.log
+    alive.u8          one byte per row, written last, so its length is the number of complete rows
+
+    counter.i64 in the directory holds the next profile id and survives compactions.
+
+    Columns are memory-mapped read-only, so startup does not parse the log and every worker
+    shares the same pages. Writers take an exclusive lock on store.lock, write the row into
+    every column with pwrite and flip its alive byte; readers pick up new rows, tombstones
+    and new generations on refresh(). Compaction writes a fresh generation and switches
+    CURRENT atomically, so readers never see a half-written store.
+    """
+    memory_mapped = True
+
+    def __init__(self, directory, dim=128, n_landmarks=68, fsync=False, compact_ratio=0.25, compact_min_dead=1024, id_offset=0, id_stride=1):
+        self.directory = directory
+        self.dim = dim
+        self.n_landmarks = n_landmarks
+        self.id_offset = id_offset
+        self.id_stride = id_stride
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.compact_min_dead = compact_min_dead
+        os.makedirs(directory, exist_ok=True)
+        self._columns = {
+            "ids": ("ids.i64", np.int64, ()),
+            "embeddings": ("embeddings.f32", np.float32, (dim,)),
+            "landmarks": ("landmarks.i16", np.int16, (n_landmarks, 2)),
+            "shapes": ("shapes.f32", np.float32, (n_landmarks, 2)),
+            "artifacts": ("artifacts.f32", np.float32, (len(ARTIFACT_FIELDS),)),
+            "descriptions": ("descriptions.i64", np.int64, (2,)),
+            "alive": ("alive.u8", np.uint8, ()),
+        }
+        self._lock_fd = os.open(os.path.join(directory, "store.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        self._counter_fd = os.open(os.path.join(directory, "counter.i64"), os.O_RDWR | os.O_CREAT, 0o644)
+        self._fds = {}
+        self._log_fd = None
+        self.generation = None
+        self._row_of = np.full(0, -1, dtype=np.int64)
+        self._count = 0
+        with self._locked():
+            self._open_generation(self._current_generation())
+            self._upgrade()
+        self.refresh()
+
+    def __len__(self):
+        # other workers may delete rows at any time, so count from the shared alive column
+        return int(np.count_nonzero(self.alive))
+
+    def close(self):
+        self._close_generation()
+        os.close(self._lock_fd)
+        os.close(self._counter_fd)
+
+    def refresh(self):
+        generation = self._current_generation()
+        if generation != self.generation:
+            self._open_generation(generation)
+        # the alive column is written last, so its length counts rows that are complete in every column
+        rows = os.fstat(self._fds["alive"]).st_size
+        if rows != self._rows:
+            start = max(0, min(self._rows, rows))
+            self._rows = rows
+            for name in self._columns:
+                setattr(self, "_" + name, self._map(name, rows))
+            self._map_ids(self.ids[start:], np.arange(start, rows))
+
+    def delete_many(self, profile_ids):
+        with self._locked():
+            self.refresh()
+            deleted = {}
+            for profile_id in profile_ids:
+                row = self.row_of(profile_id)
+                if row is not None:
+                    deleted[profile_id] = row
+            if deleted:
+                self._write_log({"op": "delete", "ids": list(deleted)})
+                for row in deleted.values():
+                    os.pwrite(self._fds["alive"], b"\x00", row)
+                self._sync()
+        if deleted:
+            self.maybe_compact()
+        return list(deleted)
+
+    def deletions(self, position=None):
+        # the delete records appended to this generation's profiles.log since the byte offset position; read under the lock,
+        # so the alive bytes of every record read are already cleared and readers that count alive rows agree with it
+        with self._locked():
+            end = os.fstat(self._log_fd).st_size
+            data = os.pread(self._log_fd, end - position, position) if position is not None and end > position else b""
+        rows = []
+        for line in data.splitlines():
+            if b'"delete"' in line:
+                record = json.loads(line)
+                if record["op"] == "delete":
+                    ids = np.asarray(record["ids"], dtype=np.int64)
+                    # rows appended after the last refresh are not mapped yet, and are already dead when they are read
+                    mapped = self._row_of[ids[ids < len(self._row_of)]]
+                    rows.append(mapped[(mapped >= 0) & (mapped < self._rows)])
+        return (np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)), end
+
+    def clear(self):
+        self._rewrite(keep_live=False)
+
+    def compact(self):
+        self._rewrite(keep_live=True)
+
+    def description(self, row):
+        offset, length = self._descriptions[row]
+        record = os.pread(self._log_fd, int(length), int(offset))
+        return json.loads(record)["description"]
+
+    def _allocate_id(self):
+        with self._locked():
+            data = os.pread(self._counter_fd, 8, 0)
+            profile_id = self._aligned_id(int(np.frombuffer(data, dtype=np.int64)[0]) if len(data) == 8 else 0)
+            os.pwrite(self._counter_fd, np.int64(profile_id + self.id_stride).tobytes(), 0)
+        return profile_id
+
+    def _id_order(self):
+        # workers sharing the store may append ids slightly out of order, so the rows are sorted by id once per generation,
+        # and sorted again only when rows picked up since do not all follow the last sorted id
+        sorted_rows = len(self._order)
+        if sorted_rows < self._rows:
+            ids = np.asarray(self.ids)
+            tail = ids[sorted_rows:]
+            if np.all(tail[1:] > tail[:-1]) and (sorted_rows == 0 or tail[0] > self._sorted_ids[-1]):
+                self._order = np.concatenate([self._order, np.arange(sorted_rows, self._rows)])
+                self._sorted_ids = np.concatenate([self._sorted_ids, tail])
+            else:
+                self._order = np.argsort(ids, kind="stable")
+                self._sorted_ids = ids[self._order]
+        return self._order, self._sorted_ids
+
+    def _append_row(self, profile_id, embedding, landmarks, shapes, artifacts, description):
+        with self._locked():
+            self.refresh()
+            row = self._rows
+            offset, length = self._write_log({"op": "add", "id": profile_id, "row": row, "description": description})
+            values = {"ids": profile_id, "embeddings": embedding, "landmarks": landmarks, "shapes": shapes, "artifacts": artifacts,
+                      "descriptions": np.array([offset, length])}
+            for name, value in values.items():
+                _, dtype, shape = self._columns[name]
+                data = np.ascontiguousarray(value, dtype=dtype).reshape(shape).tobytes()
+                os.pwrite(self._fds[name], data, row * len(data))
+            self._sync()
+            # commit point: readers only see the row once its alive byte exists
+            os.pwrite(self._fds["alive"], b"\x01", row)
+            self._sync()
+        self.refresh()
+        return row
+
+    def _rewrite(self, keep_live):
+        # write the live rows (or none) into a new generation, then switch CURRENT to it
+        with self._locked():
+            self.refresh()
+            old_path = self._generation_path(self.generation)
+            generation = self.generation + 1
+            path = self._generation_path(generation)
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+            live = self.live_rows() if keep_live else np.empty(0, dtype=np.int64)
+            offsets = np.empty((len(live), 2), dtype=np.int64)
+            with open(os.path.join(path, "profiles.log"), "wb") as log:
+                for new_row, row in enumerate(live):
+                    record = (json.dumps({"op": "add", "id": int(self.ids[row]), "row": new_row, "description": self.description(row)}) + "\n").encode()
+                    offsets[new_row] = (log.tell(), len(record))
+                    log.write(record)
+            for name, (filename, dtype, _) in self._columns.items():
+                with open(os.path.join(path, filename), "wb") as column:
+                    if name == "descriptions":
+                        column.write(offsets.tobytes())
+                    elif name == "alive":
+                        column.write(np.ones(len(live), dtype=np.uint8).tobytes())
+                    else:
+                        source = getattr(self, "_" + name)
+                        for start in range(0, len(live), 65536):
+                            column.write(np.ascontiguousarray(source[live[start:start + 65536]], dtype=dtype).tobytes())
+                    if self.fsync:
+                        column.flush()
+                        os.fsync(column.fileno())
+            current = os.path.join(self.directory, "CURRENT")
+            with open(current + ".tmp", "w") as f:
+                f.write(str(generation))
+            os.replace(current + ".tmp", current)
+            self.refresh()
+            # other workers keep their mappings of the old files valid until they refresh
+            if old_path != self.directory:
+                shutil.rmtree(old_path, ignore_errors=True)
+            else:
+                for filename in ["profiles.log"] + [filename for filename, _, _ in self._columns.values()]:
+                    os.remove(os.path.join(old_path, filename))
+
+    def _upgrade(self):
+        # stores written before ids existed used the row as the id
+        rows = os.fstat(self._fds["alive"]).st_size
+        if os.fstat(self._fds["ids"]).st_size < 8 * rows:
+            os.pwrite(self._fds["ids"], np.arange(rows, dtype=np.int64).tobytes(), 0)
+        # and had no normalized shapes column
+        shape_size = 4 * self.n_landmarks * 2
+        if os.fstat(self._fds["shapes"]).st_size < shape_size * rows:
+            landmarks = self._map("landmarks", rows)
+            for start in range(0, rows, 65536):
+                os.pwrite(self._fds["shapes"], normalize_shapes(landmarks[start:start + 65536]).tobytes(), start * shape_size)
+        if os.fstat(self._counter_fd).st_size < 8:
+            self.refresh()
+            next_id = int(self.ids.max()) + 1 if self._rows else 0
+            os.pwrite(self._counter_fd, np.int64(next_id).tobytes(), 0)
+
+    def _current_generation(self):
+        try:
+            with open(os.path.join(self.directory, "CURRENT")) as f:
+                return int(f.read())
+        except FileNotFoundError:
+            return 0
+
+    def _generation_path(self, generation):
+        return self.directory if generation == 0 else os.path.join(self.directory, f"gen-{generation}")
+
+    def _open_generation(self, generation):
+        self._close_generation()
+        path = self._generation_path(generation)
+        self._fds = {name: os.open(os.path.join(path, filename), os.O_RDWR | os.O_CREAT, 0o644) for name, (filename, _, _) in self._columns.items()}
+        self._log_fd = os.open(os.path.join(path, "profiles.log"), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self.generation = generation
+        self._rows = -1
+        self._row_of = np.full(0, -1, dtype=np.int64)
+        self._order = np.empty(0, dtype=np.int64)
+        self._sorted_ids = np.empty(0, dtype=np.int64)
+
+    def _close_generation(self):
+        for fd in list(self._fds.values()) + ([self._log_fd] if self._log_fd is not None else []):
+            os.close(fd)
+        self._fds = {}
+        self._log_fd = None
+
+    def _write_log(self, record):
+        data = (json.dumps(record) + "\n").encode()
+        # the log is opened with O_APPEND and only written under the lock, so its size is our offset
+        offset = os.fstat(self._log_fd).st_size
+        os.write(self._log_fd, data)
+        return offset, len(data)
+
+    def _map(self, name, rows):
+        filename, dtype, shape = self._columns[name]
+        if rows == 0:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.memmap(os.path.join(self._generation_path(self.generation), filename), dtype=dtype, mode="r", shape=(rows,) + shape)
+
+    def _sync(self):
+        if self.fsync:
+            for fd in list(self._fds.values()) + [self._log_fd]:
+                os.fsync(fd)
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
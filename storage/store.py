@@ -0,0 +1,252 @@
+import numpy as np
+
+from models import Artifacts, Profile
+from search.shapes import normalize_shapes
+
+ARTIFACT_FIELDS = list(Artifacts.__fields__)
+
+class ProfileStore:
+    """
+    Columnar in-memory profile storage, keyed by profile id.
+    Each profile is one row of packed arrays: ids (int64), embeddings (float32 N x 128),
+    landmarks (int16 N x 68 x 2), normalized feature shapes (float32 N x 68 x 2, see normalize_shapes),
+    artifacts (float32 N x 6) and an alive flag, plus its description.
+    Ids come from a monotonic allocator and are never reused; a shard allocates only the ids
+    id_offset, id_offset + id_stride, ... so that id % id_stride names the shard that holds it. A dense id -> row array gives O(1)
+    get and delete. Deleting only clears the row's alive flag (a tombstone), so the search indexes
+    built on the embedding column stay valid, and journals the row, so deletions() tells incremental readers
+    which rows died without a scan of the alive column. Once enough rows are dead the columns are compacted,
+    which renumbers rows and bumps the store generation so indexes know to re-sync.
+    Profile models are only built when a profile is returned.
+    """
+    # the columns are in this process's memory, not memory-mapped files shared with other workers
+    memory_mapped = False
+
+    def __init__(self, dim=128, n_landmarks=68, capacity=1024, compact_ratio=0.25, compact_min_dead=1024, id_offset=0, id_stride=1):
+        self.dim = dim
+        self.n_landmarks = n_landmarks
+        self.id_offset = id_offset
+        self.id_stride = id_stride
+        self.compact_ratio = compact_ratio
+        self.compact_min_dead = compact_min_dead
+        self.generation = 0
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._embeddings = np.empty((capacity, dim), dtype=np.float32)
+        self._landmarks = np.empty((capacity, n_landmarks, 2), dtype=np.int16)
+        self._shapes = np.empty((capacity, n_landmarks, 2), dtype=np.float32)
+        self._artifacts = np.empty((capacity, len(ARTIFACT_FIELDS)), dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=np.uint8)
+        self._descriptions = []
+        self._row_of = np.full(capacity, -1, dtype=np.int64)
+        self._next_id = 0
+        self._rows = 0
+        self._count = 0
+        self._deleted = []
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def rows(self):
+        # number of rows in the columns, including tombstoned ones
+        return self._rows
+
+    @property
+    def ids(self):
+        return self._ids[:self._rows]
+
+    @property
+    def embeddings(self):
+        return self._embeddings[:self._rows]
+
+    @property
+    def landmarks(self):
+        return self._landmarks[:self._rows]
+
+    @property
+    def shapes(self):
+        return self._shapes[:self._rows]
+
+    @property
+    def artifacts(self):
+        return self._artifacts[:self._rows]
+
+    @property
+    def alive(self):
+        return self._alive[:self._rows]
+
+    def refresh(self):
+        # nothing can change behind the back of an in-memory store
+        pass
+
+    def add(self, profile):
+        profile_id = self._allocate_id()
+        landmarks = np.asarray(profile.landmarks, dtype=np.int16)
+        row = self._append_row(
+            profile_id,
+            np.asarray(profile.embedding, dtype=np.float32),
+            landmarks,
+            normalize_shapes(landmarks),
+            np.array([getattr(profile.artifacts, name) for name in ARTIFACT_FIELDS], dtype=np.float32),
+            profile.description)
+        self._map_ids(profile_id, row)
+        self._count += 1
+        profile.id = profile_id
+        return profile_id
+
+    def row_of(self, profile_id):
+        if 0 <= profile_id < len(self._row_of):
+            row = self._row_of[profile_id]
+            if 0 <= row < self._rows and self.alive[row]:
+                return int(row)
+        return None
+
+    def get(self, profile_id):
+        row = self.row_of(profile_id)
+        return self.profile_at(row) if row is not None else None
+
+    def delete(self, profile_id):
+        return len(self.delete_many([profile_id])) == 1
+
+    def delete_many(self, profile_ids):
+        """
+        Tombstone every live profile in profile_ids and return the ids that were deleted.
+        Compacts the columns afterwards if enough rows are dead.
+        """
+        deleted = {}
+        for profile_id in profile_ids:
+            row = self.row_of(profile_id)
+            if row is not None:
+                deleted[profile_id] = row
+        if deleted:
+            self._set_dead(list(deleted.values()))
+            self._deleted.extend(deleted.values())
+            self._row_of[list(deleted)] = -1
+            self._count -= len(deleted)
+            self.maybe_compact()
+        return list(deleted)
+
+    def clear(self):
+        self._rows = 0
+        self._count = 0
+        self._descriptions = []
+        self._row_of[:] = -1
+        self._deleted = []
+        self.generation += 1
+
+    def deletions(self, position=None):
+        """
+        Rows tombstoned since position in the deletion journal of the current generation, and the position to read on from.
+        Without a position nothing is returned, only the current end of the journal.
+        Compactions and clears start a new journal, like they renumber the rows.
+
+        Returns:
+            _(np.ndarray, int)_: _The rows, in deletion order, and the new position._
+        """
+        if position is None:
+            return np.empty(0, dtype=np.int64), len(self._deleted)
+        return np.array(self._deleted[position:], dtype=np.int64), len(self._deleted)
+
+    def maybe_compact(self):
+        dead = self.rows - len(self)
+        if dead >= self.compact_min_dead and dead > self.compact_ratio * self.rows:
+            self.compact()
+
+    def compact(self):
+        # move live rows to the front of every column, keeping their order
+        live = self.live_rows()
+        for name in ("_ids", "_embeddings", "_landmarks", "_shapes", "_artifacts", "_alive"):
+            column = getattr(self, name)
+            column[:len(live)] = column[live]
+        self._descriptions = [self._descriptions[row] for row in live]
+        self._rows = len(live)
+        self._row_of[:] = -1
+        self._row_of[self.ids] = np.arange(self._rows)
+        self._deleted = []
+        self.generation += 1
+
+    def live_rows(self):
+        return np.flatnonzero(self.alive)
+
+    def rows_after(self, profile_id=None, limit=None):
+        # the first limit live rows with an id greater than profile_id, in id order, for cursor pagination;
+        # the cursor is bisected in the id order of the rows, so a page only looks at the rows from there on
+        order, ids = self._id_order()
+        position = 0 if profile_id is None else int(np.searchsorted(ids, profile_id, side="right"))
+        alive = self.alive
+        pages = []
+        found = 0
+        while position < len(ids) and (limit is None or found < limit):
+            # twice the rows still missing, so a few dead rows rarely cost another pass
+            stop = len(ids) if limit is None else min(len(ids), position + 2 * (limit - found))
+            rows = np.arange(position, stop) if order is None else order[position:stop]
+            rows = rows[alive[rows] != 0]
+            pages.append(rows)
+            found += len(rows)
+            position = stop
+        rows = np.concatenate(pages) if pages else np.empty(0, dtype=np.int64)
+        return rows[:limit]
+
+    def profiles(self):
+        return [self.profile_at(row) for row in self.live_rows()]
+
+    def profile_at(self, row):
+        row = int(row)
+        artifacts = Artifacts(**dict(zip(ARTIFACT_FIELDS, self.artifacts[row].tolist())))
+        return Profile(id=int(self.ids[row]), description=self.description(row), embedding=self.embeddings[row].tolist(),
+                       artifacts=artifacts, landmarks=self.landmarks[row].tolist())
+
+    def description(self, row):
+        return self._descriptions[row]
+
+    def _id_order(self):
+        # the rows in id order and their sorted ids, with None for rows that already are in id order:
+        # ids are allocated in increasing order and compaction keeps the order of the rows
+        return None, self.ids
+
+    def _allocate_id(self):
+        profile_id = self._aligned_id(self._next_id)
+        self._next_id = profile_id + self.id_stride
+        return profile_id
+
+    def _aligned_id(self, profile_id):
+        # the first id of this store's sequence id_offset, id_offset + id_stride, ... that is at least profile_id
+        if profile_id <= self.id_offset:
+            return self.id_offset
+        return self.id_offset + -(-(profile_id - self.id_offset) // self.id_stride) * self.id_stride
+
+    def _map_ids(self, profile_ids, rows):
+        profile_ids = np.atleast_1d(profile_ids)
+        if len(profile_ids) == 0:
+            return
+        size = int(profile_ids.max()) + 1
+        if size > len(self._row_of):
+            row_of = np.full(max(size, 2 * len(self._row_of)), -1, dtype=np.int64)
+            row_of[:len(self._row_of)] = self._row_of
+            self._row_of = row_of
+        self._row_of[profile_ids] = rows
+
+    def _append_row(self, profile_id, embedding, landmarks, shapes, artifacts, description):
+        if self._rows == len(self._embeddings):
+            self._grow()
+        row = self._rows
+        self._ids[row] = profile_id
+        self._embeddings[row] = embedding
+        self._landmarks[row] = landmarks
+        self._shapes[row] = shapes
+        self._artifacts[row] = artifacts
+        self._descriptions.append(description)
+        self._alive[row] = 1
+        self._rows += 1
+        return row
+
+    def _set_dead(self, rows):
+        self._alive[rows] = 0
+
+    def _grow(self):
+        capacity = max(1, 2 * len(self._embeddings))
+        for name in ("_ids", "_embeddings", "_landmarks", "_shapes", "_artifacts", "_alive"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._rows] = old[:self._rows]
+            setattr(self, name, new)
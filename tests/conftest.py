@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from models import Artifacts, Profile
+from storage import ARTIFACT_FIELDS
+
+def random_profiles(n, seed=0, dim=128, n_landmarks=68):
+    # profiles with clustered embeddings (about five per identity), jittered landmarks and random artifacts,
+    # built without the detectors or the pipeline
+    rng = np.random.default_rng(seed)
+    identities = rng.normal(size=(max(1, n // 5), dim)).astype(np.float32)
+    identities /= np.linalg.norm(identities, axis=1, keepdims=True)
+    embeddings = identities[rng.integers(0, len(identities), size=n)] + rng.normal(scale=0.15 / np.sqrt(dim), size=(n, dim)).astype(np.float32)
+    template = rng.integers(100, 400, size=(n_landmarks, 2))
+    landmarks = template + rng.integers(-5, 6, size=(n, n_landmarks, 2))
+    artifacts = rng.random((n, len(ARTIFACT_FIELDS)))
+    return [Profile.construct(description=f"Face {i}.", embedding=embeddings[i].tolist(), landmarks=landmarks[i].tolist(),
+                              artifacts=Artifacts.construct(**dict(zip(ARTIFACT_FIELDS, artifacts[i].tolist()))))
+            for i in range(n)]
+
+@pytest.fixture
+def make_profiles():
+    return random_profiles
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from search import DTW_FEATURES, FEATURE_SLICES, DTWIndex, dtw_distances
+from storage import ProfileStore
+
+def reference_dtw(query, candidate, band=None):
+    # the textbook dynamic program, one cell at a time
+    n, m = len(query), len(candidate)
+    band = max(n, m) if band is None else max(band, abs(n - m))
+    total = np.full((n + 1, m + 1), np.inf)
+    total[0, 0] = 0
+    for i in range(1, n + 1):
+        for j in range(max(1, i - band), min(m, i + band) + 1):
+            cost = np.linalg.norm(np.subtract(query[i - 1], candidate[j - 1]))
+            total[i, j] = cost + min(total[i - 1, j], total[i, j - 1], total[i - 1, j - 1])
+    return total[n, m]
+
+@pytest.mark.parametrize("n, m, band", [(5, 5, None), (5, 5, 0), (5, 5, 1), (17, 17, 3), (17, 12, 2), (6, 9, None)])
+def test_dtw_distances_match_reference(n, m, band):
+    rng = np.random.default_rng(n * 100 + m)
+    query = rng.uniform(0, 100, size=(n, 2))
+    candidates = rng.uniform(0, 100, size=(30, m, 2))
+    expected = [reference_dtw(query, candidate, band) for candidate in candidates]
+    assert np.allclose(dtw_distances(query, candidates, band), expected)
+
+@pytest.mark.parametrize("band", [0, 3, None])
+def test_index_finds_the_brute_force_nearest(make_profiles, band):
+    store = ProfileStore()
+    for profile in make_profiles(120, seed=12):
+        store.add(profile)
+    store.delete_many([int(profile_id) for profile_id in store.ids[::7]])
+    # a small batch size makes the search stop early on its lower bounds instead of comparing everything in one batch
+    index = DTWIndex(store, band=band, batch_size=2)
+    rows = store.live_rows()
+    for query in make_profiles(5, seed=13):
+        landmarks = np.asarray(query.landmarks)
+        for feature in DTW_FEATURES:
+            feature_slice = FEATURE_SLICES[feature]
+            expected = [reference_dtw(landmarks[feature_slice], store.landmarks[row, feature_slice], band) for row in rows]
+            row, distance = index.search(landmarks, feature)
+            assert distance == pytest.approx(min(expected))
+            assert row == rows[int(np.argmin(expected))]
+
+def test_index_follows_compaction(make_profiles):
+    store = ProfileStore(compact_min_dead=1)
+    profiles = make_profiles(40, seed=14)
+    for profile in profiles:
+        store.add(profile)
+    index = DTWIndex(store)
+    index.sync()
+    store.delete_many([int(profile_id) for profile_id in store.ids[:20]])
+    store.compact()
+    row, distance = index.search(np.asarray(profiles[30].landmarks), "jaw")
+    assert distance == 0 and store.ids[row] == profiles[30].id
+    assert index.search(np.asarray(profiles[30].landmarks), "jaw", rows=np.array([], dtype=np.int64)) == (None, np.inf)
@@ -0,0 +1,22 @@
+import numpy as np
+
+from search import IVFIndex
+from storage import ProfileStore
+
+def test_compaction_keeps_trained_clusters(make_profiles):
+    store = ProfileStore(compact_min_dead=1)
+    for profile in make_profiles(300):
+        store.add(profile)
+    index = IVFIndex(store, n_lists=8, nprobe=8, train_size=100)
+    index.sync()
+    centroids = index.centroids.copy()
+    store.delete_many([int(profile_id) for profile_id in store.ids[:120]])
+    store.compact()
+    index.sync()
+    assert index.trained
+    assert np.array_equal(index.centroids, centroids)
+    # the renumbered live rows are all in the lists, and searches still find them
+    members = np.sort(np.concatenate([index._lists[label][:index._list_sizes[label]] for label in range(len(index._lists))]))
+    assert np.array_equal(members, store.live_rows())
+    rows, distances = index.search(store.embeddings[5], k=1)
+    assert rows[0] == 5 and distances[0] < 1e-3
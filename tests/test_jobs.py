@@ -0,0 +1,169 @@
+import asyncio
+import io
+import os
+import zipfile
+
+import pytest
+
+import jobs.queue
+from jobs import JobQueue, JobRunner
+
+class Clock:
+    # stands in for the time module of jobs.queue, so leases expire without sleeping
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jobs.queue, "time", clock)
+    return clock
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    yield queue
+    queue.close()
+
+def write_archive(path, n):
+    with zipfile.ZipFile(path, "w") as archive:
+        for i in range(n):
+            archive.writestr(f"image-{i}.png", f"image {i}".encode())
+    return str(path)
+
+def test_expired_lease_is_taken_over(tmp_path, queue, clock):
+    other = JobQueue(queue.path)
+    job_id = queue.submit("create_profiles", write_archive(tmp_path / "input.zip", 1))
+    assert queue.claim(lease=60)["attempts"] == 1
+    # the lease holds the job while it runs, for this and every other process sharing the database
+    clock.now += 59
+    assert other.claim(lease=60) is None
+    clock.now += 2
+    job = other.claim(lease=60)
+    assert job["id"] == job_id and job["status"] == "running" and job["attempts"] == 2
+    assert job["lease_until"] == clock.now + 60
+    other.close()
+
+def test_expired_lease_after_the_last_attempt_fails_the_job(tmp_path, queue, clock):
+    path = write_archive(tmp_path / "input.zip", 1)
+    job_id = queue.submit("create_profiles", path, max_attempts=1)
+    queue.claim(lease=60)
+    clock.now += 61
+    assert queue.claim(lease=60) is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["error"] == "Worker stopped while running the job"
+    assert not os.path.exists(path)
+
+def test_renew_extends_a_running_lease(tmp_path, queue, clock):
+    job_id = queue.submit("create_profiles", write_archive(tmp_path / "input.zip", 1))
+    queue.claim(lease=60)
+    clock.now += 50
+    queue.renew(job_id, lease=60)
+    clock.now += 50
+    assert queue.claim(lease=60) is None
+    assert queue.get(job_id)["lease_until"] == clock.now - 50 + 60
+
+def test_heartbeat_renews_the_lease_during_a_long_chunk(tmp_path, queue):
+    other = JobQueue(queue.path)
+    queue.submit("create_profiles", write_archive(tmp_path / "input.zip", 2))
+    claims = []
+
+    async def handler(chunk, start, job_id):
+        # outlasts the lease several times; another worker looks for the job meanwhile
+        for _ in range(4):
+            await asyncio.sleep(0.2)
+            claims.append(await asyncio.to_thread(other.claim, 0.3))
+        return [{"index": start + offset} for offset in range(len(chunk))]
+
+    runner = JobRunner(queue, {"create_profiles": handler}, lease=0.3, chunk_size=2)
+    job = queue.claim(runner.lease)
+    asyncio.run(runner.run(job))
+    assert claims == [None] * 4
+    assert queue.get(job["id"])["status"] == "succeeded"
+    other.close()
+
+def test_retried_job_resumes_after_the_last_recorded_item(tmp_path, queue):
+    job_id = queue.submit("create_profiles", write_archive(tmp_path / "input.zip", 5))
+    starts = []
+
+    async def handler(chunk, start, job_id):
+        starts.append(start)
+        if start == 2 and starts.count(2) == 1:
+            raise RuntimeError("worker lost")
+        return [{"index": start + offset, "filename": filename} for offset, (filename, _) in enumerate(chunk)]
+
+    runner = JobRunner(queue, {"create_profiles": handler}, chunk_size=2)
+    with pytest.raises(RuntimeError):
+        asyncio.run(runner.run(queue.claim(runner.lease)))
+    assert queue.retry(job_id, "RuntimeError: worker lost") == "queued"
+    job = queue.claim(runner.lease)
+    assert job["done"] == 2 and job["total"] == 5 and job["attempts"] == 2
+    asyncio.run(runner.run(job))
+    assert starts == [0, 2, 2, 4]
+    job = queue.get(job_id)
+    assert job["status"] == "succeeded" and job["done"] == 5
+    assert [result["filename"] for result in queue.results(job_id)] == [f"image-{i}.png" for i in range(5)]
+
+def test_retry_accounting(tmp_path, queue):
+    path = write_archive(tmp_path / "input.zip", 1)
+    job_id = queue.submit("create_profiles", path, max_attempts=2)
+    queue.claim(lease=60)
+    assert queue.retry(job_id, "RuntimeError: first") == "queued"
+    # a shutdown gives the job back without using up an attempt
+    queue.claim(lease=60)
+    queue.release(job_id)
+    assert queue.get(job_id)["attempts"] == 1
+    queue.claim(lease=60)
+    assert queue.retry(job_id, "RuntimeError: second") == "failed"
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2 and job["error"] == "RuntimeError: second"
+    assert not os.path.exists(path)
+    assert queue.claim(lease=60) is None
+
+def test_retry_of_a_cancelled_job(tmp_path, queue):
+    job_id = queue.submit("create_profiles", write_archive(tmp_path / "input.zip", 1))
+    queue.claim(lease=60)
+    assert queue.cancel(job_id)["status"] == "running"
+    assert queue.retry(job_id, "RuntimeError: worker lost") == "cancelled"
+
+class FailingQueue(JobQueue):
+    # loses the worker once, right after it stored the profile of item fail_item and before it recorded its id
+    fail_item = None
+
+    def record_item(self, job_id, item, result):
+        if item == self.fail_item and "id" in result:
+            self.fail_item = None
+            raise RuntimeError("worker lost")
+        super().record_item(job_id, item, result)
+
+def test_retried_ingest_stores_each_image_once(tmp_path, monkeypatch, make_profiles):
+    main = pytest.importorskip("main")
+    queue = FailingQueue(str(tmp_path / "jobs.sqlite3"))
+    queue.fail_item = 1
+    profiles = dict(zip((f"image {i}".encode() for i in range(3)), make_profiles(3, seed=3)))
+
+    async def read_profile(data, wait=False):
+        return profiles[data].copy()
+
+    monkeypatch.setattr(main, "job_queue", queue)
+    monkeypatch.setattr(main, "read_profile", read_profile)
+    main.profile_store.clear()
+    main.embedding_index.sync()
+    job_id = queue.submit("create_profiles", write_archive(tmp_path / "input.zip", 3))
+    chunk = [(f"image-{i}.png", f"image {i}".encode()) for i in range(3)]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main.ingest_results(chunk, 0, job_id))
+    # item 0 was recorded, item 1 was stored but only marked pending, item 2 was not reached
+    assert len(main.profile_store) == 2
+    results = asyncio.run(main.ingest_results(chunk, 0, job_id))
+    assert len(main.profile_store) == 3
+    ids = [result["id"] for result in results]
+    assert sorted(ids) == sorted(int(profile_id) for profile_id in main.profile_store.ids)
+    assert [main.profile_store.get(profile_id).description for profile_id in ids] == [f"Face {i}." for i in range(3)]
+    main.profile_store.clear()
+    main.embedding_index.sync()
+    queue.close()
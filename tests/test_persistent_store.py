@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+
+from search.shapes import normalize_shapes
+from storage import ARTIFACT_FIELDS, PersistentProfileStore
+
+def add_all(store, profiles):
+    return [store.add(profile) for profile in profiles]
+
+def test_reopen_after_writes(tmp_path, make_profiles):
+    profiles = make_profiles(20)
+    store = PersistentProfileStore(str(tmp_path))
+    ids = add_all(store, profiles)
+    assert store.delete(ids[3])
+    store.close()
+
+    store = PersistentProfileStore(str(tmp_path))
+    assert len(store) == 19
+    assert store.get(ids[3]) is None
+    profile = store.get(ids[7])
+    assert profile.description == profiles[7].description
+    assert np.array_equal(np.asarray(profile.embedding, dtype=np.float32), np.asarray(profiles[7].embedding, dtype=np.float32))
+    assert profile.landmarks == profiles[7].landmarks
+    # ids are never reused, not even the deleted one
+    assert store.add(make_profiles(1, seed=1)[0]) == max(ids) + 1
+
+def test_second_instance_refresh(tmp_path, make_profiles):
+    writer = PersistentProfileStore(str(tmp_path))
+    reader = PersistentProfileStore(str(tmp_path))
+    ids = add_all(writer, make_profiles(5))
+    assert reader.rows == 0
+    reader.refresh()
+    assert reader.rows == 5 and len(reader) == 5
+    assert reader.get(ids[4]).description == writer.get(ids[4]).description
+    # both write to the same files: ids keep coming from the shared counter, deletes are seen by the other
+    assert reader.add(make_profiles(1, seed=1)[0]) == max(ids) + 1
+    assert reader.delete(ids[2])
+    writer.refresh()
+    assert writer.rows == 6 and len(writer) == 5
+    assert writer.row_of(ids[2]) is None
+
+def test_compaction_across_generations(tmp_path, make_profiles):
+    store = PersistentProfileStore(str(tmp_path), compact_min_dead=10 ** 6)
+    other = PersistentProfileStore(str(tmp_path), compact_min_dead=10 ** 6)
+    profiles = make_profiles(30)
+    ids = add_all(store, profiles)
+    store.delete_many(ids[:10])
+    store.compact()
+    assert store.generation == 1 and store.rows == 20
+    assert os.path.isdir(os.path.join(str(tmp_path), "gen-1"))
+    assert not os.path.exists(os.path.join(str(tmp_path), "ids.i64"))
+    # ids and descriptions survive the renumbering
+    assert store.get(ids[15]).description == profiles[15].description
+    assert store.row_of(ids[10]) == 0
+
+    other.refresh()
+    assert other.generation == 1 and len(other) == 20
+    assert other.get(ids[29]).description == profiles[29].description
+    other.delete(ids[10])
+    other.compact()
+    assert not os.path.exists(os.path.join(str(tmp_path), "gen-1"))
+
+    store.refresh()
+    assert store.generation == 2 and len(store) == 19
+    store.close()
+    store = PersistentProfileStore(str(tmp_path))
+    assert store.generation == 2 and len(store) == 19
+    assert store.add(make_profiles(1, seed=1)[0]) == max(ids) + 1
+
+def test_clear_starts_an_empty_generation(tmp_path, make_profiles):
+    store = PersistentProfileStore(str(tmp_path))
+    ids = add_all(store, make_profiles(5))
+    store.clear()
+    assert store.rows == 0 and len(store) == 0 and store.get(ids[0]) is None
+    assert store.add(make_profiles(1, seed=1)[0]) == max(ids) + 1
+
+def test_upgrade_from_layout_without_ids_shapes_and_counter(tmp_path, make_profiles):
+    profiles = make_profiles(12)
+    store = PersistentProfileStore(str(tmp_path))
+    add_all(store, profiles)
+    store.close()
+    # stores written before ids existed used the row as the id and had no shapes column or id counter
+    for filename in ("ids.i64", "shapes.f32", "counter.i64"):
+        os.remove(os.path.join(str(tmp_path), filename))
+
+    store = PersistentProfileStore(str(tmp_path))
+    assert np.array_equal(store.ids, np.arange(12))
+    assert np.allclose(store.shapes, normalize_shapes(store.landmarks))
+    assert store.get(5).description == profiles[5].description
+    assert store.add(make_profiles(1, seed=1)[0]) == 12
+
+def test_deletions_journal_of_another_instance(tmp_path, make_profiles):
+    store = PersistentProfileStore(str(tmp_path))
+    other = PersistentProfileStore(str(tmp_path))
+    ids = add_all(store, make_profiles(8))
+    _, position = store.deletions()
+    other.refresh()
+    other.delete_many([ids[1], ids[6]])
+    store.refresh()
+    rows, position = store.deletions(position)
+    assert sorted(rows.tolist()) == [1, 6]
+    assert store.deletions(position)[0].size == 0
+
+def test_rows_after_with_ids_appended_out_of_order(tmp_path, make_profiles):
+    store = PersistentProfileStore(str(tmp_path))
+    other = PersistentProfileStore(str(tmp_path))
+    profiles = make_profiles(40)
+    ids = add_all(store, profiles[:30])
+    # two workers allocate ids 30 and 31 and append their rows in the opposite order
+    for profile_id, profile in ((31, profiles[31]), (30, profiles[30])):
+        other._append_row(profile_id, np.asarray(profile.embedding, dtype=np.float32), np.asarray(profile.landmarks, dtype=np.int16),
+                          normalize_shapes(np.asarray(profile.landmarks)), np.zeros(len(ARTIFACT_FIELDS), dtype=np.float32), profile.description)
+        other._map_ids(profile_id, other.rows - 1)
+    store.delete_many(ids[5:12])
+    store.refresh()
+    assert store.rows_after(None, 5).tolist() == [0, 1, 2, 3, 4]
+    assert store.ids[store.rows_after(4, 3)].tolist() == [12, 13, 14]
+    assert store.ids[store.rows_after(28)].tolist() == [29, 30, 31]
+    assert store.ids[store.rows_after(29, 1)].tolist() == [30]
+    assert store.rows_after(31, 10).size == 0
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from scipy.spatial import procrustes
+
+from search import FEATURE_SLICES, normalize_shapes, procrustes_disparities
+
+def scipy_disparities(landmarks, candidates, feature_slice):
+    return np.array([procrustes(landmarks[feature_slice].astype(np.float64), candidate[feature_slice].astype(np.float64))[2]
+                     for candidate in candidates])
+
+@pytest.mark.parametrize("feature", ["left_eye", "nose", "mouth", "jaw"])
+def test_disparities_match_scipy(feature):
+    rng = np.random.default_rng(11)
+    feature_slice = FEATURE_SLICES[feature]
+    landmarks = rng.uniform(100, 400, size=(68, 2))
+    candidates = np.concatenate([
+        rng.uniform(100, 400, size=(20, 68, 2)),
+        # the same shape moved, rotated, scaled and jittered, which procrustes should see as close
+        [3.5 * (landmarks + rng.normal(scale=2, size=(68, 2))) @ np.array([[0.6, -0.8], [0.8, 0.6]]) + 40],
+        # mirror images, which procrustes aligns by a reflection
+        landmarks[None] * np.array([-1, 1]),
+        rng.uniform(100, 400, size=(3, 68, 2)) * np.array([1, -1]),
+        # every point on one line
+        np.stack([np.linspace(0, 50, 68), 2 * np.linspace(0, 50, 68) + 3], axis=-1)[None]
+    ])
+    distances = procrustes_disparities(normalize_shapes(landmarks)[feature_slice], normalize_shapes(candidates)[:, feature_slice])
+    assert np.allclose(distances, scipy_disparities(landmarks, candidates, feature_slice), atol=1e-5)
+    assert distances[21] < 1e-6
+
+def test_degenerate_shapes():
+    # scipy refuses a shape whose points all coincide; the batched version scores it as the worst match instead
+    rng = np.random.default_rng(12)
+    feature_slice = FEATURE_SLICES["right_eye"]
+    landmarks = rng.uniform(100, 400, size=(68, 2))
+    candidates = rng.uniform(100, 400, size=(4, 68, 2))
+    candidates[2] = 250
+    with pytest.raises(ValueError):
+        procrustes(landmarks[feature_slice], candidates[2, feature_slice])
+    distances = procrustes_disparities(normalize_shapes(landmarks)[feature_slice], normalize_shapes(candidates)[:, feature_slice])
+    assert distances[2] == 1
+    others = [0, 1, 3]
+    assert np.allclose(distances[others], scipy_disparities(landmarks, candidates[others], feature_slice), atol=1e-5)
+    assert np.all(procrustes_disparities(normalize_shapes(candidates[2])[feature_slice], normalize_shapes(candidates)[:, feature_slice]) == 1)
@@ -0,0 +1,31 @@
+import numpy as np
+
+from storage import ProfileStore
+
+def test_rows_after_pages_through_live_ids(make_profiles):
+    store = ProfileStore(compact_min_dead=10 ** 6)
+    for profile in make_profiles(300):
+        store.add(profile)
+    rng = np.random.default_rng(1)
+    store.delete_many([int(profile_id) for profile_id in rng.choice(store.ids, 200, replace=False)])
+    store.delete_many([int(profile_id) for profile_id in store.ids[100:150]])
+    live_ids = store.ids[store.live_rows()]
+    pages, cursor = [], None
+    while True:
+        rows = store.rows_after(cursor, 7)
+        if rows.size == 0:
+            break
+        pages.append(store.ids[rows])
+        cursor = int(store.ids[rows[-1]])
+    assert np.array_equal(np.concatenate(pages), live_ids)
+    # compaction renumbers the rows but keeps them in id order
+    store.compact()
+    assert np.array_equal(store.ids[store.rows_after(int(live_ids[10]))], live_ids[11:])
+
+def test_rows_after_on_a_shard(make_profiles):
+    store = ProfileStore(id_offset=2, id_stride=3)
+    for profile in make_profiles(10):
+        store.add(profile)
+    store.delete(8)
+    assert store.ids[store.rows_after(3, 3)].tolist() == [5, 11, 14]
+    assert store.ids[store.rows_after(None, 2)].tolist() == [2, 5]
@@ -0,0 +1,9 @@
+from .tracker import Track, FaceTracker, head_pose, landmark_box, box_iou
+
+__all__ = [
+    'Track',
+    'FaceTracker',
+    'head_pose',
+    'landmark_box',
+    'box_iou'
+]
@@ -0,0 +1,194 @@
+import cv2
+import numpy as np
+from imutils import face_utils
+
+from detectors import measure_face_artifacts
+from metrics import stage
+from utils import detect_faces, get_model, get_face_embedding
+
+def landmark_box(landmarks):
+    # (left, top, right, bottom) around a set of landmarks
+    left, top = landmarks.min(axis=0)
+    right, bottom = landmarks.max(axis=0)
+    return int(left), int(top), int(right), int(bottom)
+
+def box_iou(box1, box2):
+    width = min(box1[2], box2[2]) - max(box1[0], box2[0])
+    height = min(box1[3], box2[3]) - max(box1[1], box2[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
+    return intersection / (area1 + area2 - intersection)
+
+def head_pose(landmarks):
+    """
+    Rough yaw and pitch of a face from its landmarks: offset of the nose tip from the point between
+    the eyes, in units of the eye distance. Only meant to notice that a head turned.
+    """
+    left_eye = landmarks[36:42].mean(axis=0)
+    right_eye = landmarks[42:48].mean(axis=0)
+    eye_distance = max(np.linalg.norm(right_eye - left_eye), 1.0)
+    offset = (landmarks[30] - (left_eye + right_eye) / 2) / eye_distance
+    return offset
+
+class Track:
+    """
+    One face followed across the frames of a video: its latest landmarks, its artifact measurements
+    in every frame, the descriptors computed for it, and the sharpest frame seen, kept for the description.
+    """
+    def __init__(self, track_id, frame):
+        self.track_id = track_id
+        self.first_frame = frame
+        self.last_frame = frame
+        self.frames = 0
+        self.keyframes = 0
+        self.landmarks = None
+        self.artifacts = []
+        self.embeddings = []
+        self.landmark_motion = []
+        self.best_quality = -1.0
+        self.best_image = None
+        self.best_landmarks = None
+        self._descriptor_pose = None
+        self._descriptor_quality = None
+
+    @property
+    def box(self):
+        return landmark_box(self.landmarks)
+
+    def needs_descriptor(self, pose, quality, pose_delta, quality_gain):
+        if self._descriptor_pose is None:
+            return True
+        if np.max(np.abs(pose - self._descriptor_pose)) > pose_delta:
+            return True
+        return quality > quality_gain * max(self._descriptor_quality, 1e-6)
+
+class FaceTracker:
+    """
+    Follows every face through a sequence of frames while running the HOG detector only on keyframes.
+
+    On a keyframe (every keyframe_interval frames, or as soon as a track is lost or nothing is tracked) faces are
+    detected and matched to the current tracks by box overlap; unmatched detections start new tracks and unmatched
+    tracks end. In between, the shape predictor of each track is seeded with the box around its landmarks in
+    the previous frame, which costs a fraction of a detection. A track whose new landmarks jump or change size
+    too much is considered lost and ends.
+
+    Artifacts are measured on every frame of a track. Descriptors, the most expensive step, are only computed
+    when the track's head pose or sharpness changed enough since its last descriptor.
+    """
+    def __init__(self, keyframe_interval=15, pose_delta=0.15, quality_gain=1.5, margin=0.25, size=256, min_iou=0.3):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.pose_delta = pose_delta
+        self.quality_gain = quality_gain
+        self.margin = margin
+        self.size = size
+        self.min_iou = min_iou
+        self.active = []
+        self.finished = []
+        self.frames = 0
+        self.keyframes = 0
+        self._next_track = 0
+        self._since_keyframe = 0
+        self._lost = False
+
+    def update(self, frame, image):
+        """
+        Process the next frame of the sequence; frame is its index in the video.
+        """
+        with stage("detect"):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        predictor = get_model('predictor')
+        keyframe = not self.active or self._lost or self._since_keyframe >= self.keyframe_interval
+        if keyframe:
+            observations = self._detect(frame, gray, predictor)
+            self.keyframes += 1
+            self._since_keyframe = 0
+            self._lost = False
+        else:
+            observations = self._track(gray, predictor)
+        self._since_keyframe += 1
+        self.frames += 1
+        for track, shape in observations:
+            self._observe(track, frame, image, gray, shape, keyframe)
+
+    def finish(self):
+        # every track seen so far, ordered by first appearance
+        tracks = self.finished + self.active
+        self.finished, self.active = [], []
+        return sorted(tracks, key=lambda track: track.track_id)
+
+    def _detect(self, frame, gray, predictor):
+        with stage("detect"):
+            rects, _ = detect_faces(gray, all_faces=True)
+        with stage("landmarks"):
+            shapes = [predictor(gray, rect) for rect in rects]
+        boxes = [(rect.left(), rect.top(), rect.right(), rect.bottom()) for rect in rects]
+        # greedy matching, most overlapping pairs first
+        pairs = sorted(((box_iou(track.box, box), t, d) for t, track in enumerate(self.active) for d, box in enumerate(boxes)), reverse=True)
+        matched_tracks, matched_detections, observations = set(), set(), []
+        for iou, t, d in pairs:
+            if iou < self.min_iou:
+                break
+            if t not in matched_tracks and d not in matched_detections:
+                matched_tracks.add(t)
+                matched_detections.add(d)
+                observations.append((self.active[t], shapes[d]))
+        self.finished += [track for t, track in enumerate(self.active) if t not in matched_tracks]
+        self.active = [track for t, track in enumerate(self.active) if t in matched_tracks]
+        for d, shape in enumerate(shapes):
+            if d not in matched_detections:
+                track = Track(self._next_track, frame)
+                self._next_track += 1
+                self.active.append(track)
+                observations.append((track, shape))
+        return observations
+
+    def _track(self, gray, predictor):
+        import dlib
+        observations, kept = [], []
+        with stage("landmarks"):
+            for track in self.active:
+                left, top, right, bottom = track.box
+                shape = predictor(gray, dlib.rectangle(left, top, right, bottom))
+                if self._moved_too_much(track.box, landmark_box(face_utils.shape_to_np(shape))):
+                    self.finished.append(track)
+                    self._lost = True
+                else:
+                    kept.append(track)
+                    observations.append((track, shape))
+        self.active = kept
+        return observations
+
+    @staticmethod
+    def _moved_too_much(previous, box):
+        # the predictor always returns a shape, so a face that left or was occluded shows up as a jump or a collapse
+        size = max(previous[2] - previous[0], previous[3] - previous[1], 1)
+        new_size = max(box[2] - box[0], box[3] - box[1], 1)
+        shift = np.hypot((box[0] + box[2] - previous[0] - previous[2]) / 2, (box[1] + box[3] - previous[1] - previous[3]) / 2)
+        return not 0.7 < new_size / size < 1.4 or shift > 0.5 * size
+
+    def _observe(self, track, frame, image, gray, shape, keyframe):
+        landmarks = face_utils.shape_to_np(shape)
+        if track.landmarks is not None:
+            size = max(track.box[2] - track.box[0], 1)
+            track.landmark_motion.append(float(np.mean(np.linalg.norm(landmarks - track.landmarks, axis=1)) / size))
+        track.landmarks = landmarks
+        track.last_frame = frame
+        track.frames += 1
+        track.keyframes += int(keyframe)
+        with stage("artifacts"):
+            artifacts = measure_face_artifacts(gray, landmarks, margin=self.margin, size=self.size)
+        track.artifacts.append(artifacts)
+        quality = artifacts["blur_measure"]
+        pose = head_pose(landmarks)
+        if track.needs_descriptor(pose, quality, self.pose_delta, self.quality_gain):
+            with stage("embedding"):
+                track.embeddings.append(get_face_embedding(image, shape))
+            track._descriptor_pose = pose
+            track._descriptor_quality = quality
+        if quality > track.best_quality:
+            track.best_quality = quality
+            track.best_image = image
+            track.best_landmarks = landmarks
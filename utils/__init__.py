@@ -1,16 +1,34 @@
-from .landmarks import get_landmarks, draw_landmarks, extract_shapes
-from .preprocess import get_image
-from .recognition import get_face_embeddings, compare_faces
+from .landmarks import detect_faces, draw_landmarks, extract_shapes
+from .preprocess import get_image, decode_image, ImageDecodeError, ImageTooLarge
+from .recognition import get_face_embedding, get_face_embeddings_batch, compare_faces
 from .distance import hausdorff_distance, procrustes_analysis, dtw_distance
+from .analysis import FaceAnalysis, analyze_face, analyze_faces, compute_embeddings
+from .archive import iter_archive_images, count_archive_images
+from .video import iter_video_frames, video_fps
+from .registry import get_model, warm_up
 
 __all__ = [
-    'get_landmarks',
+    'detect_faces',
     'get_image',
+    'decode_image',
+    'ImageDecodeError',
+    'ImageTooLarge',
     'draw_landmarks',
-    'get_face_embeddings',
+    'get_face_embedding',
+    'get_face_embeddings_batch',
     'compare_faces',
     'hausdorff_distance',
     'procrustes_analysis',
     'dtw_distance',
-    'extract_shapes'
+    'extract_shapes',
+    'FaceAnalysis',
+    'analyze_face',
+    'analyze_faces',
+    'compute_embeddings',
+    'iter_archive_images',
+    'count_archive_images',
+    'iter_video_frames',
+    'video_fps',
+    'get_model',
+    'warm_up'
 ]
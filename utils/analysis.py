@@ -0,0 +1,61 @@
+import cv2
+from imutils import face_utils
+
+from metrics import stage
+from .landmarks import detect_faces
+from .registry import get_model
+from .recognition import get_face_embedding, get_face_embeddings_batch
+
+class FaceAnalysis:
+    """
+    Everything derived from one face in one image.
+    Built once per uploaded image so that color conversion, face detection
+    and landmark prediction each run exactly once, and then shared by the
+    embedding, artifact, description and distance code.
+    """
+    def __init__(self, image, gray, rect, shape, detection=None):
+        self.image = image
+        self.gray = gray
+        self.rect = rect
+        self.shape = shape
+        # which detect_faces path found the face
+        self.detection = detection
+        self.landmarks = face_utils.shape_to_np(shape)
+        self._embedding = None
+
+    @property
+    def embedding(self):
+        # the ResNet descriptor is the most expensive step, so only compute it on first use
+        if self._embedding is None:
+            with stage("embedding"):
+                self._embedding = get_face_embedding(self.image, self.shape)
+        return self._embedding
+
+def analyze_face(image):
+    with stage("detect"):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        rects, path = detect_faces(gray)
+    for rect in rects:
+        with stage("landmarks"):
+            shape = get_model('predictor')(gray, rect)
+        return FaceAnalysis(image, gray, rect, shape, path)
+    return None
+
+def analyze_faces(image):
+    # one detection pass over the image, then landmarks for every face found
+    with stage("detect"):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        rects, path = detect_faces(gray, all_faces=True)
+    predictor = get_model('predictor')
+    with stage("landmarks"):
+        return [FaceAnalysis(image, gray, rect, predictor(gray, rect), path) for rect in rects]
+
+def compute_embeddings(analyses):
+    # fill in the descriptors of all faces of one image with a single batched model call
+    missing = [analysis for analysis in analyses if analysis._embedding is None]
+    if missing:
+        with stage("embedding"):
+            embeddings = get_face_embeddings_batch(missing[0].image, [analysis.shape for analysis in missing])
+        for analysis, embedding in zip(missing, embeddings):
+            analysis._embedding = embedding
+    return [analysis.embedding for analysis in analyses]
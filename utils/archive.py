@@ -0,0 +1,39 @@
+import os
+import tarfile
+import zipfile
+
+def iter_archive_images(fileobj):
+    """
+    Yield (name, bytes) for every regular file in a zip or tar archive, one member at a time,
+    so only the member being read is held in memory. fileobj must be seekable for zip archives.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and not _is_hidden(info.filename):
+                    yield info.filename, archive.read(info)
+    else:
+        fileobj.seek(0)
+        # "r|*" reads the tar as a stream, compressed or not, without seeking back
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if member.isfile() and not _is_hidden(member.name):
+                    yield member.name, archive.extractfile(member).read()
+
+def count_archive_images(fileobj):
+    """
+    The number of members iter_archive_images yields for the same archive. Zip members are not read;
+    a tar is read through once, since it has no index.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            return sum(1 for info in archive.infolist() if not info.is_dir() and not _is_hidden(info.filename))
+    fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        return sum(1 for member in archive if member.isfile() and not _is_hidden(member.name))
+
+def _is_hidden(name):
+    # skip metadata such as __MACOSX/ folders and ._ resource forks added by archivers
+    return any(part.startswith(".") or part == "__MACOSX" for part in name.split("/")) or os.path.basename(name) == ""
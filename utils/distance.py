@@ -1,14 +1,16 @@
-from scipy.spatial import procrustes
-from scipy.spatial.distance import euclidean, directed_hausdorff
-from fastdtw import fastdtw
+from search.dtw import dtw_distances
+
+# scipy is imported on first use, so importing utils stays fast
 
 def hausdorff_distance(shape1, shape2):
+    from scipy.spatial.distance import directed_hausdorff
     return max(directed_hausdorff(shape1, shape2)[0], directed_hausdorff(shape2, shape1)[0])
 
 def procrustes_analysis(shape1, shape2):
+    from scipy.spatial import procrustes
     mtx1, mtx2, disparity = procrustes(shape1, shape2)
     return disparity
 
-def dtw_distance(shape1, shape2):
-    distance, path = fastdtw(shape1, shape2, dist=euclidean)
-    return distance
+def dtw_distance(shape1, shape2, band=None):
+    # exact DTW, the same engine the closest-feature search uses
+    return float(dtw_distances(shape1, [shape2], band)[0])
@@ -1,18 +1,37 @@
 import cv2
-import dlib
-from imutils import face_utils
 
-detector = dlib.get_frontal_face_detector()
-predictor = dlib.shape_predictor("shape_predictor_68_face_landmarks.dat")
+from config import settings
+from .registry import get_model
 
-def get_landmarks(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    rects = detector(gray, 1)
-    for rect in rects:
-        shape = predictor(gray, rect)
-        shape = face_utils.shape_to_np(shape)
-        return shape
-    return None
+def detect_faces(gray, mode=None, max_size=None, all_faces=False):
+    """
+    Detect faces and return their rectangles in full-resolution coordinates, with the detection path taken.
+
+    "full" runs the HOG detector on the whole image upsampled once. "cascade" runs it on a copy whose longer
+    edge is at most max_size pixels and maps the rectangles back ("downscaled"); only when that finds nothing does it
+    retry on the copy upsampled once ("upsampled"). With all_faces, for callers that want every face rather than one,
+    the upsampled pass runs straight away, so small faces next to a large one are not missed. An image that already fits
+    in max_size is detected on upsampled once, as in "full" mode ("unscaled"). Landmarks and descriptors are then
+    computed on the full-resolution image, where dlib only reads the pixels around each rectangle.
+    """
+    mode = mode or settings.detection_mode
+    detector = get_model('detector')
+    if mode == "full":
+        return detector(gray, 1), "full"
+    if mode != "cascade":
+        raise ValueError(f"Unknown detection mode: {mode}")
+    height, width = gray.shape[:2]
+    scale = min(1.0, (max_size or settings.detection_max_size) / max(height, width))
+    if scale == 1:
+        return detector(gray, 1), "unscaled"
+    small = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    for upsample, path in ((1, "upsampled"),) if all_faces else ((0, "downscaled"), (1, "upsampled")):
+        rects = detector(small, upsample)
+        if len(rects) > 0:
+            break
+    import dlib
+    rects = dlib.rectangles([dlib.rectangle(round(rect.left() / scale), round(rect.top() / scale), round(rect.right() / scale), round(rect.bottom() / scale)) for rect in rects])
+    return rects, path
 
 def draw_landmarks(image, landmarks):
     height, width = image.shape[:2]
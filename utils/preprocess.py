@@ -3,8 +3,55 @@ from PIL import Image
 import numpy as np
 import cv2
 
+class ImageDecodeError(ValueError):
+    pass
+
+class ImageTooLarge(ImageDecodeError):
+    pass
+
+# OpenCV can decode JPEGs directly at 1/2, 1/4 or 1/8 of their size, skipping most of the IDCT work
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+def image_size(data):
+    # width and height from the image header, without decoding any pixels
+    try:
+        with Image.open(BytesIO(data)) as img:
+            return img.size
+    except Image.DecompressionBombError:
+        return (Image.MAX_IMAGE_PIXELS, Image.MAX_IMAGE_PIXELS)
+    except (OSError, ValueError):
+        return None
+
+def decode_image(data, max_size=None, max_pixels=None):
+    """
+    Decode uploaded bytes into a BGR uint8 image.
+    Decoding works on a view of the bytes, and grayscale, palette, RGBA and 16-bit images all come out
+    as 3-channel BGR, rotated according to their EXIF orientation.
+
+    Args:
+        data (bytes): _The encoded image._
+        max_size (int, optional): _Decode at 1/2, 1/4 or 1/8 resolution when the longer edge stays at least this long._ Defaults to None.
+        max_pixels (int, optional): _Refuse images with more pixels than this before decoding them._ Defaults to None.
+
+    Raises:
+        ImageTooLarge: _If the image has more than max_pixels pixels._
+        ImageDecodeError: _If the bytes are not an image._
+    """
+    size = image_size(data)
+    if max_pixels and size is not None and size[0] * size[1] > max_pixels:
+        raise ImageTooLarge(f"Image has more than {max_pixels} pixels")
+    flags = cv2.IMREAD_COLOR
+    if max_size and size is not None:
+        for factor in (8, 4, 2):
+            if max(size) // factor >= max_size:
+                flags = REDUCED_FLAGS[factor]
+                break
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if img is None:
+        raise ImageDecodeError("Could not decode image")
+    if max_pixels and img.shape[0] * img.shape[1] > max_pixels:
+        raise ImageTooLarge(f"Image has more than {max_pixels} pixels")
+    return img
+
 async def get_image(file): 
-    img = Image.open(BytesIO(await file.read()))
-    img = np.array(img)
-    img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-    return img
\ No newline at end of file
+    return decode_image(await file.read())
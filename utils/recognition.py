@@ -1,27 +1,19 @@
-import cv2
-import dlib
 import numpy as np
-from imutils import face_utils
-
-# Initialize dlib's face detector, shape predictor, and face recognition model
-detector = dlib.get_frontal_face_detector()
-predictor = dlib.shape_predictor("shape_predictor_68_face_landmarks.dat")
-face_rec_model = dlib.face_recognition_model_v1("dlib_face_recognition_resnet_model_v1.dat")
-
-def get_face_embeddings(image):
-    # Convert the image to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    # Detect faces in the grayscale image
-    rects = detector(gray, 1)
-    embeddings = []
-    for rect in rects:
-        # Get the landmarks/parts for the face in box
-        shape = predictor(gray, rect)
-        #shape = face_utils.shape_to_np(shape)
-        # Get the face descriptor
-        face_descriptor = face_rec_model.compute_face_descriptor(image, shape)
-        embeddings.append(np.array(face_descriptor))
-    return embeddings
+
+# dlib's face detector, shape predictor, and face recognition model are loaded once per process by the registry
+from .registry import get_model
+
+def get_face_embedding(image, shape):
+    # Compute the descriptor for a face whose landmarks were already predicted
+    return np.array(get_model('face_recognizer').compute_face_descriptor(image, shape))
+
+def get_face_embeddings_batch(image, shapes):
+    # Compute the descriptors of several faces in the same image with one batched call
+    import dlib
+    faces = dlib.full_object_detections()
+    for shape in shapes:
+        faces.append(shape)
+    return [np.array(descriptor) for descriptor in get_model('face_recognizer').compute_face_descriptor(image, faces)]
 
 def compare_faces(embedding1, embedding2, threshold=0.6):
     # Compute the Euclidean distance between the two embeddings
@@ -33,8 +25,8 @@ def compare_faces(embedding1, embedding2, threshold=0.6):
 # image2 = cv2.imread('path_to_image2.jpg')
 
 # # Get face embeddings for each image
-# embeddings1 = get_face_embeddings(image1)
-# embeddings2 = get_face_embeddings(image2)
+# embeddings1 = compute_embeddings(analyze_faces(image1))
+# embeddings2 = compute_embeddings(analyze_faces(image2))
 
 # # Compare the first face found in each image
 # if embeddings1 and embeddings2:
@@ -0,0 +1,43 @@
+import threading
+
+from config import settings
+
+def load_detector():
+    import dlib
+    return dlib.get_frontal_face_detector()
+
+def load_predictor():
+    import dlib
+    return dlib.shape_predictor(settings.predictor_path)
+
+def load_face_recognizer():
+    import dlib
+    return dlib.face_recognition_model_v1(settings.face_recognition_model_path)
+
+MODEL_LOADERS = {
+    'detector': load_detector,
+    'predictor': load_predictor,
+    'face_recognizer': load_face_recognizer
+}
+
+_models = {}
+_lock = threading.Lock()
+
+def get_model(name):
+    """
+    The model registered under name, loaded on first use and then shared by every module of the process.
+    Thread-safe, so a thread pool loads each model once too.
+    """
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                model = _models[name] = MODEL_LOADERS[name]()
+    return model
+
+def warm_up(names=None):
+    # load models ahead of the first request, e.g. when a worker process starts
+    for name in names or MODEL_LOADERS:
+        get_model(name)
+    return sorted(_models)
@@ -0,0 +1,46 @@
+import cv2
+
+from .preprocess import ImageDecodeError
+
+def iter_video_frames(path, stride=1, max_frames=None):
+    """
+    Yield (frame index, BGR image) for every stride-th frame of a video file, decoding one frame at a time.
+    Skipped frames are only grabbed, not decoded.
+
+    Args:
+        path (str): _Video file readable by OpenCV._
+        stride (int, optional): _Keep one frame out of this many._ Defaults to 1.
+        max_frames (int, optional): _Stop after yielding this many frames._ Defaults to None.
+
+    Raises:
+        ImageDecodeError: _If the file is not a video OpenCV can read._
+    """
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ImageDecodeError("Could not decode video")
+        index = 0
+        yielded = 0
+        while max_frames is None or yielded < max_frames:
+            if not capture.grab():
+                break
+            if index % stride == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                yield index, frame
+                yielded += 1
+            index += 1
+        if index == 0:
+            raise ImageDecodeError("Could not decode video")
+    finally:
+        capture.release()
+
+def video_fps(path):
+    # frame rate from the container, None when it does not say
+    capture = cv2.VideoCapture(path)
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        capture.release()
+    return fps if fps and fps > 0 else None